@@ -1,5 +1,7 @@
 # ⭐ LangGraph 定义（新增）
 # agents/execution_graph.py
+from functools import lru_cache
+
 from langgraph.graph import StateGraph, END
 
 from agents.execution_state import ExecutionState
@@ -110,3 +112,9 @@ def build_execution_graph():
     )
 
     return graph.compile()
+
+
+@lru_cache(maxsize=1)
+def get_execution_graph():
+    """The compiled graph, built once per process and shared by every invocation."""
+    return build_execution_graph()
@@ -0,0 +1,271 @@
+"""
+Deterministic planner for routine questions.
+
+Classifies the intent with keyword rules, extracts metric / date / structure
+dimension / filters in the same heuristic style as QueryAgent._heuristic_extract,
+and instantiates the matching `dsl_sequence` template from planning_skills.yaml.
+Returns None when the query is not confidently covered, so PlanningAgent falls
+back to the LLM.
+"""
+import re
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Keyword rules per intent (first match wins within a tie-free query)
+INTENT_KEYWORDS = {
+    "attribution_analysis": ["为什么", "为何", "原因", "归因", "拆解", "驱动", "why"],
+    "trend_analysis": ["趋势", "走势", "变化", "同比", "trend"],
+    "status_check": ["如何", "怎么样", "怎样", "表现", "情况", "多少", "how"],
+}
+
+# Metric keywords -> tool metric (aligned with QueryAgent._heuristic_extract)
+METRIC_KEYWORDS = [
+    (["锁单数", "锁单量", "销量", "锁单", "sales"], "锁单量"),
+    (["交付数", "交付量", "交付"], "交付数"),
+    (["开票金额", "开票额", "营收"], "开票金额"),
+    (["开票数", "开票量", "开票"], "开票量"),
+    (["小订数", "小订量", "意向金", "小订"], "小订数"),
+    # Assign-side (lead) metrics are recognized so they are not read as order counts,
+    # but the order-data templates cannot compute them
+    (["下发线索数", "线索数", "线索", "leads"], "下发线索数"),
+]
+ADDITIVE_METRICS = {"锁单量", "交付数", "开票金额", "开票量", "小订数"}
+_ASSIGN_METRICS = {"下发线索数"}
+
+DIMENSION_KEYWORDS = [
+    (r"(按|分|各).*(大区)", "parent_region_name"),
+    (r"(按|分|各).*(城市)", "store_city"),
+    (r"(按|分|各).*(门店)", "store_name"),
+    (r"(按|分|各).*(渠道)", "first_middle_channel_name"),
+    (r"(按|分|各).*(车型|车型分组|版本)", "series_group"),
+    (r"(按|分|各).*(燃料|动力)", "product_type"),
+]
+
+# Template defaults name metrics descriptively ("锁单数（含有 locktime ...）"); map them to tool metrics
+_DEFAULT_METRIC_NAMES = {"锁单数": "锁单量", "开票量": "开票量"}
+_STRUCTURE_DIMENSION_NAMES = {"品牌": "series", "渠道": "first_middle_channel_name", "车型": "series_group"}
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*([a-z_]+)\s*\}\}")
+
+# Queries the fixed templates cannot express
+_UNSUPPORTED = ["对比", "比较", "vs", "和", "与", "以及", "分别", "预测", "forecast"]
+# Rates, durations and prices; the templates only count (锁单转化率 is not 锁单量)
+_NON_COUNT = ["率", "周期", "时长", "平均", "价格"]
+_SINGLE_DAY_RE = re.compile(r"yesterday|\d{4}-\d{2}-\d{2}")
+
+# Date phrases extract_date understands, and words that carry no slot
+_DATE_WORD_RE = re.compile(
+    r"昨日|昨天|今日|今天|(?:近|最近|过去)\d+(?:天|日|周)|近一周|近两周|近一个?月|上周|本周|本月|这个月|上个?月"
+    r"|\d{4}年\d{1,2}月(?:\d{1,2}日)?|\d{4}-\d{1,2}-\d{1,2}|\d{4}年"
+)
+_DIMENSION_WORD_RE = re.compile(r"(?:按|分|各)(?:大区|城市|门店|渠道|车型分组|车型|版本|燃料|动力)")
+_DIRECTION_WORDS = ["下降", "下滑", "上升", "增长", "波动", "涨", "跌"]
+_FILLER_RE = re.compile(r"[的了吗呢啊呀是有下请看一\s?？!！,，。.、:：]")
+# Confidence lost per character no rule accounts for, capped
+_UNKNOWN_CHAR_PENALTY = 0.05
+_MAX_UNKNOWN_PENALTY = 0.3
+
+
+def _month_bounds(day: datetime.date) -> Tuple[datetime.date, datetime.date]:
+    first = day.replace(day=1)
+    nxt = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first, nxt - datetime.timedelta(days=1)
+
+
+def extract_date(query: str, today: Optional[datetime.date] = None) -> Optional[str]:
+    """DSL date_range for the date phrase in `query`, or None when there is none."""
+    q = re.sub(r"\s+", "", query)
+    today = today or datetime.date.today()
+    if "昨日" in q or "昨天" in q:
+        return "yesterday"
+    if "今日" in q or "今天" in q:
+        return today.strftime("%Y-%m-%d")
+    m = re.search(r"(?:近|最近|过去)(\d+)(天|日|周)", q)
+    if m:
+        n = int(m.group(1))
+        return f"last_{n}_days" if m.group(2) in ("天", "日") else f"last_{n}_weeks"
+    for word, days in (("近一周", 7), ("近两周", 14), ("近一月", 30), ("近一个月", 30)):
+        if word in q:
+            return f"last_{days}_days"
+    if "上周" in q:
+        start = today - datetime.timedelta(days=today.weekday() + 7)
+        return f"{start:%Y-%m-%d}/{start + datetime.timedelta(days=6):%Y-%m-%d}"
+    if "本周" in q:
+        start = today - datetime.timedelta(days=today.weekday())
+        return f"{start:%Y-%m-%d}/{today:%Y-%m-%d}"
+    if "本月" in q or "这个月" in q:
+        return today.strftime("%Y-%m")
+    if "上月" in q or "上个月" in q:
+        return _month_bounds(today.replace(day=1) - datetime.timedelta(days=1))[0].strftime("%Y-%m")
+    m = re.search(r"(\d{4})年(\d{1,2})月(\d{1,2})日", q) or re.search(r"(\d{4})-(\d{1,2})-(\d{1,2})", q)
+    if m:
+        y, mo, d = m.groups()
+        return f"{int(y):04d}-{int(mo):02d}-{int(d):02d}"
+    m = re.search(r"(\d{4})年(\d{1,2})月", q)
+    if m:
+        y, mo = m.groups()
+        return f"{int(y):04d}-{int(mo):02d}"
+    m = re.search(r"(\d{4})年", q)
+    if m:
+        return m.group(1)
+    return None
+
+
+class LocalPlanner:
+    # Plans below this confidence are left to the LLM
+    MIN_CONFIDENCE = 0.8
+
+    def __init__(self, planning_skills: Dict[str, Any], business_def: Optional[Dict[str, Any]] = None):
+        self.skills = planning_skills or {}
+        self.business_def = business_def or {}
+        defaults = (self.skills.get("defaults") or {})
+        sales = (defaults.get("metrics") or {}).get("sales") or {}
+        self.default_metric = self._metric_name(sales.get("primary_metric")) or "锁单量"
+        self.default_secondary = self._metric_name(sales.get("secondary_metric"))
+        dims = (defaults.get("structure_dimensions") or {}).get("sales") or ["series_group"]
+        self.default_dimension = _STRUCTURE_DIMENSION_NAMES.get(dims[0], dims[0])
+
+    @staticmethod
+    def _metric_name(text: Optional[str]) -> Optional[str]:
+        if not text:
+            return None
+        head = re.split(r"[（(]", str(text))[0].strip()
+        return _DEFAULT_METRIC_NAMES.get(head, head) or None
+
+    def classify(self, query: str) -> Tuple[Optional[str], float]:
+        q = query.lower()
+        matched = [i for i, words in INTENT_KEYWORDS.items() if any(k in q for k in words)]
+        if len(matched) == 1:
+            return matched[0], 1.0
+        if not matched:
+            # A bare "<date> <metric>" question is a status check
+            return "status_check", 0.9
+        # Attribution questions usually also ask "how"; the stronger intent wins
+        if "attribution_analysis" in matched:
+            return "attribution_analysis", 0.9
+        return None, 0.0
+
+    def _unknown_chars(self, query: str) -> int:
+        """Characters of `query` that no intent, metric, date, dimension or filter rule accounts for."""
+        rest = _DATE_WORD_RE.sub(" ", query.lower())
+        words = [w for ws in INTENT_KEYWORDS.values() for w in ws]
+        words += [w for ws, _ in METRIC_KEYWORDS for w in ws]
+        words += [m.lower() for m in self.business_def.get("model_series_mapping") or {} if m]
+        words += ["增程", "纯电"] + _DIRECTION_WORDS
+        for word in sorted(words, key=len, reverse=True):
+            rest = rest.replace(word, " ")
+        rest = _DIMENSION_WORD_RE.sub(" ", rest)
+        return len(_FILLER_RE.sub("", rest))
+
+    def extract(self, query: str) -> Dict[str, Any]:
+        q = str(query or "").strip()
+        metrics = []
+        rest = q
+        # Longest keyword first, consumed once matched ("开票金额" is not also "开票")
+        for word, metric in sorted(((w, m) for ws, m in METRIC_KEYWORDS for w in ws), key=lambda x: -len(x[0])):
+            if word in rest:
+                rest = rest.replace(word, " ")
+                if metric not in metrics:
+                    metrics.append(metric)
+        dimensions = [dim for pattern, dim in DIMENSION_KEYWORDS if re.search(pattern, q)]
+
+        filters = []
+        mapping = self.business_def.get("model_series_mapping") or {}
+        models = [m for m in mapping if m and re.search(rf"(?<![A-Za-z0-9]){re.escape(m)}(?![A-Za-z0-9])", q)]
+        if models:
+            filters.append({"field": "series", "op": "in", "value": models})
+        if "增程" in q:
+            filters.append({"field": "product_type", "op": "=", "value": "增程"})
+        elif "纯电" in q:
+            filters.append({"field": "product_type", "op": "=", "value": "纯电"})
+
+        return {
+            "metrics": metrics,
+            "date_range": extract_date(q),
+            "dimensions": dimensions,
+            "filters": filters,
+        }
+
+    def plan(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Plan steps in PlanningAgent's output format, or None when not confident."""
+        q = str(query or "")
+        if any(w in q.lower() for w in _UNSUPPORTED + _NON_COUNT):
+            return None
+        intent, confidence = self.classify(q)
+        if intent is None:
+            return None
+        slots = self.extract(q)
+        # No metric named: the query may be about something the templates do not count
+        if len(slots["metrics"]) != 1 or len(slots["dimensions"]) > 1:
+            return None
+
+        primary = slots["metrics"][0]
+        if primary in _ASSIGN_METRICS:
+            return None
+        # Words outside the rules may change the question (e.g. 活动带来的销量)
+        confidence -= min(_MAX_UNKNOWN_PENALTY, _UNKNOWN_CHAR_PENALTY * self._unknown_chars(q))
+        target_date = slots["date_range"]
+        if intent == "trend_analysis" and target_date and _SINGLE_DAY_RE.fullmatch(target_date):
+            # A one-day window has no trend to scan
+            return None
+        if target_date is None:
+            if intent != "trend_analysis":
+                return None
+            target_date = "last_30_days"
+        secondary = self.default_secondary if primary == self.default_metric else None
+        values = {
+            "primary_metric": primary,
+            "secondary_metric": secondary,
+            "target_date": target_date,
+            "default_structure_dimension": slots["dimensions"][0] if slots["dimensions"] else self.default_dimension,
+        }
+        if round(confidence, 6) < self.MIN_CONFIDENCE:
+            return None
+
+        strategy_name = ((self.skills.get("intents") or {}).get(intent) or {}).get("default_strategy")
+        strategy = (self.skills.get("strategies") or {}).get(strategy_name) or {}
+        steps = []
+        for template in strategy.get("dsl_sequence") or []:
+            when = template.get("when") or {}
+            if when.get("metric_type") == "additive" and primary not in ADDITIVE_METRICS:
+                continue
+            params = self._fill(template.get("parameters") or {}, values)
+            if params is None:
+                # A placeholder this planner cannot resolve (e.g. no secondary metric)
+                return None
+            if intent == "trend_analysis" and params.get("time_grain") == "day":
+                # The trend templates fix their windows; the short-term scan follows the query's
+                params["date_range"] = target_date
+            if slots["filters"]:
+                params["filters"] = slots["filters"]
+            steps.append({
+                "step_id": len(steps) + 1,
+                "action_name": template["id"].replace("_", " ").title(),
+                "tool_name": template.get("tool"),
+                "parameters": params,
+                "reasoning": " ".join(str(template.get("reasoning") or "").split()),
+                "output_key": template["id"],
+            })
+        return steps or None
+
+    def _fill(self, obj: Any, values: Dict[str, Any]) -> Any:
+        if isinstance(obj, dict):
+            out = {}
+            for k, v in obj.items():
+                filled = self._fill(v, values)
+                if filled is None:
+                    return None
+                out[k] = filled
+            return out
+        if isinstance(obj, list):
+            out = [self._fill(v, values) for v in obj]
+            return None if any(v is None for v in out) else out
+        if isinstance(obj, str):
+            names = _PLACEHOLDER_RE.findall(obj)
+            if any(values.get(n) is None for n in names):
+                return None
+            m = _PLACEHOLDER_RE.fullmatch(obj.strip())
+            if m:
+                return values[m.group(1)]
+            return _PLACEHOLDER_RE.sub(lambda mm: str(values[mm.group(1)]), obj)
+        return obj
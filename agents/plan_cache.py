@@ -0,0 +1,141 @@
+"""
+On-disk cache of PlanningAgent plans keyed by query template.
+
+Entries live as one JSON file each under `.cache/plans/`, named by a hash of the
+context-file hash and the slotted query template (see agents/slots.py). A hit
+re-instantiates the cached plan with the new query's slot values; entries expire
+after a TTL and the least recently used ones are evicted past `max_entries`.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import datetime
+from typing import Iterable, Optional
+
+from agents.slots import SlotExtractor, instantiate, parametrize
+
+# Absolute dates left in a plan after slotting come from "today" in the prompt
+_ABS_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+def is_plan(text: str) -> bool:
+    """True when `text` (optionally fenced) is a JSON array of steps, i.e. worth caching."""
+    candidates = [text] + _FENCE_RE.findall(text or "")
+    for c in candidates:
+        try:
+            parsed = json.loads(c)
+        except (TypeError, ValueError):
+            continue
+        return isinstance(parsed, list) and bool(parsed)
+    return False
+
+
+def hash_texts(texts: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for t in texts:
+        h.update((t or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class PlanCache:
+    def __init__(
+        self,
+        directory: str,
+        extractor: SlotExtractor,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 500,
+    ):
+        self.directory = directory
+        self.extractor = extractor
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def _path(self, template: str, context_hash: str) -> str:
+        key = hashlib.sha256(f"{context_hash}\0{template}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, query: str, context_hash: str) -> Optional[str]:
+        """The cached plan instantiated for `query`, or None on a miss."""
+        template, slots = self.extractor.extract(query)
+        path = self._path(template, context_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("template") != template or time.time() - entry.get("created", 0) > self.ttl_seconds:
+            return None
+        valid_on = entry.get("valid_on")
+        if valid_on and valid_on != datetime.date.today().strftime("%Y-%m-%d"):
+            return None
+        values = {s.name: s.value for s in slots}
+        if any(values.get(name) != value for name, value in (entry.get("fixed") or {}).items()):
+            return None
+
+        try:
+            os.utime(path)  # LRU: eviction removes the least recently used files
+        except OSError:
+            pass
+        return instantiate(entry["plan"], slots)
+
+    def put(self, query: str, context_hash: str, plan_text: str) -> None:
+        if not is_plan(plan_text):
+            return
+        template, slots = self.extractor.extract(query)
+        plan_template, fixed = parametrize(plan_text, slots)
+        entry = {
+            "template": template,
+            "plan": plan_template,
+            "fixed": fixed,
+            "created": time.time(),
+            # A plan that still carries absolute dates was resolved against today
+            "valid_on": datetime.date.today().strftime("%Y-%m-%d") if _ABS_DATE_RE.search(plan_template) else None,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(template, context_hash)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        try:
+            files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")]
+        except OSError:
+            return
+        now = time.time()
+        alive = []
+        for path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # mtime tracks the last use; get() still enforces the TTL from creation
+            if now - st.st_mtime > self.ttl_seconds:
+                _remove(path)
+            else:
+                alive.append((st.st_mtime, path))
+        alive.sort()
+        for _, path in alive[: max(0, len(alive) - self.max_entries)]:
+            _remove(path)
+
+    def clear(self) -> None:
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    _remove(os.path.join(self.directory, name))
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,76 +1,25 @@
 import os
 import sys
 import json
-import urllib.request
-import urllib.error
 
-class PlanningAgent:
-    def __init__(self, base_dir=None):
-        if base_dir is None:
-            self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        else:
-            self.base_dir = base_dir
-            
-        self.schema_path = os.path.join(self.base_dir, "world", "schema.md")
-        self.business_def_path = os.path.join(self.base_dir, "world", "business_definition.json")
-        self.tool_path = os.path.join(self.base_dir, "world", "tool.md")
-        self.planning_rules_path = os.path.join(self.base_dir, "agents", "planning_skills.yaml")
-        self.env_path = os.path.join(self.base_dir, ".env")
-        
-        self.api_key = self._load_api_key()
-        self.context = self._load_context()
+try:
+    import yaml
+except ImportError:  # the local planner and plan-cache metric aliases are optional
+    yaml = None
 
-    def _load_api_key(self):
-        if os.path.exists(self.env_path):
-            with open(self.env_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip() and not line.startswith('#'):
-                        if 'deepseek=' in line:
-                            return line.split('=', 1)[1].strip()
-                        if 'deepseek =' in line: # handle potential spaces
-                             return line.split('=', 1)[1].strip()
-        return None
+# Allow running this file directly (python agents/planning_agent.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    def _load_context(self):
-        context = {}
-        with open(self.schema_path, 'r', encoding='utf-8') as f:
-            context['schema'] = f.read()
-        with open(self.business_def_path, 'r', encoding='utf-8') as f:
-            context['business_def'] = f.read()
-        with open(self.tool_path, 'r', encoding='utf-8') as f:
-            context['tools'] = f.read()
-        with open(self.planning_rules_path, 'r', encoding='utf-8') as f:
-            context['planning_rules'] = f.read()
-        return context
+from agents.local_planner import LocalPlanner
+from agents.plan_cache import PlanCache, hash_texts
+from agents.prompt_builder import PromptBuilder, compact_markdown, compact_yaml
+from agents.slots import SlotExtractor
+from runtime.llm_client import LLMError, get_client, offline_api_key
 
-    def generate_plan(self, query):
-        if not self.api_key:
-            return "Error: Deepseek API key not found in .env"
-        
-        import datetime
-        today_str = datetime.date.today().strftime("%Y-%m-%d")
-
-        system_prompt = f"""
-You are a senior Data Analyst Planning Agent. 
+PLANNING_INSTRUCTIONS = """
+You are a senior Data Analyst Planning Agent.
 Your goal is to translate a user's natural language business query into a structured "Evaluation Action Matrix" (DSL), strictly following the defined Planning Rules.
 
-**Current Context:**
-Today's Date: {today_str}
-
-**Context Resources:**
-
-1. **Data Schema (`schema.md`):**
-{self.context['schema']}
-
-2. **Business Definitions (`business_definition.json`):**
-{self.context['business_def']}
-
-3. **Available Tools (`tool.md`):**
-{self.context['tools']}
-
-4. **Planning Rules (`planning_rules.yaml`):**
-{self.context['planning_rules']}
-
 **Task:**
 
 1. **Intent Classification:**
@@ -105,43 +54,152 @@ If User asks: "昨日销量如何"
 And Intent is `status_check` -> Strategy `breadth_scan`
 Then output should follow the `breadth_scan` sequence (Baseline -> Short-term Trend -> Cycle Comparison -> Structural Rollup), with parameters filled in.
 
-**User Query:**
-{query}
+The current date, schema / business-definition excerpts relevant to the query, and the query itself follow in the user message.
 """
+
+class PlanningAgent:
+    def __init__(self, base_dir=None, use_cache=True, use_local=True):
+        if base_dir is None:
+            self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        else:
+            self.base_dir = base_dir
+            
+        self.schema_path = os.path.join(self.base_dir, "world", "schema.md")
+        self.business_def_path = os.path.join(self.base_dir, "world", "business_definition.json")
+        self.tool_path = os.path.join(self.base_dir, "world", "tool.md")
+        self.planning_rules_path = os.path.join(self.base_dir, "agents", "planning_skills.yaml")
+        self.query_skills_path = os.path.join(self.base_dir, "agents", "query_skills.yaml")
+        self.env_path = os.path.join(self.base_dir, ".env")
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+        # Replaying from the response cache needs no key
+        self.api_key = self._load_api_key() or offline_api_key()
+        self.context = self._load_context()
+        # Plans depend on the prompt context; any edit to these files invalidates the cache
+        self.context_hash = hash_texts(self.context[k] for k in ("schema", "business_def", "tools", "planning_rules"))
+        self.query_skills = self._load_query_skills()
+        self.prompt_builder = PromptBuilder(self.context['schema'], self.context['business_def'], self.query_skills)
+        # Compacted once so the system prompt is byte-identical across queries
+        self._static_context = {
+            'tools': compact_markdown(self.context['tools']),
+            'planning_rules': compact_yaml(self.context['planning_rules']),
         }
+        self.last_prompt_stats = {}
+        self.last_usage = {}
+        self.plan_cache = self._build_plan_cache() if use_cache else None
+        self.local_planner = self._build_local_planner() if use_local else None
+
+    def _load_api_key(self):
+        if os.path.exists(self.env_path):
+            with open(self.env_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip() and not line.startswith('#'):
+                        if 'deepseek=' in line:
+                            return line.split('=', 1)[1].strip()
+                        if 'deepseek =' in line: # handle potential spaces
+                             return line.split('=', 1)[1].strip()
+        return None
+
+    def _load_context(self):
+        context = {}
+        with open(self.schema_path, 'r', encoding='utf-8') as f:
+            context['schema'] = f.read()
+        with open(self.business_def_path, 'r', encoding='utf-8') as f:
+            context['business_def'] = f.read()
+        with open(self.tool_path, 'r', encoding='utf-8') as f:
+            context['tools'] = f.read()
+        with open(self.planning_rules_path, 'r', encoding='utf-8') as f:
+            context['planning_rules'] = f.read()
+        return context
+
+    def _business_def(self):
+        try:
+            return json.loads(self.context['business_def'] or "{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _build_local_planner(self):
+        if yaml is None:
+            return None
+        try:
+            planning_skills = yaml.safe_load(self.context['planning_rules']) or {}
+        except yaml.YAMLError:
+            return None
+        return LocalPlanner(planning_skills, self._business_def())
+
+    def _load_query_skills(self):
+        if yaml is None or not os.path.exists(self.query_skills_path):
+            return {}
+        with open(self.query_skills_path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+
+    def _build_plan_cache(self):
+        return PlanCache(
+            os.path.join(self.base_dir, ".cache", "plans"),
+            SlotExtractor.from_context(self._business_def(), self.query_skills),
+        )
+
+    def build_prompt(self, query):
+        """Static instructions, tools and planning rules first (cacheable prefix); date, excerpts and query last."""
+        import datetime
+        today_str = datetime.date.today().strftime("%Y-%m-%d")
+        return PromptBuilder.build(
+            [
+                ("", PLANNING_INSTRUCTIONS),
+                ("Available Tools (`tool.md`)", self._static_context['tools']),
+                ("Planning Rules (`planning_rules.yaml`)", self._static_context['planning_rules']),
+            ],
+            [
+                ("Current Context", f"Today's Date: {today_str}"),
+                ("Data Schema (`schema.md`, excerpt)", self.prompt_builder.schema_excerpt(query)),
+                ("Business Definitions (`business_definition.json`, excerpt)", self.prompt_builder.business_excerpt(query)),
+                ("User Query", query),
+            ],
+        )
+
+    def generate_plan(self, query):
+        self.last_prompt_stats, self.last_usage = {}, {}
+        # Routine questions are instantiated from the yaml strategies without a network call
+        if self.local_planner is not None:
+            steps = self.local_planner.plan(query)
+            if steps is not None:
+                return json.dumps(steps, ensure_ascii=False, indent=2)
+
+        if self.plan_cache is not None:
+            cached = self.plan_cache.get(query, self.context_hash)
+            if cached is not None:
+                return cached
+
+        if not self.api_key:
+            return "Error: Deepseek API key not found in .env"
         
+        prompt = self.build_prompt(query)
+        self.last_prompt_stats = prompt.stats()
+
         data = {
             "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
+            "messages": prompt.messages,
             "temperature": 0.1,
             "max_tokens": 2000
         }
-        
+
         try:
-            req = urllib.request.Request(
-                "https://api.deepseek.com/chat/completions",
-                data=json.dumps(data).encode('utf-8'),
-                headers=headers,
-                method='POST'
-            )
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content']
-        except urllib.error.HTTPError as e:
-             return f"Error calling API: {e.code} - {e.read().decode('utf-8')}"
+            result = get_client().chat_completion(data, self.api_key)
+            plan = result['choices'][0]['message']['content']
+            self.last_usage = result.get('usage') or {}
+        except LLMError as e:
+            return f"Error calling API: {e.status} - {e.body}"
         except Exception as e:
             return f"Error calling API: {str(e)}"
 
+        if self.plan_cache is not None:
+            self.plan_cache.put(query, self.context_hash, plan)
+        return plan
+
 if __name__ == "__main__":
     agent = PlanningAgent()
     query = sys.argv[1] if len(sys.argv) > 1 else "昨日销量如何"
     print(f"Query: {query}\n")
     plan = agent.generate_plan(query)
     print(plan)
+    if agent.last_prompt_stats:
+        print(f"\nPrompt: {agent.last_prompt_stats} Usage: {agent.last_usage}")
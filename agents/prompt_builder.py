@@ -0,0 +1,205 @@
+"""
+Prompt assembly for the LLM-backed agents.
+
+Prompts are laid out prefix-stable: the system message holds only static text
+(role, rules, tool docs, skills) compacted into a byte-stable form, so the
+provider's prefix cache can reuse it across queries. Everything that varies —
+today's date, the query, and relevance-filtered excerpts of schema.md and
+business_definition.json — goes into the user message after it.
+
+Excerpts keep the full description only for the metrics / dimensions / series
+matched in the query; the other catalog entries are listed by name, so the
+model still sees the full vocabulary.
+"""
+import re
+import json
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+_CJK_RE = re.compile(r"[　-〿㐀-鿿＀-￯]")
+_MD_LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_HEADING_RE = re.compile(r"^(#+)\s")
+_BULLET_RE = re.compile(r"^(\s*)- (.*)$")
+# Catalog entries: "- **锁单量**: ..." / "- `store_city`: ..." / "- `门店线索占比` = ..." / "- `门店线索占比` (key: ...)"
+_KEYED_RE = re.compile(
+    r"^(?:\*\*(?P<bold>[^*]+)\*\*\s*[:：]|`(?P<code>[^`]+)`\s*(?=$|[:：=(]))\s*[:：=]?\s*(?P<desc>.*)$"
+)
+_CODE_RE = re.compile(r"`([^`]+)`")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough DeepSeek token count: ~0.6 per CJK character, ~0.3 per other character."""
+    text = text or ""
+    cjk = len(_CJK_RE.findall(text))
+    return int(round(cjk * 0.6 + (len(text) - cjk) * 0.3))
+
+
+def compact_markdown(text: str) -> str:
+    """Drop link targets, trailing spaces and blank lines; keep headings and indentation."""
+    lines = []
+    for line in _MD_LINK_RE.sub(r"\1", text or "").splitlines():
+        line = line.rstrip()
+        if line.strip():
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def compact_json(text_or_obj: Any) -> str:
+    obj = json.loads(text_or_obj) if isinstance(text_or_obj, str) else text_or_obj
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_yaml(text: str) -> str:
+    """Strip comment-only lines and blank lines (values are left untouched)."""
+    lines = []
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if not stripped or (stripped.startswith("#") and not stripped.startswith("#!")):
+            continue
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+@dataclass
+class Prompt:
+    system: str
+    user: str
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": self.system}, {"role": "user", "content": self.user}]
+
+    @property
+    def prefix_hash(self) -> str:
+        """Hash of the static system message; equal across queries when the context files are unchanged."""
+        return hashlib.sha256(self.system.encode("utf-8")).hexdigest()[:16]
+
+    def stats(self) -> Dict[str, Any]:
+        static = estimate_tokens(self.system)
+        dynamic = estimate_tokens(self.user)
+        return {
+            "static_tokens": static,
+            "dynamic_tokens": dynamic,
+            "total_tokens": static + dynamic,
+            "prefix_hash": self.prefix_hash,
+        }
+
+
+def _section(title: str, body: str) -> str:
+    return f"**{title}:**\n{body}" if title else body
+
+
+class PromptBuilder:
+    def __init__(self, schema_md: str, business_def: str, query_skills: Optional[Dict[str, Any]] = None):
+        self.schema_lines = compact_markdown(schema_md).splitlines()
+        try:
+            self.business_def = json.loads(business_def or "{}")
+        except json.JSONDecodeError:
+            self.business_def = {}
+        self.terms = self._build_terms(query_skills or {})
+
+    def _build_terms(self, query_skills: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """(term, key) pairs, longest term first; keys are schema metric / field names."""
+        pairs: Dict[str, str] = {}
+        for metric in query_skills.get("metrics") or []:
+            for term in [metric.get("name")] + list(metric.get("aliases") or []):
+                if term and metric.get("name"):
+                    pairs.setdefault(str(term).lower(), metric["name"])
+        for dim in query_skills.get("dimensions") or []:
+            name = dim.get("name")
+            for term in [name] + list(dim.get("aliases") or []) + [str(v) for v in dim.get("values") or []]:
+                if term and name:
+                    pairs.setdefault(str(term).lower(), name)
+        # One-character aliases (市, 店) match far too much
+        return sorted(((t, k) for t, k in pairs.items() if len(t) >= 2), key=lambda x: -len(x[0]))
+
+    def match_keys(self, text: str) -> Set[str]:
+        q = (text or "").lower()
+        return {key for term, key in self.terms if term in q}
+
+    # ---------- schema.md ----------
+    def _keyed(self, bullet: str) -> Optional[Tuple[str, List[str]]]:
+        """(key, description terms) for a catalog bullet, None for prose bullets."""
+        m = _KEYED_RE.match(bullet.strip())
+        if not m:
+            return None
+        key = (m.group("bold") or m.group("code")).strip()
+        desc = (m.group("desc") or "").strip()
+        head = re.split(r"[\s(（/，,]", desc, maxsplit=1)[0] if desc else ""
+        return key, [t for t in (key, head) if len(t) >= 2]
+
+    def schema_excerpt(self, text: str) -> str:
+        """schema.md with catalog entries not relevant to `text` reduced to their names."""
+        q = (text or "").lower()
+        keys = self.match_keys(text)
+
+        def is_match(bullet: str) -> bool:
+            keyed = self._keyed(bullet)
+            return bool(keyed) and (keyed[0] in keys or any(t.lower() in q for t in keyed[1]))
+
+        # Fields referenced by a matched entry (e.g. 锁单量 -> lock_time) are relevant too
+        for line in self.schema_lines:
+            b = _BULLET_RE.match(line)
+            if b and is_match(b.group(2)):
+                keys.update(_CODE_RE.findall(b.group(2)))
+
+        out: List[str] = []
+        skipped: List[str] = []
+        skip_indent: Optional[int] = None
+
+        def flush() -> None:
+            if skipped:
+                out.append("- 其他: " + ", ".join(f"`{k}`" for k in skipped))
+                skipped.clear()
+
+        for line in self.schema_lines:
+            if _HEADING_RE.match(line):
+                flush()
+                skip_indent = None
+                out.append(line)
+                continue
+            b = _BULLET_RE.match(line)
+            indent = len(b.group(1)) if b else len(line) - len(line.lstrip())
+            if skip_indent is not None:
+                if indent > skip_indent:
+                    continue
+                skip_indent = None
+            if b:
+                keyed = self._keyed(b.group(2))
+                if keyed and not is_match(b.group(2)):
+                    if keyed[0] not in skipped:
+                        skipped.append(keyed[0])
+                    skip_indent = indent
+                    continue
+            out.append(line)
+        flush()
+        return "\n".join(out)
+
+    # ---------- business_definition.json ----------
+    def business_excerpt(self, text: str) -> str:
+        """business_definition.json narrowed to the series / groups named in `text` (compact JSON)."""
+        q = (text or "").lower()
+        mapping = self.business_def.get("model_series_mapping") or {}
+        named = {k for section in self.business_def.values() if isinstance(section, dict) for k in section if k.lower() in q}
+        # A model name (LS6) also selects its series groups (CM0/CM1/CM2)
+        for model in list(named):
+            named.update(mapping.get(model) or [])
+        out = {}
+        for name, section in self.business_def.items():
+            if isinstance(section, dict) and named & set(section):
+                out[name] = {k: v for k, v in section.items() if k in named}
+            else:
+                out[name] = section
+        return compact_json(out)
+
+    # ---------- assembly ----------
+    @staticmethod
+    def build(static_sections: Iterable[Tuple[str, str]], dynamic_sections: Iterable[Tuple[str, str]]) -> Prompt:
+        """
+        `static_sections` must not depend on the query or the date; they form the
+        cached prefix. `dynamic_sections` follow in the user message.
+        """
+        system = "\n\n".join(_section(t, b.strip()) for t, b in static_sections if b and b.strip())
+        user = "\n\n".join(_section(t, b.strip()) for t, b in dynamic_sections if b and b.strip())
+        return Prompt(system=system, user=user)
@@ -1,12 +1,18 @@
 import os
 import json
-import urllib.request
-import urllib.error
 import datetime
-import re
+
+try:
+    import yaml
+except ImportError:  # aliases only sharpen the prompt excerpts
+    yaml = None
+
+from agents.prompt_builder import PromptBuilder, compact_yaml
+from agents.query_matcher import QueryMatcher
 from tools.query import QueryTool
 from tools.rollup import RollupTool
 from tools.decompose import CompositionTool
+from runtime.llm_client import LLMError, get_client, offline_api_key
 
 class QueryAgent:
     def __init__(self, base_dir=None):
@@ -20,8 +26,16 @@ class QueryAgent:
         self.query_skills_path = os.path.join(self.base_dir, "agents", "query_skills.yaml")
         self.env_path = os.path.join(self.base_dir, ".env")
         
-        self.api_key = self._load_api_key()
+        # Replaying from the response cache needs no key
+        self.api_key = self._load_api_key() or offline_api_key()
         self.context = self._load_context()
+        query_skills = {}
+        if yaml is not None and self.context['query_skills']:
+            query_skills = yaml.safe_load(self.context['query_skills']) or {}
+        self.prompt_builder = PromptBuilder(self.context['schema'], self.context['business_def'], query_skills)
+        # Built once: all heuristic keywords in one automaton, business definition parsed once
+        self.matcher = QueryMatcher(self.prompt_builder.business_def, query_skills)
+        self.last_prompt_stats = {}
 
     def _load_api_key(self):
         if os.path.exists(self.env_path):
@@ -51,11 +65,6 @@ class QueryAgent:
         if not self.api_key:
             return "Error: Deepseek API key not found."
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "model": "deepseek-chat",
             "messages": [
@@ -67,23 +76,14 @@ class QueryAgent:
         }
         
         try:
-            req = urllib.request.Request(
-                "https://api.deepseek.com/chat/completions",
-                data=json.dumps(data).encode('utf-8'),
-                headers=headers,
-                method='POST'
-            )
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content']
-        except urllib.error.HTTPError as e:
-            return f"Error calling API: {e.code} - {e.read().decode('utf-8')}"
+            result = get_client().chat_completion(data, self.api_key)
+            return result['choices'][0]['message']['content']
+        except LLMError as e:
+            return f"Error calling API: {e.status} - {e.body}"
         except Exception as e:
             return f"Error calling API: {str(e)}"
 
-    def run(self, query):
-        print(f"🤖 QueryAgent received: {query}")
-
+    def _build_prompt(self, query):
         today = datetime.date.today().strftime("%Y-%m-%d")
         
         # Construct prompt using query_skills.yaml if available, else fallback to hardcoded
@@ -94,13 +94,6 @@ class QueryAgent:
 You are a Data Query Assistant. Your ONLY goal is to convert natural language into a tool call JSON for data querying.
 You are NOT an analyst. You do NOT answer questions directly. You ONLY output JSON (no markdown).
 
-**Context:**
-- Today's date: {today}
-- Schema:
-{self.context['schema']}
-- Business Definitions:
-{self.context['business_def']}
-
 **Output JSON Format (always):**
 {{
   "tool": "query_or_rollup_or_composition",
@@ -115,20 +108,13 @@ You are NOT an analyst. You do NOT answer questions directly. You ONLY output JS
 }}
 
 **Skills & Rules:**
-{skills_content}
+{compact_yaml(skills_content)}
 """
         else:
             system_prompt = f"""
 You are a Data Query Assistant. Your ONLY goal is to convert natural language into a tool call JSON for data querying.
 You are NOT an analyst. You do NOT answer questions directly. You ONLY output JSON (no markdown).
 
-**Context:**
-- Today's date: {today}
-- Schema:
-{self.context['schema']}
-- Business Definitions:
-{self.context['business_def']}
-
 **Output JSON Format (always):**
 {{
   "tool": "query_or_rollup_or_composition",
@@ -191,10 +177,27 @@ User: "2025年12月车型为 CM2 增程的锁单量?"
 {{"tool":"query","parameters":{{"metric":"锁单量","date_range":"2025-12","filters":[{{"field":"series_group","op":"=","value":"CM2"}},{{"field":"product_type","op":"=","value":"增程"}}]}}}}
 """
 
+        # Static instructions first (cacheable prefix); date and query-specific excerpts last
+        return PromptBuilder.build(
+            [("", system_prompt)],
+            [
+                ("Context", f"- Today's date: {today}"),
+                ("Schema (excerpt)", self.prompt_builder.schema_excerpt(query)),
+                ("Business Definitions (excerpt)", self.prompt_builder.business_excerpt(query)),
+                ("User Query", query),
+            ],
+        )
+
+    def run(self, query):
+        print(f"🤖 QueryAgent received: {query}")
+
         if not self.api_key:
             extracted = self._heuristic_extract(query)
         else:
-            llm_response = self._call_llm(system_prompt, query)
+            # The prompt (schema / business excerpts) is only built when it is sent
+            prompt = self._build_prompt(query)
+            self.last_prompt_stats = prompt.stats()
+            llm_response = self._call_llm(prompt.system, prompt.user)
             if isinstance(llm_response, str) and llm_response.startswith("Error"):
                 extracted = self._heuristic_extract(query)
             else:
@@ -278,150 +281,5 @@ User: "2025年12月车型为 CM2 增程的锁单量?"
             return f"❌ Query Execution Failed: {str(e)}"
 
     def _heuristic_extract(self, query: str) -> dict:
-        q = str(query or "").strip()
-        q_no_space = re.sub(r"\s+", "", q)
-
-        metric = None
-        if any(k in q for k in ["锁单数", "锁单量", "销量"]):
-            metric = "锁单量"
-        elif any(k in q for k in ["交付数", "交付量"]):
-            metric = "交付数"
-        elif any(k in q for k in ["开票金额"]):
-            metric = "开票金额"
-        elif any(k in q for k in ["开票数", "开票量"]):
-            metric = "开票量"
-        elif any(k in q for k in ["小订数", "小订量", "意向金"]):
-            metric = "小订数"
-        elif any(k in q for k in ["平均年龄", "年龄", "岁"]):
-            metric = "age"
-        elif any(k in q for k in ["下发线索数", "线索数", "线索", "leads"]):
-            metric = "下发线索数"
-        else:
-            metric = "锁单量"
-
-        date_range = "yesterday"
-        if "昨日" in q or "昨天" in q:
-            date_range = "yesterday"
-        elif "近两周" in q:
-             date_range = "last_14_days"
-        elif "近一周" in q:
-             date_range = "last_7_days"
-        elif "近一月" in q or "近一个月" in q:
-             date_range = "last_30_days"
-        elif re.search(r"近(\d+)天", q):
-             m = re.search(r"近(\d+)天", q)
-             date_range = f"last_{m.group(1)}_days"
-        elif re.search(r"近(\d+)周", q):
-             m = re.search(r"近(\d+)周", q)
-             days = int(m.group(1)) * 7
-             date_range = f"last_{days}_days"
-        elif re.search(r"近(\d+)月", q):
-             m = re.search(r"近(\d+)月", q)
-             days = int(m.group(1)) * 30
-             date_range = f"last_{days}_days"
-        elif "至今" in q or "since" in q:
-            # Handle "YYYY年MM月DD日至今"
-            m_day = re.search(r"(\d{4})年(\d{1,2})月(\d{1,2})日", q_no_space)
-            if m_day:
-                y, mo, d = m_day.groups()
-                start_date = f"{int(y):04d}-{int(mo):02d}-{int(d):02d}"
-                today_str = datetime.date.today().strftime("%Y-%m-%d")
-                date_range = f"{start_date}/{today_str}"
-        else:
-            m_day = re.search(r"(\d{4})年(\d{1,2})月(\d{1,2})日", q_no_space)
-            if m_day:
-                y, mo, d = m_day.groups()
-                date_range = f"{int(y):04d}-{int(mo):02d}-{int(d):02d}"
-            else:
-                m_month = re.search(r"(\d{4})年(\d{1,2})月", q_no_space)
-                if m_month:
-                    y, mo = m_month.groups()
-                    date_range = f"{int(y):04d}-{int(mo):02d}"
-
-        dimensions = []
-        if re.search(r"(按|分|各).*(大区)", q):
-            dimensions.append("parent_region_name")
-        if re.search(r"(按|分|各).*(城市)", q):
-            dimensions.append("store_city")
-        if re.search(r"(按|分|各).*(门店)", q):
-            dimensions.append("store_name")
-        if re.search(r"(按|分|各).*(渠道)", q):
-            dimensions.append("first_middle_channel_name")
-        if re.search(r"(按|分|各).*(产品|产品名称|productname|product_name)", q, re.IGNORECASE):
-            dimensions.append("product_name")
-        if re.search(r"(按|分|各).*(车型|车型分组|版本)", q):
-            dimensions.append("series_group")
-        if re.search(r"(按|分|各).*(性别)", q):
-            dimensions.append("gender")
-        if re.search(r"(按|分|各).*(年龄段|年龄)", q):
-            dimensions.append("age_band")
-        if re.search(r"(按|分|各).*(燃料|动力|fuel|type)", q, re.IGNORECASE):
-            dimensions.append("product_type")
-        
-        # Deduplicate
-        dimensions = list(set(dimensions))
-        dimension = dimensions[0] if dimensions else None
-
-        filters = []
-        try:
-            business_def = json.loads(self.context.get("business_def") or "{}")
-            series_group_logic = business_def.get("series_group_logic") or {}
-            series_keys = list(series_group_logic.keys())
-            model_series_mapping = business_def.get("model_series_mapping") or {}
-            model_keys = list(model_series_mapping.keys())
-        except Exception:
-            series_keys = []
-            model_keys = []
-
-        matched_models = [m for m in model_keys if m and m in q]
-        if matched_models:
-            filters.append({"field": "series", "op": "in", "value": matched_models})
-        else:
-            for k in series_keys:
-                if k and k in q:
-                    filters.append({"field": "series_group", "op": "=", "value": k})
-                    break
-
-        if ("女性" in q) or ("女" in q and "男女" not in q and "男女" not in q):
-            filters.append({"field": "gender", "op": "=", "value": "女"})
-        elif ("男性" in q) or ("男" in q and "男女" not in q):
-            filters.append({"field": "gender", "op": "=", "value": "男"})
-
-        if "增程" in q:
-            filters.append({"field": "product_type", "op": "=", "value": "增程"})
-        elif "纯电" in q:
-            filters.append({"field": "product_type", "op": "=", "value": "纯电"})
-            
-        # Population filters for Age query
-        if metric == "age":
-            if "开票" in q or "invoice" in q.lower():
-                filters.append({"field": "invoice_upload_time", "op": "not_null", "value": True})
-            elif "交付" in q or "delivery" in q.lower():
-                filters.append({"field": "delivery_date", "op": "not_null", "value": True})
-            elif "锁单" in q or "lock" in q.lower():
-                filters.append({"field": "lock_time", "op": "not_null", "value": True})
-
-        tool = "rollup" if dimension else "query"
-        # Heuristic override for composition
-        if any(k in q for k in ["占比", "比例", "份额", "构成", "composition", "share", "ratio", "mix"]):
-            tool = "composition"
-
-        parameters = {"metric": metric, "date_range": date_range}
-        if filters:
-            parameters["filters"] = filters
-        if tool == "rollup":
-            if len(dimensions) > 1:
-                parameters["dimensions"] = dimensions
-            else:
-                parameters["dimension"] = dimension
-        if tool == "composition":
-            # Composition currently only supports single dimension
-            parameters["dimension"] = dimension
-            # Try to find interval
-            if any(k in q for k in ["每天", "daily", "by day", "day"]):
-                parameters["interval"] = "day"
-            elif any(k in q for k in ["每周", "weekly", "by week", "week"]):
-                parameters["interval"] = "week"
-            elif any(k in q for k in ["每月", "monthly", "by month", "month"]):
-                parameters["interval"] = "month"
-        return {"tool": tool, "parameters": parameters}
+        """{tool, parameters} from keyword rules (plus matched spans and a confidence); see agents/query_matcher.py."""
+        return self.matcher.extract(query)
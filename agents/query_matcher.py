@@ -0,0 +1,383 @@
+"""
+Precompiled heuristic extraction for QueryAgent.
+
+All keywords the heuristics look for — metric and dimension aliases (the
+built-in rules plus the names / aliases in query_skills.yaml), series and model
+names from business_definition.json, date, gender, product-type, composition
+and interval words — go into one Aho-Corasick automaton built at agent
+construction, so a query is scanned once regardless of how many terms there
+are. Overlapping metric / dimension hits keep the longest word. Numeric date
+phrases use precompiled regexes. `QueryMatcher.extract` returns {tool,
+parameters} plus the matched `spans` and a `confidence`.
+
+The result matches the earlier keyword extractor (REGRESSION_CASES) except where
+a query_skills.yaml alias now applies (ALIAS_CASES): "按车系" / "按区域" become
+rollups, "按上牌城市" is license_city rather than store_city, and a bare "交付"
+is 交付数 instead of the 锁单量 default.
+"""
+import os
+import re
+import sys
+import datetime
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# (keywords, metric) in priority order: the first rule with a hit wins
+METRIC_RULES = [
+    (["锁单数", "锁单量", "销量"], "锁单量"),
+    (["交付数", "交付量"], "交付数"),
+    (["开票金额"], "开票金额"),
+    (["开票数", "开票量"], "开票量"),
+    (["小订数", "小订量", "意向金"], "小订数"),
+    (["平均年龄", "年龄", "岁"], "age"),
+    (["下发线索数", "线索数", "线索", "leads"], "下发线索数"),
+]
+DEFAULT_METRIC = "锁单量"
+
+# Dimension words count only after 按 / 分 / 各 ("按城市", "各大区")
+DIMENSION_RULES = [
+    (["大区"], "parent_region_name"),
+    (["城市"], "store_city"),
+    (["门店"], "store_name"),
+    (["渠道"], "first_middle_channel_name"),
+    (["产品", "产品名称", "productname", "product_name"], "product_name"),
+    (["车型", "车型分组", "版本"], "series_group"),
+    (["性别"], "gender"),
+    (["年龄段", "年龄"], "age_band"),
+    (["燃料", "动力", "fuel", "type"], "product_type"),
+]
+DIMENSION_TRIGGERS = ["按", "分", "各"]
+
+DATE_RULES = [
+    (["昨日", "昨天"], "yesterday"),
+    (["近两周"], "last_14_days"),
+    (["近一周"], "last_7_days"),
+    (["近一月", "近一个月"], "last_30_days"),
+]
+SINCE_WORDS = ["至今", "since"]
+GENDER_WORDS = ["女性", "女", "男性", "男", "男女"]
+PRODUCT_TYPES = ["增程", "纯电"]
+COMPOSITION_WORDS = ["占比", "比例", "份额", "构成", "composition", "share", "ratio", "mix"]
+INTERVAL_RULES = [
+    (["每天", "daily", "by day", "day"], "day"),
+    (["每周", "weekly", "by week", "week"], "week"),
+    (["每月", "monthly", "by month", "month"], "month"),
+]
+# Population filters for age queries, in priority order
+POPULATION_RULES = [
+    (["开票", "invoice"], "invoice_upload_time"),
+    (["交付", "delivery"], "delivery_date"),
+    (["锁单", "lock"], "lock_time"),
+]
+
+_RELATIVE_RE = re.compile(r"近(\d+)(天|周|月)")
+_RELATIVE_DAYS = {"天": 1, "周": 7, "月": 30}
+# Spaces between the parts are tolerated ("2025年 12月")
+_DAY_RE = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日")
+_MONTH_RE = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月")
+
+Tag = Tuple[str, str, int]  # (kind, value, rank)
+# Hit kinds resolved longest-first against each other before use
+_TERM_KINDS = ("metric", "dimension")
+
+
+class AliasAutomaton:
+    """Aho-Corasick automaton: every (start, end, tag) occurrence of the added terms in one pass."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Tag]]] = [[]]
+
+    def add(self, term: str, tag: Tag) -> None:
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(term), tag))
+
+    def build(self) -> "AliasAutomaton":
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # Inherit the terms that end here as suffixes
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def find(self, text: str) -> List[Tuple[int, int, Tag]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, tag in out[node]:
+                hits.append((i - length + 1, i + 1, tag))
+        return hits
+
+
+def _rules(automaton: AliasAutomaton, kind: str, rules: Iterable[Tuple[List[str], str]], start_rank: int = 0) -> int:
+    rank = start_rank
+    for words, value in rules:
+        for word in words:
+            automaton.add(word.lower(), (kind, value, rank))
+        rank += 1
+    return rank
+
+
+class QueryMatcher:
+    def __init__(self, business_def: Optional[Dict[str, Any]] = None, query_skills: Optional[Dict[str, Any]] = None):
+        business_def = business_def or {}
+        query_skills = query_skills or {}
+        ac = AliasAutomaton()
+        # query_skills.yaml aliases rank after the built-in rules, so they only
+        # decide queries the built-in words do not cover
+        rank = _rules(ac, "metric", METRIC_RULES)
+        for metric in query_skills.get("metrics") or []:
+            name = metric.get("name")
+            if name:
+                _rules(ac, "metric", [([name] + [str(a) for a in metric.get("aliases") or []], name)], rank)
+        rank = _rules(ac, "dimension", DIMENSION_RULES)
+        for dim in query_skills.get("dimensions") or []:
+            name = dim.get("name")
+            if name:
+                # One-character aliases (市, 店) match far too much
+                words = [w for w in [name] + [str(a) for a in dim.get("aliases") or []] if len(w) >= 2]
+                _rules(ac, "dimension", [(words, name)], rank)
+        _rules(ac, "trigger", [(DIMENSION_TRIGGERS, "")])
+        _rules(ac, "date", DATE_RULES)
+        _rules(ac, "since", [(SINCE_WORDS, "")])
+        _rules(ac, "gender", [([w], w) for w in GENDER_WORDS])
+        _rules(ac, "product_type", [([w], w) for w in PRODUCT_TYPES])
+        _rules(ac, "composition", [(COMPOSITION_WORDS, "")])
+        _rules(ac, "interval", INTERVAL_RULES)
+        _rules(ac, "population", POPULATION_RULES)
+        _rules(ac, "model", [([k], k) for k in (business_def.get("model_series_mapping") or {}) if k])
+        _rules(ac, "series_group", [([k], k) for k in (business_def.get("series_group_logic") or {}) if k])
+        self.automaton = ac.build()
+
+    def _scan(self, q: str) -> Dict[str, List[Tuple[int, int, str, int]]]:
+        text = q.lower()
+        if len(text) != len(q):  # lower() changed the length; keep spans aligned
+            text = q
+        found: Dict[str, List[Tuple[int, int, str, int]]] = {}
+        terms: List[Tuple[int, int, str, int, str]] = []
+        for start, end, (kind, value, rank) in self.automaton.find(text):
+            if kind in _TERM_KINDS:
+                terms.append((start, end, value, rank, kind))
+            else:
+                found.setdefault(kind, []).append((start, end, value, rank))
+        # Metric and dimension words compete for the same characters ("年龄" in "年龄段")
+        for start, end, value, rank, kind in self._longest(terms):
+            found.setdefault(kind, []).append((start, end, value, rank))
+        return found
+
+    @staticmethod
+    def _longest(hits: List[tuple]) -> List[tuple]:
+        """Drop hits inside a longer overlapping one ("城市" within "上牌城市"); equal spans all stay."""
+        kept: List[tuple] = []
+        for hit in sorted(hits, key=lambda h: (h[0] - h[1], h[0])):
+            if all(hit[1] <= k[0] or hit[0] >= k[1] or hit[:2] == k[:2] for k in kept):
+                kept.append(hit)
+        return kept
+
+    @staticmethod
+    def _first(hits: List[Tuple[int, int, str, int]]) -> Optional[Tuple[int, int, str, int]]:
+        """Best-ranked hit, earliest on ties."""
+        return min(hits, key=lambda h: (h[3], h[0])) if hits else None
+
+    def _date(self, q: str, found) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+        hit = self._first(found.get("date", []))
+        if hit:
+            return hit[2], (hit[0], hit[1])
+        relative = list(_RELATIVE_RE.finditer(q))
+        if relative:
+            # 近N天 before 近N周 before 近N月, whatever their order in the query
+            m = min(relative, key=lambda r: (_RELATIVE_DAYS[r.group(2)], r.start()))
+            return f"last_{int(m.group(1)) * _RELATIVE_DAYS[m.group(2)]}_days", (m.start(), m.end())
+        m_day = _DAY_RE.search(q)
+        if found.get("since"):
+            # "YYYY年MM月DD日至今"
+            if m_day:
+                y, mo, d = m_day.groups()
+                return f"{int(y):04d}-{int(mo):02d}-{int(d):02d}/{datetime.date.today():%Y-%m-%d}", m_day.span()
+            return None, None
+        if m_day:
+            y, mo, d = m_day.groups()
+            return f"{int(y):04d}-{int(mo):02d}-{int(d):02d}", m_day.span()
+        m_month = _MONTH_RE.search(q)
+        if m_month:
+            y, mo = m_month.groups()
+            return f"{int(y):04d}-{int(mo):02d}", m_month.span()
+        return None, None
+
+    def extract(self, query: str) -> Dict[str, Any]:
+        q = str(query or "").strip()
+        found = self._scan(q)
+        spans: List[Dict[str, Any]] = []
+        confidence = 1.0
+
+        def span(kind: str, hit: Tuple[int, int, str, int]) -> None:
+            spans.append({"kind": kind, "text": q[hit[0]:hit[1]], "start": hit[0], "end": hit[1], "value": hit[2]})
+
+        metric_hit = self._first(found.get("metric", []))
+        if metric_hit:
+            metric = metric_hit[2]
+            span("metric", metric_hit)
+            if len({h[2] for h in found["metric"]}) > 1:
+                confidence -= 0.1
+        else:
+            metric = DEFAULT_METRIC
+            confidence -= 0.3
+
+        date_range, date_span = self._date(q, found)
+        if date_range is None:
+            date_range = "yesterday"
+            confidence -= 0.2
+        else:
+            spans.append({"kind": "date", "text": q[date_span[0]:date_span[1]], "start": date_span[0], "end": date_span[1], "value": date_range})
+
+        dimensions: List[str] = []
+        triggers = found.get("trigger", [])
+        if triggers:
+            after = min(t[0] for t in triggers)
+            for hit in sorted(found.get("dimension", []), key=lambda h: (h[0], h[3])):
+                if hit[0] > after and hit[2] not in dimensions:
+                    dimensions.append(hit[2])
+                    span("dimension", hit)
+        dimension = dimensions[0] if dimensions else None
+
+        filters = []
+        models = found.get("model", [])
+        if models:
+            value = []
+            for hit in sorted(models, key=lambda h: h[3]):
+                if hit[2] not in value:
+                    value.append(hit[2])
+                    span("series", hit)
+            filters.append({"field": "series", "op": "in", "value": value})
+        else:
+            group = self._first(found.get("series_group", []))
+            if group:
+                filters.append({"field": "series_group", "op": "=", "value": group[2]})
+                span("series_group", group)
+
+        genders = {h[2] for h in found.get("gender", [])}
+        if "女性" in genders or ("女" in genders and "男女" not in genders):
+            filters.append({"field": "gender", "op": "=", "value": "女"})
+        elif "男性" in genders or ("男" in genders and "男女" not in genders):
+            filters.append({"field": "gender", "op": "=", "value": "男"})
+
+        product = self._first(found.get("product_type", []))
+        if product:
+            filters.append({"field": "product_type", "op": "=", "value": product[2]})
+            span("product_type", product)
+
+        # Population filters for Age query
+        if metric == "age":
+            population = self._first(found.get("population", []))
+            if population:
+                filters.append({"field": population[2], "op": "not_null", "value": True})
+
+        tool = "rollup" if dimension else "query"
+        # Heuristic override for composition
+        if found.get("composition"):
+            tool = "composition"
+
+        parameters: Dict[str, Any] = {"metric": metric, "date_range": date_range}
+        if filters:
+            parameters["filters"] = filters
+        if tool == "rollup":
+            if len(dimensions) > 1:
+                parameters["dimensions"] = dimensions
+            else:
+                parameters["dimension"] = dimension
+        if tool == "composition":
+            # Composition currently only supports single dimension
+            parameters["dimension"] = dimension
+            interval = self._first(found.get("interval", []))
+            if interval:
+                parameters["interval"] = interval[2]
+        return {
+            "tool": tool,
+            "parameters": parameters,
+            "spans": sorted(spans, key=lambda s: s["start"]),
+            "confidence": round(max(confidence, 0.0), 2),
+        }
+
+
+# Outputs of the pre-automaton extractor, pinned as regression cases
+# (`python agents/query_matcher.py` checks them against the current configuration)
+REGRESSION_CASES = [
+    ('昨日销量如何', 'query', {'metric': '锁单量', 'date_range': 'yesterday'}),
+    ('近两周 LS6 增程 的开票数', 'query', {'metric': '开票量', 'date_range': 'last_14_days', 'filters': [{'field': 'series', 'op': 'in', 'value': ['LS6']}, {'field': 'product_type', 'op': '=', 'value': '增程'}]}),
+    ('LS9 2025年12月 按城市 的锁单量', 'rollup', {'metric': '锁单量', 'date_range': '2025-12', 'filters': [{'field': 'series_group', 'op': '=', 'value': 'LS9'}], 'dimension': 'store_city'}),
+    ('近30天 小订数 按渠道', 'rollup', {'metric': '小订数', 'date_range': 'last_30_days', 'dimension': 'first_middle_channel_name'}),
+    ('近3周 开票金额', 'query', {'metric': '开票金额', 'date_range': 'last_21_days'}),
+    ('近2月 下发线索数 分门店', 'rollup', {'metric': '下发线索数', 'date_range': 'last_60_days', 'dimension': 'store_name'}),
+    ('女性用户平均年龄 开票', 'query', {'metric': 'age', 'date_range': 'yesterday', 'filters': [{'field': 'gender', 'op': '=', 'value': '女'}, {'field': 'invoice_upload_time', 'op': 'not_null', 'value': True}]}),
+    ('男性 交付 用户的年龄', 'query', {'metric': 'age', 'date_range': 'yesterday', 'filters': [{'field': 'gender', 'op': '=', 'value': '男'}, {'field': 'delivery_date', 'op': 'not_null', 'value': True}]}),
+    ('各车型分组 锁单量 占比 每天', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'series_group', 'interval': 'day'}),
+    ('按性别和年龄段 开票量', 'rollup', {'metric': '开票量', 'date_range': 'yesterday', 'dimensions': ['age_band', 'gender']}),
+    ('按燃料类型 销量 share weekly', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'product_type', 'interval': 'week'}),
+    ('CM2 近一个月 销量', 'query', {'metric': '锁单量', 'date_range': 'last_30_days', 'filters': [{'field': 'series_group', 'op': '=', 'value': 'CM2'}]}),
+    ('LS6 销量 monthly 构成', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'filters': [{'field': 'series', 'op': 'in', 'value': ['LS6']}], 'dimension': None, 'interval': 'month'}),
+    ('leads by product_type', 'query', {'metric': '下发线索数', 'date_range': 'yesterday'}),
+    ('男女比例', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': None}),
+    ('2025年3月 岁数分布 锁单', 'query', {'metric': 'age', 'date_range': '2025-03', 'filters': [{'field': 'lock_time', 'op': 'not_null', 'value': True}]}),
+    ('纯电 近7天 锁单数 按产品名称', 'rollup', {'metric': '锁单量', 'date_range': 'last_7_days', 'filters': [{'field': 'product_type', 'op': '=', 'value': '纯电'}], 'dimension': 'product_name'}),
+    ('2025年12月3日 DM1 锁单', 'query', {'metric': '锁单量', 'date_range': '2025-12-03', 'filters': [{'field': 'series_group', 'op': '=', 'value': 'DM1'}]}),
+    ('订单量 昨天', 'query', {'metric': '锁单量', 'date_range': 'yesterday'}),
+    ('区域 开票 比例', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': None}),
+    ('今天 锁单', 'query', {'metric': '锁单量', 'date_range': 'yesterday'}),
+    ('按年龄段的锁单量', 'rollup', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'age_band'}),
+    ('按车型分组 开票数', 'rollup', {'metric': '开票量', 'date_range': 'yesterday', 'dimension': 'series_group'}),
+    ('按年龄段 平均年龄', 'rollup', {'metric': 'age', 'date_range': 'yesterday', 'dimension': 'age_band'}),
+    ('各城市 开票金额', 'rollup', {'metric': '开票金额', 'date_range': 'yesterday', 'dimension': 'store_city'}),
+    ('按门店 按城市 交付量', 'rollup', {'metric': '交付数', 'date_range': 'yesterday', 'dimensions': ['store_city', 'store_name']}),
+    ('分渠道 小订数 近7天', 'rollup', {'metric': '小订数', 'date_range': 'last_7_days', 'dimension': 'first_middle_channel_name'}),
+    ('按版本 销量 占比', 'composition', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'series_group'}),
+]
+# Intended differences from that extractor: query_skills.yaml aliases are matched
+# (车系, 区域, 上牌城市, 交付), and the longest overlapping word wins
+ALIAS_CASES = [
+    ('按车系 销量', 'rollup', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'series'}),
+    ('按区域 交付数', 'rollup', {'metric': '交付数', 'date_range': 'yesterday', 'dimension': 'parent_region_name'}),
+    ('按上牌城市的锁单量', 'rollup', {'metric': '锁单量', 'date_range': 'yesterday', 'dimension': 'license_city'}),
+    ('昨日交付', 'query', {'metric': '交付数', 'date_range': 'yesterday'}),
+]
+
+
+def check(matcher: QueryMatcher) -> List[str]:
+    """Regression / alias cases whose {tool, parameters} differ from `matcher` (dimension order ignored)."""
+    failures = []
+    for query, tool, parameters in REGRESSION_CASES + ALIAS_CASES:
+        got = matcher.extract(query)
+        params = dict(got["parameters"])
+        if "dimensions" in params:
+            params["dimensions"] = sorted(params["dimensions"])
+        if got["tool"] != tool or params != parameters:
+            failures.append(f"{query}: expected {tool} {parameters}, got {got['tool']} {params}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from agents.query_agent import QueryAgent
+
+    failures = check(QueryAgent().matcher)
+    print("\n".join(failures) or f"✅ {len(REGRESSION_CASES) + len(ALIAS_CASES)} cases match")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,129 @@
+"""
+Query slot extraction for the plan cache.
+
+A query is split into a template plus slots: absolute dates, series/model names
+and metric names are pulled out ("LS6 2025年12月 的锁单量" ->
+"{series0} {date0} 的{metric0}"), so recurring questions that only differ in
+those values map to the same cached plan.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (pattern, formatter) in priority order; formatters emit the DSL date_range form
+_DATE_PATTERNS = [
+    (re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})日"), lambda y, m, d: f"{int(y):04d}-{int(m):02d}-{int(d):02d}"),
+    (re.compile(r"(?<![\d-])(\d{4})-(\d{1,2})-(\d{1,2})(?![\d-])"), lambda y, m, d: f"{int(y):04d}-{int(m):02d}-{int(d):02d}"),
+    (re.compile(r"(\d{4})年(\d{1,2})月"), lambda y, m: f"{int(y):04d}-{int(m):02d}"),
+    (re.compile(r"(?<![\d-])(\d{4})-(\d{1,2})(?![\d-])"), lambda y, m: f"{int(y):04d}-{int(m):02d}"),
+    (re.compile(r"(\d{4})年"), lambda y: f"{int(y):04d}"),
+]
+
+# Plan text around a slot value must not continue the token (e.g. 2025-12 inside 2025-12-01)
+_BOUNDARY = "A-Za-z0-9_\\-"
+
+
+@dataclass
+class Slot:
+    name: str   # e.g. "date0"
+    kind: str   # "date" | "series" | "metric"
+    raw: str    # text as it appeared in the query
+    value: str  # canonical form used in plans
+
+
+def _next_name(kind: str, slots: List[Slot]) -> str:
+    return f"{kind}{sum(1 for s in slots if s.kind == kind)}"
+
+
+def _term_pattern(terms: List[str]) -> re.Pattern:
+    """Longest-first alternation; ASCII terms (LS6, sales) must not sit inside a longer ASCII token."""
+    ascii_terms = [t for t in terms if t.isascii()]
+    other_terms = [t for t in terms if not t.isascii()]
+    parts = []
+    if ascii_terms:
+        parts.append(r"(?<![A-Za-z0-9])(?:" + "|".join(re.escape(t) for t in ascii_terms) + r")(?![A-Za-z0-9])")
+    if other_terms:
+        parts.append("(?:" + "|".join(re.escape(t) for t in other_terms) + ")")
+    return re.compile("|".join(parts))
+
+
+class SlotExtractor:
+    def __init__(self, series_terms: Iterable[str] = (), metric_aliases: Optional[Dict[str, str]] = None):
+        """
+        `series_terms`: series / model names to slot (e.g. LS6, CM2).
+        `metric_aliases`: alias -> canonical metric name (e.g. 销量 -> 锁单量).
+        """
+        self.series_terms = sorted({t for t in series_terms if t}, key=len, reverse=True)
+        self.metric_aliases = dict(metric_aliases or {})
+        self._metric_terms = sorted(self.metric_aliases, key=len, reverse=True)
+
+    @classmethod
+    def from_context(cls, business_def: dict, query_skills: dict) -> "SlotExtractor":
+        series = set()
+        for model, groups in (business_def.get("model_series_mapping") or {}).items():
+            series.add(model)
+            series.update(groups or [])
+        series.update((business_def.get("series_group_logic") or {}).keys())
+        for dim in query_skills.get("dimensions") or []:
+            if dim.get("name") in ("series", "series_group"):
+                series.update(str(v) for v in dim.get("values") or [])
+        aliases = {}
+        for metric in query_skills.get("metrics") or []:
+            name = metric.get("name")
+            if not name:
+                continue
+            aliases[name] = name
+            for alias in metric.get("aliases") or []:
+                aliases.setdefault(str(alias), name)
+        return cls(series, aliases)
+
+    def extract(self, query: str) -> Tuple[str, List[Slot]]:
+        """Return (template, slots) for `query`."""
+        text = re.sub(r"\s+", " ", str(query or "").strip())
+        slots: List[Slot] = []
+
+        def mark(kind: str, raw: str, value: str) -> str:
+            slot = Slot(_next_name(kind, slots), kind, raw, value)
+            slots.append(slot)
+            return "{" + slot.name + "}"
+
+        for pattern, fmt in _DATE_PATTERNS:
+            text = pattern.sub(lambda m: mark("date", m.group(0), fmt(*m.groups())), text)
+
+        for kind, terms, canonical in (
+            ("series", self.series_terms, lambda t: t),
+            ("metric", self._metric_terms, lambda t: self.metric_aliases[t]),
+        ):
+            if terms:
+                text = _term_pattern(terms).sub(lambda m: mark(kind, m.group(0), canonical(m.group(0))), text)
+        return text, slots
+
+
+def parametrize(plan_text: str, slots: List[Slot]) -> Tuple[str, Dict[str, str]]:
+    """
+    Replace each slot's canonical value (and raw query text) in `plan_text` with a
+    placeholder. Slots whose value does not appear in the plan are returned as
+    `fixed`: the plan may still depend on them, so a reuse must match them exactly.
+    """
+    fixed: Dict[str, str] = {}
+    for slot in sorted(slots, key=lambda s: len(s.value), reverse=True):
+        pattern = re.compile(rf"(?<![{_BOUNDARY}]){re.escape(slot.value)}(?![{_BOUNDARY}])")
+        plan_text, n = pattern.subn("{{slot:" + slot.name + "}}", plan_text)
+        if n == 0:
+            fixed[slot.name] = slot.value
+            continue
+        if slot.raw != slot.value:
+            raw = re.compile(rf"(?<![A-Za-z0-9]){re.escape(slot.raw)}(?![A-Za-z0-9])")
+            plan_text = raw.sub("{{raw:" + slot.name + "}}", plan_text)
+    return plan_text, fixed
+
+
+def instantiate(plan_template: str, slots: List[Slot]) -> str:
+    """Fill a parametrized plan with this query's slot values."""
+    by_name = {s.name: s for s in slots}
+
+    def fill(m: re.Match) -> str:
+        slot = by_name[m.group(2)]
+        return slot.value if m.group(1) == "slot" else slot.raw
+
+    return re.sub(r"\{\{(slot|raw):([a-z]+\d+)\}\}", fill, plan_template)
@@ -1,8 +1,46 @@
 import os
 import sys
 import json
-import urllib.request
-import urllib.error
+import asyncio
+
+from agents.prompt_builder import PromptBuilder
+from runtime.llm_client import AsyncRateLimiter, LLMError, get_client, offline_api_key
+
+SUGGESTION_INSTRUCTIONS = """
+You are a Senior BI Analyst assisting an automated analysis system.
+
+Note: Statistical anomaly has already been evaluated.
+
+**Task:**
+Provide exactly 3 high-priority analysis suggestions in ONE sentence each.
+Prefix each with [PROCESS], [FUNNEL], [CHANNEL].
+Use extreme-value-sensitive metrics where appropriate (e.g., lock_time tail >30 days, P90).
+Format: 👉 [TAG] [Action] → To confirm whether [specific hypothesis].
+Return ONLY a numbered list.
+
+The data schema excerpt and the current risk situation follow in the user message.
+"""
+
+TRANSLATION_INSTRUCTIONS = """
+You are an expert translator and business analyst.
+Translate the following English analysis suggestions into concise Chinese.
+Keep technical metrics and dimensions intact (like `series_group`, `lock_time`).
+Keep the statistical tail/extreme value logic.
+Keep one action per sentence, max 25 words, prefixed by [PROCESS], [FUNNEL], [CHANNEL].
+"""
+
+SINGLE_SHOT_INSTRUCTIONS = """
+你是一名资深 BI 分析师，为自动化分析系统提供下一步排查建议。统计异常已由系统判定。
+
+**任务：**
+给出恰好 3 条高优先级分析建议，标签依次为 PROCESS、FUNNEL、CHANNEL，每条一句话、不超过 25 字。
+适当使用对极值敏感的指标（如 lock_time 尾部 >30 天、P90），保留技术指标与维度名（如 `series_group`、`lock_time`）。
+
+**输出（仅 JSON）：**
+{"suggestions": [{"tag": "PROCESS", "action": "具体动作", "hypothesis": "待验证的具体假设"}, ...]}
+
+数据 schema 摘录与当前风险情况见用户消息。
+"""
 
 class SuggestionAgent:
     def __init__(self, base_dir=None):
@@ -14,8 +52,11 @@ class SuggestionAgent:
         self.schema_path = os.path.join(self.base_dir, "world", "schema.md")
         self.env_path = os.path.join(self.base_dir, ".env")
         
-        self.api_key = self._load_api_key()
+        # Replaying from the response cache needs no key
+        self.api_key = self._load_api_key() or offline_api_key()
         self.schema = self._load_schema()
+        self.prompt_builder = PromptBuilder(self.schema, "{}")
+        self.last_prompt_stats = {}
 
     def _load_api_key(self):
         if os.path.exists(self.env_path):
@@ -32,15 +73,7 @@ class SuggestionAgent:
         with open(self.schema_path, 'r', encoding='utf-8') as f:
             return f.read()
 
-    def _call_llm(self, system_prompt, user_prompt="Please provide the output."):
-        if not self.api_key:
-            return "Error: Deepseek API key not found."
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
+    def _request(self, system_prompt, user_prompt, max_tokens=500, json_output=False):
         data = {
             "model": "deepseek-chat",
             "messages": [
@@ -48,65 +81,116 @@ class SuggestionAgent:
                 {"role": "user", "content": user_prompt}
             ],
             "temperature": 0.3,
-            "max_tokens": 500
+            "max_tokens": max_tokens
         }
-        
+        if json_output:
+            data["response_format"] = {"type": "json_object"}
+        return data
+
+    def _call_llm(self, system_prompt, user_prompt="Please provide the output.", **options):
+        if not self.api_key:
+            return "Error: Deepseek API key not found."
+
         try:
-            req = urllib.request.Request(
-                "https://api.deepseek.com/chat/completions",
-                data=json.dumps(data).encode('utf-8'),
-                headers=headers,
-                method='POST'
-            )
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content']
-        except urllib.error.HTTPError as e:
-            return f"Error calling API: {e.code} - {e.read().decode('utf-8')}"
+            result = get_client().chat_completion(self._request(system_prompt, user_prompt, **options), self.api_key)
+            return result['choices'][0]['message']['content']
+        except LLMError as e:
+            return f"Error calling API: {e.status} - {e.body}"
         except Exception as e:
             return f"Error calling API: {str(e)}"
 
-    def generate_suggestions(self, risk_level, risk_factors, analysis_results):
+    async def _acall_llm(self, system_prompt, user_prompt, **options):
         if not self.api_key:
-            return ["Error: Deepseek API key not found. Cannot generate suggestions."]
+            return "Error: Deepseek API key not found."
 
-        # Step 1: Generate English suggestions
-        english_prompt = f"""
-You are a Senior BI Analyst assisting an automated analysis system.
+        try:
+            result = await get_client().achat_completion(self._request(system_prompt, user_prompt, **options), self.api_key)
+            return result['choices'][0]['message']['content']
+        except LLMError as e:
+            return f"Error calling API: {e.status} - {e.body}"
+        except Exception as e:
+            return f"Error calling API: {str(e)}"
 
-**Context Resources:**
-Data Schema:
-{self.schema}
+    def _situation_prompt(self, instructions, risk_level, risk_factors, closing):
+        # Static instructions go first (cacheable prefix); the situation and schema excerpt vary per call
+        situation = json.dumps(risk_factors, indent=2, ensure_ascii=False)
+        prompt = PromptBuilder.build(
+            [("", instructions)],
+            [
+                ("Data Schema (excerpt)", self.prompt_builder.schema_excerpt(situation)),
+                ("Current Situation", f"- Risk Level: {risk_level}\n- Detected Risk Factors:\n{situation}"),
+                ("", closing),
+            ],
+        )
+        self.last_prompt_stats = prompt.stats()
+        return prompt
 
-**Current Situation:**
-- Risk Level: {risk_level}
-- Detected Risk Factors:
-{json.dumps(risk_factors, indent=2, ensure_ascii=False)}
+    @staticmethod
+    def _format_structured(content):
+        """Render the single-shot JSON reply as the numbered list the two-step mode produces."""
+        try:
+            items = json.loads(content).get("suggestions") or []
+        except (ValueError, AttributeError):
+            return content
+        lines = []
+        for i, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                continue
+            tag = str(item.get("tag", "")).strip("[] ")
+            lines.append(f"{i}. 👉 [{tag}] {item.get('action', '')} → 以确认{item.get('hypothesis', '')}")
+        return "\n".join(lines) if lines else content
 
-Note: Statistical anomaly has already been evaluated.
+    def generate_suggestions(self, risk_level, risk_factors, analysis_results, single_shot=False):
+        """
+        Three tagged suggestions in Chinese. The default mode writes them in English and
+        translates in a second call; `single_shot` asks for the Chinese JSON in one call.
+        """
+        if not self.api_key:
+            return ["Error: Deepseek API key not found. Cannot generate suggestions."]
 
-**Task:**
-Provide exactly 3 high-priority analysis suggestions in ONE sentence each.
-Prefix each with [PROCESS], [FUNNEL], [CHANNEL].
-Use extreme-value-sensitive metrics where appropriate (e.g., lock_time tail >30 days, P90).
-Format: 👉 [TAG] [Action] → To confirm whether [specific hypothesis].
-Return ONLY a numbered list.
-"""
-        english_suggestions = self._call_llm(english_prompt, "Please provide the suggestions.")
+        if single_shot:
+            prompt = self._situation_prompt(SINGLE_SHOT_INSTRUCTIONS, risk_level, risk_factors, "请输出 JSON。")
+            content = self._call_llm(prompt.system, prompt.user, max_tokens=400, json_output=True)
+            if content.startswith("Error"):
+                return [content]
+            return self._format_structured(content)
+
+        # Step 1: Generate English suggestions
+        english_prompt = self._situation_prompt(SUGGESTION_INSTRUCTIONS, risk_level, risk_factors, "Please provide the suggestions.")
+        english_suggestions = self._call_llm(english_prompt.system, english_prompt.user)
         if english_suggestions.startswith("Error"):
             return [english_suggestions]
 
         # Step 2: Convert English suggestions to concise Chinese
-        chinese_translation_prompt = f"""
-You are an expert translator and business analyst.
-Translate the following English analysis suggestions into concise Chinese.
-Keep technical metrics and dimensions intact (like `series_group`, `lock_time`).
-Keep the statistical tail/extreme value logic.
-Keep one action per sentence, max 25 words, prefixed by [PROCESS], [FUNNEL], [CHANNEL].
-
-English suggestions:
-{english_suggestions}
-"""
-        chinese_suggestions = self._call_llm(chinese_translation_prompt, "Please translate.")
+        chinese_suggestions = self._call_llm(
+            TRANSLATION_INSTRUCTIONS,
+            f"English suggestions:\n{english_suggestions}\n\nPlease translate.",
+        )
         
         return chinese_suggestions
+
+    async def agenerate_suggestions(self, risk_level, risk_factors, analysis_results, limiter=None):
+        """Single-shot generation as a coroutine; `limiter` (AsyncRateLimiter) bounds concurrent calls."""
+        if not self.api_key:
+            return ["Error: Deepseek API key not found. Cannot generate suggestions."]
+
+        prompt = self._situation_prompt(SINGLE_SHOT_INSTRUCTIONS, risk_level, risk_factors, "请输出 JSON。")
+        if limiter is None:
+            content = await self._acall_llm(prompt.system, prompt.user, max_tokens=400, json_output=True)
+        else:
+            async with limiter:
+                content = await self._acall_llm(prompt.system, prompt.user, max_tokens=400, json_output=True)
+        if content.startswith("Error"):
+            return [content]
+        return self._format_structured(content)
+
+    def generate_suggestions_batch(self, items, concurrency=4, rate_per_sec=None):
+        """
+        Suggestions for many (risk_level, risk_factors, analysis_results) tuples, generated
+        concurrently; results are returned in input order.
+        """
+        async def run():
+            limiter = AsyncRateLimiter(concurrency=concurrency, rate_per_sec=rate_per_sec)
+            return await asyncio.gather(*(self.agenerate_suggestions(*item, limiter=limiter) for item in items))
+
+        return asyncio.run(run()) if items else []
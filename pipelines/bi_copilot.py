@@ -7,7 +7,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agents.planning_agent import PlanningAgent
-from agents.execution_graph import build_execution_graph
+from agents.execution_graph import get_execution_graph
 
 def parse_json_from_markdown(text):
     """
@@ -102,7 +102,7 @@ def run_pipeline(query):
     
     # 3. Execute
     print("\n--- Phase 2: Execution (Graph) ---")
-    app = build_execution_graph()
+    app = get_execution_graph()
     
     initial_state = {
         "dsl_sequence": dsl_sequence,
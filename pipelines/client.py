@@ -0,0 +1,171 @@
+"""
+pipelines/serve.py 常驻服务的轻量客户端（仅依赖标准库，不加载 pandas / 数据）。
+
+用法：
+    python pipelines/client.py health
+    python pipelines/client.py query "LS6 增程 2025年12月 的开票数"
+    python pipelines/client.py plan "昨日销量如何"
+    python pipelines/client.py execute plan.json
+    python pipelines/client.py report yesterday_lock --date 2025-12-01
+    python pipelines/client.py report yesterday_rate --date yesterday -- --z-threshold 2.5
+    python pipelines/client.py report yesterday_lock_reasoner --date yesterday --stream
+
+服务地址取 --url，其次环境变量 BI_SERVICE_URL，默认 http://127.0.0.1:8765；
+Unix socket 写作 unix:///tmp/bi.sock。
+"""
+import os
+import sys
+import argparse
+import http.client
+import json
+import socket
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def service_url() -> str:
+    return os.environ.get("BI_SERVICE_URL") or DEFAULT_URL
+
+
+def _connect(url: Optional[str], timeout: float) -> http.client.HTTPConnection:
+    parsed = urlparse(url or service_url())
+    if parsed.scheme == "unix":
+        return UnixHTTPConnection(parsed.path, timeout=timeout)
+    return http.client.HTTPConnection(parsed.hostname or "127.0.0.1", parsed.port or 80, timeout=timeout)
+
+
+def call(path: str, payload: Optional[Dict[str, Any]] = None, url: Optional[str] = None, timeout: float = 600.0) -> Dict[str, Any]:
+    """
+    GET `path` (payload None) or POST `payload` as JSON; returns the decoded body.
+    Raises RuntimeError with the service's error message on a non-200 reply.
+    """
+    conn = _connect(url, timeout)
+    try:
+        if payload is None:
+            conn.request("GET", path)
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        data = json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f"Service error {resp.status}: {data.get('error', data)}")
+    return data
+
+
+def stream_call(
+    path: str,
+    payload: Dict[str, Any],
+    on_event: Callable[[str, Dict[str, Any]], None],
+    url: Optional[str] = None,
+    timeout: float = 600.0,
+) -> Dict[str, Any]:
+    """
+    POST to a server-sent-event route, passing each (event, data) to `on_event`;
+    returns the data of the final `result` event.
+    """
+    conn = _connect(url, timeout)
+    result: Optional[Dict[str, Any]] = None
+    try:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        conn.request("POST", path, body=body, headers={"Content-Type": "application/json", "Accept": "text/event-stream"})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            data = json.loads(resp.read() or b"{}")
+            raise RuntimeError(f"Service error {resp.status}: {data.get('error', data)}")
+        event = "message"
+        for raw in resp:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[5:].strip())
+                if event == "error":
+                    raise RuntimeError(f"Service error: {data.get('error', data)}")
+                if event == "result":
+                    result = data
+                on_event(event, data)
+            elif not line:
+                event = "message"
+    finally:
+        conn.close()
+    if result is None:
+        raise RuntimeError("Stream ended without a result")
+    return result
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("--url", type=str, help=f"Service URL (default: $BI_SERVICE_URL or {DEFAULT_URL})")
+    sub = p.add_subparsers(dest="command", required=True)
+    sub.add_parser("health")
+    for name in ("query", "plan"):
+        sp = sub.add_parser(name)
+        sp.add_argument("text", nargs="+")
+    sp = sub.add_parser("execute")
+    sp.add_argument("dsl_file", help="JSON file holding a DSL sequence (list of steps)")
+    sp = sub.add_parser("report")
+    sp.add_argument("pipeline", type=str)
+    sp.add_argument("--date", type=str, default="yesterday")
+    sp.add_argument("--reasoner", action="store_true", help="Also generate the LLM report")
+    sp.add_argument("--stream", action="store_true", help="Generate the LLM report and print it as it streams")
+    sp.add_argument("extra", nargs=argparse.REMAINDER, help="Pipeline CLI arguments after --")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.command == "health":
+        out = call("/health", url=args.url)
+    elif args.command in ("query", "plan"):
+        out = call(f"/{args.command}", {"query": " ".join(args.text)}, url=args.url)
+    elif args.command == "execute":
+        with open(args.dsl_file, "r", encoding="utf-8") as f:
+            out = call("/execute", {"dsl_sequence": json.load(f)}, url=args.url)
+    elif args.stream:
+        extra = [a for a in args.extra if a != "--"]
+
+        def on_event(event: str, data: Dict[str, Any]) -> None:
+            if event == "delta":
+                print(data.get("text", ""), end="", flush=True)
+            elif event == "result":
+                print()
+
+        out = stream_call(
+            "/report/stream",
+            {"pipeline": args.pipeline, "date": args.date, "args": extra, "reasoner": True},
+            on_event,
+            url=args.url,
+        )
+    else:
+        extra = [a for a in args.extra if a != "--"]
+        out = call(
+            "/report",
+            {"pipeline": args.pipeline, "date": args.date, "args": extra, "reasoner": args.reasoner},
+            url=args.url,
+        )
+    print(json.dumps(out, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (RuntimeError, OSError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,376 @@
+"""
+常驻分析服务：进程内保持 DataManager（parquet/CSV 与派生缓存）、编译好的执行图和 Query/Planning Agent 常热，
+通过本地 HTTP（或 Unix socket）提供查询、计划执行与日报接口，每次请求只付计算成本。
+
+启动：
+    python pipelines/serve.py                      # http://127.0.0.1:8765
+    python pipelines/serve.py --socket /tmp/bi.sock
+
+接口（JSON in / JSON out）：
+    GET  /health                                   数据加载状态
+    POST /query    {"query": "..."}                QueryAgent 单次查询
+    POST /plan     {"query": "..."}                PlanningAgent 生成计划并执行
+    POST /execute  {"dsl_sequence": [...]}         直接执行 DSL
+    POST /report   {"pipeline": "yesterday_lock", "date": "yesterday", "args": [], "reasoner": false}
+    POST /report/stream  同 /report（reasoner 默认 true），以 SSE 推送：event: delta 报告片段，event: result 完整结果
+    POST /reload   {"force": false}                源文件变化时重建数据快照并原子切换
+
+--watch N 每 N 秒检查源文件指纹，晨间数据刷新无需重启；每个请求固定在开始时的数据版本上。
+
+客户端见 pipelines/client.py。
+"""
+import os
+import sys
+import argparse
+import dataclasses
+import json
+import socketserver
+import time
+import traceback
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.execution_graph import get_execution_graph
+from agents.planning_agent import PlanningAgent
+from agents.query_agent import QueryAgent
+from runtime.context import DataManager
+from pipelines import bi_copilot, yesterday_lock, yesterday_lock_reasoner, yesterday_rate, yesterday_rate_reasoner
+
+OnDelta = Optional[Callable[[str], None]]
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class ServiceError(Exception):
+    """A request the service cannot answer; reported to the client as HTTP 400."""
+
+
+class ResultEncoder(json.JSONEncoder):
+    """Tool results carry numpy scalars, timestamps and dataclasses; keep them readable."""
+
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, (pd.Timestamp, pd.Timedelta)):
+            return str(o)
+        if isinstance(o, set):
+            return sorted(o)
+        return str(o)
+
+
+def _require(payload: Dict[str, Any], key: str) -> Any:
+    value = payload.get(key)
+    if value in (None, "", []):
+        raise ServiceError(f"Missing '{key}'")
+    return value
+
+
+def _execute(dsl_sequence: List[Dict[str, Any]]) -> Dict[str, Any]:
+    final_state = get_execution_graph().invoke({
+        "dsl_sequence": dsl_sequence,
+        "current_step": 0,
+        "results": {},
+        "signals": [],
+    })
+    return {"results": final_state["results"], "signals": final_state["signals"]}
+
+
+def handle_health(payload: Dict[str, Any]) -> Dict[str, Any]:
+    dm = DataManager()
+    return {
+        "status": "ok",
+        "version": dm.version,
+        "data_rows": int(len(dm.data)) if dm.data is not None else None,
+        "assign_rows": int(len(dm.assign_data)) if dm.assign_data is not None else None,
+    }
+
+
+# Agents load their schema / definitions / skills and build their matchers and
+# caches at construction; the service builds each once and reuses it.
+@lru_cache(maxsize=None)
+def get_query_agent() -> QueryAgent:
+    return QueryAgent()
+
+
+@lru_cache(maxsize=None)
+def get_planning_agent() -> PlanningAgent:
+    return PlanningAgent()
+
+
+def handle_query(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {"result": get_query_agent().run(_require(payload, "query"))}
+
+
+def handle_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
+    plan_text = get_planning_agent().generate_plan(_require(payload, "query"))
+    plan_json = bi_copilot.parse_json_from_markdown(plan_text)
+    if not plan_json:
+        raise ServiceError(f"Could not parse plan into JSON: {plan_text}")
+    dsl_sequence = bi_copilot.transform_plan_to_dsl(plan_json)
+    return {"dsl_sequence": dsl_sequence, **_execute(dsl_sequence)}
+
+
+def handle_execute(payload: Dict[str, Any]) -> Dict[str, Any]:
+    dsl_sequence = _require(payload, "dsl_sequence")
+    if not isinstance(dsl_sequence, list):
+        raise ServiceError("'dsl_sequence' must be a list of steps")
+    return _execute(dsl_sequence)
+
+
+def _report_lock(date: str, argv: List[str], reasoner: bool, on_delta: OnDelta = None) -> Dict[str, Any]:
+    state = yesterday_lock.analyze_point(date)
+    return {
+        "results": state["results"],
+        "signals": state["signals"],
+        "assessment": yesterday_lock.generate_assessment(state["signals"], date, verbose=False),
+    }
+
+
+def _report_lock_reasoner(date: str, argv: List[str], reasoner: bool, on_delta: OnDelta = None) -> Dict[str, Any]:
+    context_data = yesterday_lock_reasoner.analyze_point(date)
+    if reasoner:
+        report, metrics = yesterday_lock_reasoner.call_deepseek_reasoner(context_data, prompt_type="daily", on_delta=on_delta)
+        context_data = {**context_data, "reasoner_report": report, "reasoner_metrics": metrics}
+    return context_data
+
+
+def _report_rate(date: str, argv: List[str], reasoner: bool, on_delta: OnDelta = None) -> Dict[str, Any]:
+    state = yesterday_rate.analyze_point(date, yesterday_rate._parse_args(argv))
+    return {
+        "results": state["results"],
+        "signals": state["signals"],
+        "assessment": yesterday_rate.generate_assessment(state, date, verbose=False),
+    }
+
+
+def _report_rate_reasoner(date: str, argv: List[str], reasoner: bool, on_delta: OnDelta = None) -> Dict[str, Any]:
+    args = yesterday_rate_reasoner._parse_args(argv)
+    state = yesterday_rate_reasoner.analyze_point(date, args, use_reasoner=reasoner, on_delta=on_delta)
+    return {"results": state["results"], "signals": state["signals"]}
+
+
+REPORTS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "yesterday_lock": _report_lock,
+    "yesterday_lock_reasoner": _report_lock_reasoner,
+    "yesterday_rate": _report_rate,
+    "yesterday_rate_reasoner": _report_rate_reasoner,
+}
+
+
+def _report_request(payload: Dict[str, Any]):
+    name = _require(payload, "pipeline")
+    if name not in REPORTS:
+        raise ServiceError(f"Unknown pipeline '{name}', expected one of {sorted(REPORTS)}")
+    argv = payload.get("args") or []
+    if not isinstance(argv, list):
+        raise ServiceError("'args' must be a list of CLI arguments")
+    return REPORTS[name], payload.get("date") or "yesterday", [str(a) for a in argv]
+
+
+def handle_report(payload: Dict[str, Any]) -> Dict[str, Any]:
+    report, date, argv = _report_request(payload)
+    return report(date, argv, bool(payload.get("reasoner", False)))
+
+
+def handle_report_stream(payload: Dict[str, Any], emit: Callable[[str, Any], None]) -> Dict[str, Any]:
+    """Like /report, but the reasoner report is sent as `delta` events while it is generated."""
+    report, date, argv = _report_request(payload)
+    return report(date, argv, bool(payload.get("reasoner", True)), on_delta=lambda text: emit("delta", {"text": text}))
+
+
+def handle_reload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    dm = DataManager()
+    reloaded = dm.reload(force=bool(payload.get("force", False)))
+    return {"reloaded": reloaded, "version": dm.latest_version}
+
+
+ROUTES: Dict[tuple, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    ("GET", "/health"): handle_health,
+    ("POST", "/query"): handle_query,
+    ("POST", "/plan"): handle_plan,
+    ("POST", "/execute"): handle_execute,
+    ("POST", "/report"): handle_report,
+    ("POST", "/reload"): handle_reload,
+}
+
+
+# Server-sent-event routes: the handler gets an emit(event, data) callback and its
+# return value is sent as the final `result` event
+STREAM_ROUTES: Dict[tuple, Callable[[Dict[str, Any], Callable[[str, Any], None]], Dict[str, Any]]] = {
+    ("POST", "/report/stream"): handle_report_stream,
+}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False, cls=ResultEncoder).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str) -> None:
+        # Always drain the body so a kept-alive connection stays in sync
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        route = (method, self.path.split("?", 1)[0])
+        if route in STREAM_ROUTES:
+            self._dispatch_stream(STREAM_ROUTES[route], raw)
+            return
+        handler = ROUTES.get(route)
+        if handler is None:
+            self._send(404, {"error": f"No route for {method} {self.path}"})
+            return
+        try:
+            payload = json.loads(raw) if raw else {}
+            if not isinstance(payload, dict):
+                raise ServiceError("Request body must be a JSON object")
+            t0 = time.perf_counter()
+            # In-flight requests keep the data version they started on across reloads
+            with DataManager().pinned():
+                body = handler(payload)
+            body["elapsed_sec"] = round(time.perf_counter() - t0, 4)
+            self._send(200, body)
+        except (ServiceError, json.JSONDecodeError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            traceback.print_exc()
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _dispatch_stream(self, handler, raw: bytes) -> None:
+        try:
+            payload = json.loads(raw) if raw else {}
+            if not isinstance(payload, dict):
+                raise ServiceError("Request body must be a JSON object")
+        except (ServiceError, json.JSONDecodeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        connected = True
+
+        def emit(event: str, data: Any) -> None:
+            nonlocal connected
+            if not connected:
+                return
+            body = json.dumps(data, ensure_ascii=False, cls=ResultEncoder)
+            chunk = f"event: {event}\ndata: {body}\n\n".encode("utf-8")
+            try:
+                self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; finish the report anyway and drop the output
+                connected = False
+
+        t0 = time.perf_counter()
+        try:
+            with DataManager().pinned():
+                body = handler(payload, emit)
+            body["elapsed_sec"] = round(time.perf_counter() - t0, 4)
+            emit("result", body)
+        except ServiceError as e:
+            emit("error", {"error": str(e)})
+        except Exception as e:
+            traceback.print_exc()
+            emit("error", {"error": f"{type(e).__name__}: {e}"})
+        if connected:
+            try:
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        if not connected:
+            self.close_connection = True
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Unix-socket peers have no (host, port) address
+        peer = self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+        sys.stderr.write(f"[{self.log_date_time_string()}] {peer} {format % args}\n")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        socketserver.UnixStreamServer.server_bind(self)
+        # BaseHTTPRequestHandler reads these for the Server header / logs
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def warm_up() -> None:
+    """Load the data, build the derived caches, compile the graph and build the agents before serving."""
+    t0 = time.perf_counter()
+    dm = DataManager()
+    dm.warm()
+    dm.load_business_definition()
+    get_execution_graph()
+    get_query_agent()
+    get_planning_agent()
+    print(f"🔥 Warm-up finished in {time.perf_counter() - t0:.2f}s")
+
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, ServiceHandler)
+    return ThreadingHTTPServer((host, port), ServiceHandler)
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", type=str, default=DEFAULT_HOST)
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--socket", type=str, help="Serve on this Unix socket path instead of TCP")
+    p.add_argument("--no-warm-up", action="store_true", help="Load data lazily on the first request")
+    p.add_argument("--watch", type=float, default=0.0, help="Check the source files every N seconds and hot-reload on change (0: off)")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    if not args.no_warm_up:
+        warm_up()
+    if args.watch > 0:
+        DataManager().start_watcher(args.watch)
+    server = make_server(args.host, args.port, args.socket)
+    where = f"unix://{args.socket}" if args.socket else f"http://{args.host}:{args.port}"
+    print(f"🚀 BI analysis service listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nBye! 👋")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import pandas as pd
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agents.query_agent import QueryAgent
+from pipelines.client import call
 
 def display_result(result):
     print("\n--- Final Result ---")
@@ -135,8 +136,12 @@ def run_query_pipeline(query):
     print(f"\n🚀 Processing: '{query}'")
     
     try:
-        agent = QueryAgent()
-        result = agent.run(query)
+        if os.environ.get("BI_SERVICE_URL"):
+            # A resident service (pipelines/serve.py) already holds the data warm
+            result = call("/query", {"query": query})["result"]
+        else:
+            agent = QueryAgent()
+            result = agent.run(query)
         display_result(result)
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -13,8 +13,9 @@ from typing import List, Dict, Any
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.execution_graph import build_execution_graph
+from agents.execution_graph import get_execution_graph
 from agents.suggestion_agent import SuggestionAgent
+from runtime.trajectory import lock_trajectory
 
 
 def _parse_args() -> argparse.Namespace:
@@ -22,6 +23,10 @@ def _parse_args() -> argparse.Namespace:
     p.add_argument("--date", type=str, help="Single date to analyze (YYYY-MM-DD or 'yesterday')")
     p.add_argument("--start", type=str, help="Start date for range analysis (YYYY-MM-DD)")
     p.add_argument("--end", type=str, help="End date for range analysis (YYYY-MM-DD)")
+    p.add_argument("--per-day", action="store_true", help="Run the full execution graph for each day of a range instead of the vectorized trajectory")
+    p.add_argument("--suggest", action="store_true", help="Generate Suggestion Agent advice for medium/high-risk days of a range (concurrent LLM calls)")
+    p.add_argument("--suggest-concurrency", type=int, default=4, help="Max concurrent suggestion calls for --suggest")
+    p.add_argument("--suggest-rate", type=float, default=None, help="Max suggestion calls started per second for --suggest")
     args = p.parse_args()
     
     # Default to yesterday if nothing provided
@@ -59,7 +64,7 @@ def analyze_point(target_date_str: str) -> Dict[str, Any]:
 
     print(f"\n🔍 Analyzing Date: {date_range} (History Baseline: {history_range_str})")
 
-    app = build_execution_graph()
+    app = get_execution_graph()
 
     dsl_sequence = [
         {
@@ -193,7 +198,8 @@ def generate_assessment(signals: List[Dict], date_str: str, verbose: bool = True
             suggestions = agent.generate_suggestions(
                 risk_level=level,
                 risk_factors=reasons,
-                analysis_results=signals 
+                analysis_results=signals,
+                single_shot=True
             )
             print(suggestions)
             
@@ -206,24 +212,40 @@ def generate_assessment(signals: List[Dict], date_str: str, verbose: bool = True
     }
 
 
-def analyze_range(start_date: str, end_date: str):
+def analyze_range(
+    start_date: str,
+    end_date: str,
+    per_day: bool = False,
+    suggest: bool = False,
+    suggest_concurrency: int = 4,
+    suggest_rate: float = None,
+):
     print(f"🚀 Starting Trajectory Analysis: {start_date} to {end_date}")
     
-    s = pd.to_datetime(start_date)
-    e = pd.to_datetime(end_date)
-    
-    dates = pd.date_range(start=s, end=e, freq='D')
-    
     trajectory = []
+    signals_by_date = {}
     
-    for d in dates:
-        d_str = d.strftime("%Y-%m-%d")
-        state = analyze_point(d_str)
+    # All days at once from daily arrays; None means fall back to one graph run per day
+    days = None if per_day else lock_trajectory(start_date, end_date)
+    if days is not None:
+        for day in days:
+            signals_by_date[day["date"]] = day["signals"]
+            trajectory.append(generate_assessment(day["signals"], day["date"], verbose=False))
+    else:
+        s = pd.to_datetime(start_date)
+        e = pd.to_datetime(end_date)
         
-        # Print concise result for each day
-        print(f"Processing {d_str}...", end="\r")
-        assessment = generate_assessment(state["signals"], d_str, verbose=False)
-        trajectory.append(assessment)
+        dates = pd.date_range(start=s, end=e, freq='D')
+        
+        for d in dates:
+            d_str = d.strftime("%Y-%m-%d")
+            state = analyze_point(d_str)
+            
+            # Print concise result for each day
+            print(f"Processing {d_str}...", end="\r")
+            signals_by_date[d_str] = state["signals"]
+            assessment = generate_assessment(state["signals"], d_str, verbose=False)
+            trajectory.append(assessment)
         
     # Summary of trajectory
     print("\n" + "="*50)
@@ -244,13 +266,35 @@ def analyze_range(start_date: str, end_date: str):
             
     if not high_risk_days and not med_risk_days:
         print("\n✅ 区间内表现平稳，无显著异常。")
+    elif suggest:
+        # One single-shot call per risky day, issued concurrently instead of two serial round trips each
+        risky = [t for t in trajectory if t['risk_level'] in ('中', '高')]
+        print(f"\n🤖 分析建议 (Suggestion Agent, {len(risky)} 天):")
+        suggestions = SuggestionAgent().generate_suggestions_batch(
+            [(t['risk_level'], t['reasons'], signals_by_date.get(t['date'])) for t in risky],
+            concurrency=suggest_concurrency,
+            rate_per_sec=suggest_rate,
+        )
+        for t, text in zip(risky, suggestions):
+            t['suggestions'] = text
+            print(f"\n{t['icon']} {t['date']}:")
+            print(text)
+
+    return trajectory
 
 
 def main() -> None:
     args = _parse_args()
     
     if args.start and args.end:
-        analyze_range(args.start, args.end)
+        analyze_range(
+            args.start,
+            args.end,
+            per_day=args.per_day,
+            suggest=args.suggest,
+            suggest_concurrency=args.suggest_concurrency,
+            suggest_rate=args.suggest_rate,
+        )
     elif args.date:
         state = analyze_point(args.date)
         print("\nFinal results:")
@@ -6,16 +6,27 @@
 import sys
 import os
 import argparse
-import json
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import time
-from typing import List, Dict, Any, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.execution_graph import build_execution_graph
+from agents.execution_graph import get_execution_graph
+from runtime.trajectory import lock_trajectory
+from runtime.parallel import parallel_map
+from runtime.llm_client import LLMError, chat_text, console_printer, offline_api_key
+from runtime.payload import (
+    REASONER_TOKEN_BUDGET,
+    dump_payload,
+    lock_daily_payload,
+    lock_range_payload,
+    range_overview,
+    round_floats,
+    segment_digests,
+    weekly_digests,
+)
 
 def _load_api_key():
     env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
@@ -29,13 +40,21 @@ def _load_api_key():
                             return line.split('=', 1)[1].strip()
     return None
 
-API_KEY = _load_api_key()
+# Replaying from the response cache (LLM_CACHE=replay) needs no key
+API_KEY = _load_api_key() or offline_api_key()
 
 def _parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument("--date", type=str, help="Single date to analyze (YYYY-MM-DD or 'yesterday')")
     p.add_argument("--start", type=str, help="Start date for range analysis (YYYY-MM-DD)")
     p.add_argument("--end", type=str, help="End date for range analysis (YYYY-MM-DD)")
+    p.add_argument("--per-day", action="store_true", help="Run the full execution graph for each day of a range instead of the vectorized trajectory")
+    p.add_argument("--workers", type=int, default=1, help="Worker processes for --per-day range analysis")
+    p.add_argument("--no-stream", action="store_true", help="Wait for the whole reasoner report instead of streaming it")
+    p.add_argument("--summary", choices=["auto", "flat", "hierarchical"], default="auto",
+                   help="Range summary mode: one call over all days, or weekly digests merged by a final call (auto: hierarchical when the days exceed the budget)")
+    p.add_argument("--summary-budget", type=int, default=REASONER_TOKEN_BUDGET, help="Token budget per reasoner call for the range summary")
+    p.add_argument("--summary-concurrency", type=int, default=4, help="Parallel digest calls in hierarchical range summaries")
     args = p.parse_args()
     
     if not args.date and not args.start:
@@ -93,22 +112,30 @@ def calculate_risk(signals: List[Dict]) -> Dict[str, Any]:
         "icon": icon
     }
 
-def call_deepseek_reasoner(context_data: Dict[str, Any], prompt_type: str = "daily") -> Tuple[str, Dict[str, Any]]:
+def call_deepseek_reasoner(
+    context_data: Dict[str, Any],
+    prompt_type: str = "daily",
+    on_delta: Optional[Callable[[str], None]] = None,
+    max_tokens: int = REASONER_TOKEN_BUDGET,
+) -> Tuple[str, Dict[str, Any]]:
     """
     调用 DeepSeek Reasoner 模型生成分析报告
+    prompt_type: daily（每日诊断）/ range（区间综述）/ range_digest（长区间的分段周度摘要）
+    on_delta: 传入时以流式返回，报告片段生成即回调（控制台或服务客户端逐步渲染）
     Returns: (content, metrics)
     """
     if not API_KEY:
         return "⚠️ Error: DeepSeek API Key not found in .env", {}
 
-    base_url = "https://api.deepseek.com"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    # 将复杂对象转换为 JSON 字符串以便 LLM 理解
-    data_str = json.dumps(context_data, ensure_ascii=False, indent=2, default=str)
+    # 只保留提示词引用的字段（风险评估、同环比、结构头部、分布定位、信号），紧凑 JSON 并控制 token 预算
+    if prompt_type == "daily":
+        compact = lock_daily_payload(context_data)
+    elif "range_data" in context_data:
+        compact = lock_range_payload(context_data["range_data"])
+    else:
+        # 周度汇总 / 分段摘要已在本地压缩
+        compact = round_floats(context_data)
+    data_str, payload_tokens = dump_payload(compact, max_tokens=max_tokens)
 
     if prompt_type == "daily":
         system_prompt = """你是一位“数据侦探”。请根据提供的经营数据（风险评估、核心指标、同环比、异常信号、结构拆解、分布特征），生成一份**极简**且**高密度**的【每日经营诊断】。
@@ -135,14 +162,23 @@ def call_deepseek_reasoner(context_data: Dict[str, Any], prompt_type: str = "dai
 **注意**：
 - 替换模板中的 {...} 为实际数据。
 - 如果 risk_level 为 High，请使用严肃警示语气。
+"""
+    elif prompt_type == "range_digest":
+        system_prompt = """你是一位“趋势捕手”。以下是长区间中一段连续周的周度汇总（weekly：周总量、日均、最高/最低日、异常日及其异常信号）。请输出这一段的**要点摘要**，供后续合并为区间综述。
+
+**要求：**
+1. 不超过 150 字，不要标题，不要客套。
+2. 依次写：该段趋势形态（引用周总量变化）、最高/最低日、异常日（日期 + 信号，引用 Z-Score 或差异评分）。
+3. 若无异常日，写“该段无显著异常”。
 """
     else: # range summary
-        system_prompt = """你是一位“趋势捕手”。请根据区间内的每日核心指标与异常信号，生成一份**高密度**的【区间经营轨迹综述】。
+        system_prompt = """你是一位“趋势捕手”。请根据区间内的每日核心指标与异常信号（长区间时为区间总览 overview、周度汇总 weekly 及分段摘要 segments），生成一份**高密度**的【区间经营轨迹综述】。
 
 **原则：**
 1. **宏观视角**：关注整体趋势（上升/下降/震荡），而非每日流水账。
 2. **异常驱动**：重点复盘区间内的“异常点”（高风险日期、突变点）。
 3. **极简输出**：拒绝废话。
+4. **缺失说明**：标记 unavailable 的分段没有摘要，只依据 weekly 总量描述，并注明该时段细节缺失。
 
 **输出格式：**
 
@@ -166,33 +202,23 @@ def call_deepseek_reasoner(context_data: Dict[str, Any], prompt_type: str = "dai
     payload = {
         "model": "deepseek-reasoner",
         "messages": messages,
-        "stream": False
+        "stream": on_delta is not None
     }
 
     try:
         print("🤔 DeepSeek Reasoner is thinking...", end="", flush=True)
-        start_time = time.time()
-        resp = requests.post(f"{base_url}/chat/completions", json=payload, headers=headers)
-        end_time = time.time()
-        elapsed_sec = end_time - start_time
-        print(f" Done. ({elapsed_sec:.2f}s)")
-        
-        if resp.status_code != 200:
-            return f"Error from API: {resp.text}", {}
-            
-        data = resp.json()
-        metrics = {
-            "elapsed_sec": elapsed_sec,
-            "usage": data.get("usage", {})
-        }
-        
-        if "choices" in data and data["choices"]:
-            choice = data["choices"][0]
-            # 可以选择性地打印 reasoning_content
-            # reasoning = choice["message"].get("reasoning_content", "")
-            content = choice["message"].get("content", "")
-            return content, metrics
-        return "Error: No content in response.", metrics
+        try:
+            # With on_delta the report is streamed piece by piece as it is generated
+            content, metrics = chat_text(payload, API_KEY, on_delta=on_delta)
+        except LLMError as e:
+            print(" Failed.")
+            return f"Error from API: {e.body}", {}
+        metrics["payload_tokens"] = payload_tokens
+        if on_delta is None:
+            print(f" Done. ({metrics['elapsed_sec']:.2f}s)")
+        if not content:
+            return "Error: No content in response.", metrics
+        return content, metrics
     except Exception as e:
         return f"Error calling API: {str(e)}", {}
 
@@ -220,7 +246,7 @@ def analyze_point(target_date_str: str) -> Dict[str, Any]:
 
     print(f"\n🔍 Analyzing Date: {date_range} (History Baseline: {history_range_str})")
 
-    app = build_execution_graph()
+    app = get_execution_graph()
 
     # 定义与 yesterday_lock.py 相同的 DSL 序列
     dsl_sequence = [
@@ -323,13 +349,123 @@ def print_metrics(metrics: Dict[str, Any]):
     print("⏱️  性能统计 (Performance Metrics)")
     print("-"*30)
     print(f"⏳ 运行耗时: {elapsed:.2f} 秒")
+    if metrics.get("streamed"):
+        ttft = metrics.get("ttft_sec")
+        first = metrics.get("first_content_sec")
+        print(f"⚡ 首 token: {ttft:.2f} 秒" if ttft is not None else "⚡ 首 token: -")
+        print(f"📝 首段正文: {first:.2f} 秒" if first is not None else "📝 首段正文: -")
+        if metrics.get("interrupted"):
+            print(f"⚠️ 流式连接中断: {metrics.get('error', '')}")
+    if metrics.get("segments"):
+        print(f"🧩 分段摘要: {metrics['segments']} 段 ({metrics.get('segment_elapsed_sec', 0):.2f} 秒)")
+    if metrics.get("failed_segments"):
+        print(f"⚠️ 分段摘要失败（已标记为不可用）: {', '.join(metrics['failed_segments'])}")
     print(f"🎫 Token 开销:")
+    if "payload_tokens" in metrics:
+        print(f"   - Payload Tokens (est.): {metrics['payload_tokens']}")
     print(f"   - Input Tokens: {usage.get('prompt_tokens', 0)}")
     print(f"   - Output Tokens: {usage.get('completion_tokens', 0)}")
     print(f"   - Total Tokens: {usage.get('total_tokens', 0)}")
     print("-"*30 + "\n")
 
-def analyze_range(start_date: str, end_date: str):
+def _range_day(d_str: str) -> Dict[str, Any]:
+    """One day of a per-day range run, reduced to what the range summary needs."""
+    context_data = analyze_point(d_str)
+    print(f"Processing {d_str}...", flush=True)
+    # 提取关键指标供区间分析使用
+    results = context_data.get("results", {})
+    return {
+        "date": d_str,
+        "core_metric": results.get("baseline_query", {}),
+        "mom": results.get("short_term_trend"),
+        "wow": results.get("cycle_comparison"),
+        "signals": context_data.get("signals", [])
+    }
+
+SEGMENT_UNAVAILABLE = "（该分段摘要生成失败，仅有 weekly 周度总量可参考）"
+
+
+def _failed(text: str, metrics: Dict[str, Any]) -> bool:
+    """call_deepseek_reasoner 以错误文本（metrics 多为空）表示调用失败"""
+    return not metrics or text.startswith(("Error", "⚠️ Error"))
+
+
+def summarize_range(
+    daily_summaries: List[Dict[str, Any]],
+    mode: str = "auto",
+    max_tokens: int = REASONER_TOKEN_BUDGET,
+    concurrency: int = 4,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    区间综述。flat：全部日数据一次调用；hierarchical：本地聚合为周度汇总，超出预算时
+    先按预算分段并行生成分段摘要，再由一次合并调用输出综述。auto：日数据超出预算时分层。
+    """
+    days = lock_range_payload(daily_summaries)["range_data"]
+    if mode == "auto":
+        _, flat_tokens = dump_payload({"range_data": days})
+        mode = "flat" if flat_tokens <= max_tokens else "hierarchical"
+    if mode == "flat":
+        return call_deepseek_reasoner({"range_data": daily_summaries}, prompt_type="range", on_delta=on_delta, max_tokens=max_tokens)
+
+    digests = weekly_digests(days)
+    overview = range_overview(days)
+    # 总览与分段摘要之外留给周度数据的预算
+    segments = segment_digests(digests, max(max_tokens - dump_payload(overview)[1], max_tokens // 2))
+    if len(segments) == 1:
+        context = {"overview": overview, "weekly": digests}
+        return call_deepseek_reasoner(context, prompt_type="range", on_delta=on_delta, max_tokens=max_tokens)
+
+    def digest(seg: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        text, m = call_deepseek_reasoner({"weekly": seg}, prompt_type="range_digest", max_tokens=max_tokens)
+        if _failed(text, m):
+            # 单段失败重试一次
+            text, m = call_deepseek_reasoner({"weekly": seg}, prompt_type="range_digest", max_tokens=max_tokens)
+        return text, m
+
+    print(f"🧩 {len(digests)} weeks in {len(segments)} segments, digesting...", flush=True)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        parts = list(pool.map(digest, segments))
+    if all(_failed(text, m) for text, m in parts):
+        return parts[0][0], {}
+
+    labels = [f"{seg[0]['week'].split('~')[0]}~{seg[-1]['week'].split('~')[-1]}" for seg in segments]
+    failed = [label for label, (text, m) in zip(labels, parts) if _failed(text, m)]
+    context = {
+        "overview": overview,
+        # 合并调用只看周总量走势，细节在分段摘要里
+        "weekly": [{k: w[k] for k in ("week", "total", "mean") if k in w} for w in digests],
+        "segments": [
+            {"weeks": label, "summary": SEGMENT_UNAVAILABLE, "unavailable": True} if _failed(text, m)
+            else {"weeks": label, "summary": text}
+            for label, (text, m) in zip(labels, parts)
+        ],
+    }
+    report, metrics = call_deepseek_reasoner(context, prompt_type="range", on_delta=on_delta, max_tokens=max_tokens)
+    if metrics:
+        usage = dict(metrics.get("usage") or {})
+        for _, m in parts:
+            for k, v in ((m or {}).get("usage") or {}).items():
+                if isinstance(v, (int, float)):
+                    usage[k] = usage.get(k, 0) + v
+        metrics["usage"] = usage
+        metrics["segments"] = len(segments)
+        if failed:
+            metrics["failed_segments"] = failed
+        metrics["segment_elapsed_sec"] = max(float((m or {}).get("elapsed_sec", 0)) for _, m in parts)
+        metrics["elapsed_sec"] = float(metrics.get("elapsed_sec", 0)) + metrics["segment_elapsed_sec"]
+    return report, metrics
+
+def analyze_range(
+    start_date: str,
+    end_date: str,
+    per_day: bool = False,
+    workers: int = 1,
+    stream: bool = False,
+    summary: str = "auto",
+    summary_budget: int = REASONER_TOKEN_BUDGET,
+    summary_concurrency: int = 4,
+):
     print(f"🚀 Starting Reasoner Trajectory Analysis: {start_date} to {end_date}")
     
     s = pd.to_datetime(start_date)
@@ -338,43 +474,72 @@ def analyze_range(start_date: str, end_date: str):
     
     daily_summaries = []
     
-    for d in dates:
-        d_str = d.strftime("%Y-%m-%d")
-        context_data = analyze_point(d_str)
-        
-        # 仅收集每日核心数据，不生成每日简报
-        print(f"Processing {d_str}...", flush=True)
-        
-        # 提取关键指标供区间分析使用
-        baseline = context_data.get("results", {}).get("baseline_query", {})
-        daily_summaries.append({
-            "date": d_str,
-            "core_metric": baseline,
-            "signals": context_data.get("signals", [])
-        })
+    # All days at once from daily arrays; None means fall back to one graph run per day
+    days = None if per_day else lock_trajectory(start_date, end_date)
+    if days is not None:
+        for day in days:
+            daily_summaries.append({
+                "date": day["date"],
+                "core_metric": day["baseline_query"],
+                "mom": day["short_term_trend"],
+                "wow": day["cycle_comparison"],
+                "signals": day["signals"]
+            })
+    else:
+        # 仅收集每日核心数据，不生成每日简报；多进程时按日期顺序汇总
+        daily_summaries = parallel_map(_range_day, [d.strftime("%Y-%m-%d") for d in dates], workers)
 
     # 最后生成区间汇总
     print("\n📚 Generating Range Summary...")
-    range_report, metrics = call_deepseek_reasoner({"range_data": daily_summaries}, prompt_type="range")
-    print("\n" + "="*50)
-    print(f"📅 区间轨迹深度综述 ({start_date} ~ {end_date})")
-    print("="*50)
-    print(range_report)
+    if stream:
+        print("\n" + "="*50)
+        print(f"📅 区间轨迹深度综述 ({start_date} ~ {end_date})")
+        print("="*50)
+        range_report, metrics = summarize_range(
+            daily_summaries, summary, summary_budget, summary_concurrency, on_delta=console_printer()
+        )
+        print()
+        if not metrics:
+            print(range_report)
+    else:
+        range_report, metrics = summarize_range(daily_summaries, summary, summary_budget, summary_concurrency)
+        print("\n" + "="*50)
+        print(f"📅 区间轨迹深度综述 ({start_date} ~ {end_date})")
+        print("="*50)
+        print(range_report)
     print_metrics(metrics)
 
 def main() -> None:
     args = _parse_args()
     
     if args.start and args.end:
-        analyze_range(args.start, args.end)
+        analyze_range(
+            args.start,
+            args.end,
+            per_day=args.per_day,
+            workers=args.workers,
+            stream=not args.no_stream,
+            summary=args.summary,
+            summary_budget=args.summary_budget,
+            summary_concurrency=args.summary_concurrency,
+        )
     elif args.date:
         context_data = analyze_point(args.date)
         print(f"\n📝 Generating Report for {args.date}...")
-        report, metrics = call_deepseek_reasoner(context_data, prompt_type="daily")
-        print("\n" + "="*50)
-        print(f"📊 DeepSeek Reasoner Analysis Report ({args.date})")
-        print("="*50)
-        print(report)
+        if args.no_stream:
+            report, metrics = call_deepseek_reasoner(context_data, prompt_type="daily")
+            print("\n" + "="*50)
+            print(f"📊 DeepSeek Reasoner Analysis Report ({args.date})")
+            print("="*50)
+            print(report)
+        else:
+            print("\n" + "="*50)
+            print(f"📊 DeepSeek Reasoner Analysis Report ({args.date})")
+            print("="*50)
+            report, metrics = call_deepseek_reasoner(context_data, prompt_type="daily", on_delta=console_printer())
+            print()
+            if not metrics:
+                print(report)
         print_metrics(metrics)
     else:
         print("Error: Please provide --date or --start and --end")
@@ -8,26 +8,15 @@
 import os
 import sys
 import argparse
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-import numpy as np
 import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.execution_graph import build_execution_graph
+from agents.execution_graph import get_execution_graph
 from runtime.context import DataManager
-
-
-def _safe_rate(n: float, d: float) -> float:
-    return float(n / d) if d and d > 0 else 0.0
-
-
-def _percent_rank(values: np.ndarray, x: float) -> float:
-    n = int(values.size)
-    if n == 0:
-        return 0.0
-    return float((values <= x).mean())
+from runtime.assign_stats import safe_rate
 
 
 def _level_from_percentile(p: float) -> str:
@@ -48,171 +37,159 @@ def _risk_level_from_flags(
     return "低"
 
 
-def compute_volume_stats(
+def compute_volume_stats_range(
     dm: DataManager,
     col: str,
-    target_date: pd.Timestamp,
-    history_start: pd.Timestamp,
-    history_end: pd.Timestamp,
-) -> dict:
+    target_dates,
+    history_starts,
+    history_ends,
+) -> List[dict]:
+    """Volume stats of `col` for many target days in one pass over the daily assign arrays (empty when the column is missing)."""
     df = dm.get_assign_data()
-    if df.empty or "assign_date" not in df.columns:
-        return {
-            "value": 0.0,
-            "percentile": 0.0,
-            "position": "低",
-            "n_days": 0,
-            "below_hist_min": False,
-            "above_hist_max": False,
-        }
-
-    df = df.copy()
-    df["assign_date"] = pd.to_datetime(df["assign_date"], errors="coerce")
-    df = df[df["assign_date"].notna()]
-
+    stats = dm.get_assign_stats()
+    if df.empty or "assign_date" not in df.columns or not stats.has(col):
+        return [
+            {
+                "value": 0.0,
+                "percentile": 0.0,
+                "position": "低",
+                "n_days": 0,
+                "below_hist_min": False,
+                "above_hist_max": False,
+            }
+            for _ in target_dates
+        ]
+
+    daily = stats.column(col)
     # Target value
-    d_target = df[df["assign_date"].dt.normalize() == target_date.normalize()]
-    value = float(d_target[col].sum()) if col in d_target.columns else 0.0
-
+    values = stats.at(daily, target_dates)
     # History values
-    df_hist = df[(df["assign_date"] >= history_start) & (df["assign_date"] <= history_end)]
-    if df_hist.empty or col not in df_hist.columns:
-        hist_values = np.array([], dtype=float)
-    else:
-        daily = df_hist.groupby(df_hist["assign_date"].dt.normalize())[col].sum()
-        hist_values = daily.fillna(0.0).astype(float).to_numpy()
-
-    percentile = _percent_rank(hist_values, value)
-    n_days = int(hist_values.size)
-    hist_min = float(np.min(hist_values)) if n_days > 0 else 0.0
-    hist_max = float(np.max(hist_values)) if n_days > 0 else 0.0
-    below_hist_min = bool(n_days > 0 and value < hist_min)
-    above_hist_max = bool(n_days > 0 and value > hist_max)
-    position = _level_from_percentile(percentile)
-
-    return {
-        "value": value,
-        "percentile": percentile,
-        "n_days": n_days,
-        "below_hist_min": below_hist_min,
-        "above_hist_max": above_hist_max,
-        "position": position,
-    }
-
-
-def compute_rate_stats(
+    hist = stats.window_stats(daily, values, history_starts, history_ends)
+
+    out = []
+    for k in range(len(values)):
+        value = float(values[k])
+        n_days = int(hist["n_days"][k])
+        percentile = float(hist["percentile"][k])
+        hist_min = float(hist["min"][k])
+        hist_max = float(hist["max"][k])
+        out.append({
+            "value": value,
+            "percentile": percentile,
+            "n_days": n_days,
+            "below_hist_min": bool(n_days > 0 and value < hist_min),
+            "above_hist_max": bool(n_days > 0 and value > hist_max),
+            "position": _level_from_percentile(percentile),
+        })
+    return out
+
+
+def compute_rate_stats_range(
     dm: DataManager,
     numerator_col: str,
     denominator_col: str,
-    target_date: pd.Timestamp,
-    history_start: pd.Timestamp,
-    history_end: pd.Timestamp,
+    target_dates,
+    history_starts,
+    history_ends,
     n_min: float,
     z_high: float,
     z_mid: float,
     cv_low: float,
-) -> dict:
+) -> List[dict]:
+    """Rate stats for many target days in one pass over the daily assign arrays (no data when either column is missing)."""
     df = dm.get_assign_data()
-    if df.empty or "assign_date" not in df.columns:
-        return {
-            "value": 0.0,
-            "leads": 0.0,
-            "mean": 0.0,
-            "std": 0.0,
-            "z": 0.0,
-            "cv": 0.0,
-            "percentile": 0.0,
-            "position": "低",
-            "anomaly_detected": False,
-            "flag": "无数据",
-            "history_window": {"start": str(history_start.date()), "end": str(history_end.date())},
-        }
-
-    df = df.copy()
-    df["assign_date"] = pd.to_datetime(df["assign_date"], errors="coerce")
-    df = df[df["assign_date"].notna()]
-
-    d_target = df[df["assign_date"].dt.normalize() == target_date.normalize()]
-    leads = float(d_target[denominator_col].sum()) if denominator_col in d_target.columns else 0.0
-    num = float(d_target[numerator_col].sum()) if numerator_col in d_target.columns else 0.0
-    value = _safe_rate(num, leads)
-
-    df_hist = df[(df["assign_date"] >= history_start) & (df["assign_date"] <= history_end)]
-    if (
-        df_hist.empty
-        or numerator_col not in df_hist.columns
-        or denominator_col not in df_hist.columns
-        or "assign_date" not in df_hist.columns
-    ):
-        hist_values = np.array([], dtype=float)
-    else:
-        daily = (
-            df_hist.groupby(df_hist["assign_date"].dt.normalize())[[numerator_col, denominator_col]]
-            .sum()
-            .reset_index()
-        )
-        denom = daily[denominator_col].replace(0, np.nan)
-        hist_values = (daily[numerator_col] / denom).fillna(0.0).astype(float).to_numpy()
-
-    mean = float(np.mean(hist_values)) if hist_values.size > 0 else 0.0
-    std = float(np.std(hist_values, ddof=1)) if hist_values.size > 1 else 0.0
-
-    if std > 0:
-        z = float((value - mean) / std)
-    else:
-        z = 0.0
-
-    if mean != 0:
-        cv = float(abs(std / mean))
-    else:
-        cv = float("inf") if std > 0 else 0.0
-
-    percentile = _percent_rank(hist_values, value)
-    n_days = int(hist_values.size)
-    hist_min = float(np.min(hist_values)) if n_days > 0 else 0.0
-    hist_max = float(np.max(hist_values)) if n_days > 0 else 0.0
-    below_hist_min = bool(n_days > 0 and value < hist_min)
-    above_hist_max = bool(n_days > 0 and value > hist_max)
-    percentile_resolution = float(1.0 / n_days) if n_days > 0 else 0.0
-    position = _level_from_percentile(percentile)
-
-    anomaly_detected = False
-    flag = "正常波动"
-    if leads < n_min:
-        flag = "样本不足"
-    else:
-        abs_z = abs(z)
-        if abs_z >= z_high and cv < cv_low:
-            anomaly_detected = True
-            flag = "结构性异常"
-        elif abs_z >= z_high and cv >= cv_low:
-            anomaly_detected = True
-            flag = "高波动异常"
-        elif abs_z >= z_mid:
-            anomaly_detected = True
-            flag = "趋势性偏离"
-
-    return {
-        "value": value,
-        "leads": leads,
-        "mean": mean,
-        "std": std,
-        "z": z,
-        "cv": cv,
-        "percentile_method": "empirical_cdf",
-        "percentile": percentile,
-        "n_days": n_days,
-        "hist_min": hist_min,
-        "hist_max": hist_max,
-        "below_hist_min": below_hist_min,
-        "above_hist_max": above_hist_max,
-        "percentile_resolution": percentile_resolution,
-        "position": position,
-        "anomaly_detected": anomaly_detected,
-        "flag": flag,
-        "thresholds": {"n_min": n_min, "z_high": z_high, "z_mid": z_mid, "cv_low": cv_low},
-        "history_window": {"start": str(history_start.date()), "end": str(history_end.date())},
-    }
+    stats = dm.get_assign_stats()
+    if df.empty or "assign_date" not in df.columns or not stats.has(numerator_col, denominator_col):
+        return [
+            {
+                "value": 0.0,
+                "leads": 0.0,
+                "mean": 0.0,
+                "std": 0.0,
+                "z": 0.0,
+                "cv": 0.0,
+                "percentile": 0.0,
+                "position": "低",
+                "anomaly_detected": False,
+                "flag": "无数据",
+                "history_window": {"start": str(pd.Timestamp(hs).date()), "end": str(pd.Timestamp(he).date())},
+            }
+            for hs, he in zip(history_starts, history_ends)
+        ]
+
+    leads_all = stats.at(stats.column(denominator_col), target_dates)
+    values = safe_rate(stats.at(stats.column(numerator_col), target_dates), leads_all)
+    # Per-day rates over history days
+    daily_rates = stats.rate(numerator_col, denominator_col)
+    hist = stats.window_stats(daily_rates, values, history_starts, history_ends)
+
+    out = []
+    for k in range(len(values)):
+        value = float(values[k])
+        leads = float(leads_all[k])
+        mean = float(hist["mean"][k])
+        std = float(hist["std"][k])
+
+        if std > 0:
+            z = float((value - mean) / std)
+        else:
+            z = 0.0
+
+        if mean != 0:
+            cv = float(abs(std / mean))
+        else:
+            cv = float("inf") if std > 0 else 0.0
+
+        percentile = float(hist["percentile"][k])
+        n_days = int(hist["n_days"][k])
+        hist_min = float(hist["min"][k])
+        hist_max = float(hist["max"][k])
+        below_hist_min = bool(n_days > 0 and value < hist_min)
+        above_hist_max = bool(n_days > 0 and value > hist_max)
+        percentile_resolution = float(1.0 / n_days) if n_days > 0 else 0.0
+        position = _level_from_percentile(percentile)
+
+        anomaly_detected = False
+        flag = "正常波动"
+        if leads < n_min:
+            flag = "样本不足"
+        else:
+            abs_z = abs(z)
+            if abs_z >= z_high and cv < cv_low:
+                anomaly_detected = True
+                flag = "结构性异常"
+            elif abs_z >= z_high and cv >= cv_low:
+                anomaly_detected = True
+                flag = "高波动异常"
+            elif abs_z >= z_mid:
+                anomaly_detected = True
+                flag = "趋势性偏离"
+
+        out.append({
+            "value": value,
+            "leads": leads,
+            "mean": mean,
+            "std": std,
+            "z": z,
+            "cv": cv,
+            "percentile_method": "empirical_cdf",
+            "percentile": percentile,
+            "n_days": n_days,
+            "hist_min": hist_min,
+            "hist_max": hist_max,
+            "below_hist_min": below_hist_min,
+            "above_hist_max": above_hist_max,
+            "percentile_resolution": percentile_resolution,
+            "position": position,
+            "anomaly_detected": anomaly_detected,
+            "flag": flag,
+            "thresholds": {"n_min": n_min, "z_high": z_high, "z_mid": z_mid, "cv_low": cv_low},
+            "history_window": {
+                "start": str(pd.Timestamp(history_starts[k]).date()),
+                "end": str(pd.Timestamp(history_ends[k]).date()),
+            },
+        })
+    return out
 
 
 def _format_percentile(stats: dict) -> str:
@@ -228,7 +205,7 @@ def _format_percentile(stats: dict) -> str:
         return f"P>{(1.0 - 1.0 / n) * 100:.1f}（高于历史最大值）"
     return f"P{p * 100:.1f}"
 
-def _parse_args() -> argparse.Namespace:
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument("--date", type=str, help="Single date to analyze (YYYY-MM-DD or 'yesterday')")
     p.add_argument("--start", type=str, help="Start date for range analysis (YYYY-MM-DD)")
@@ -240,8 +217,9 @@ def _parse_args() -> argparse.Namespace:
     p.add_argument("--z-threshold", type=float, default=2.0)
     p.add_argument("--z-mid", type=float, default=1.2)
     p.add_argument("--cv-threshold", type=float, default=0.4)
+    p.add_argument("--per-day", action="store_true", help="Run the full execution graph for each day of a range instead of the vectorized trajectory")
     
-    args = p.parse_args()
+    args = p.parse_args(argv)
     
     if not args.date and not args.start:
         args.date = "yesterday"
@@ -249,6 +227,41 @@ def _parse_args() -> argparse.Namespace:
     return args
 
 
+def _rate_stats_for_days(dm: DataManager, target_dates, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """The rate_stats result block for each target day, computed in one pass per metric."""
+    target_dates = [pd.Timestamp(d).normalize() for d in target_dates]
+    history_starts = [d - pd.Timedelta(days=int(args.history_start_days_ago)) for d in target_dates]
+    history_ends = [d - pd.Timedelta(days=int(args.history_end_days_ago)) for d in target_dates]
+    N_min = float(args.n_min)
+    z_high = float(args.z_threshold)
+    z_mid = float(args.z_mid)
+    cv_low = float(args.cv_threshold)
+
+    conversion = compute_rate_stats_range(
+        dm, "下发线索 7 日锁单数", "下发线索数", target_dates, history_starts, history_ends,
+        N_min, z_high, z_mid, cv_low,
+    )
+    test_drive = compute_rate_stats_range(
+        dm, "下发线索 7 日试驾数", "下发线索数", target_dates, history_starts, history_ends,
+        N_min, z_high, z_mid, cv_low,
+    )
+    leads = compute_volume_stats_range(dm, "下发线索数", target_dates, history_starts, history_ends)
+
+    return [
+        {
+            "history_window_days_ago": {
+                "start_days_ago": int(args.history_start_days_ago),
+                "end_days_ago": int(args.history_end_days_ago),
+            },
+            "params": {"N_min": N_min, "z_high": z_high, "z_mid": z_mid, "cv_low": cv_low},
+            "leads_stats": leads[k],
+            "7d_conversion_rate": conversion[k],
+            "7d_test_drive_rate": test_drive[k],
+        }
+        for k in range(len(target_dates))
+    ]
+
+
 def analyze_point(target_date_str: str, args: argparse.Namespace) -> Dict[str, Any]:
     dm = DataManager()
     today = pd.Timestamp.now().normalize()
@@ -267,12 +280,7 @@ def analyze_point(target_date_str: str, args: argparse.Namespace) -> Dict[str, A
 
     print(f"\n🔍 Analyzing Date: {date_range} (History Baseline: {history_range_str})")
 
-    N_min = float(args.n_min)
-    z_high = float(args.z_threshold)
-    z_mid = float(args.z_mid)
-    cv_low = float(args.cv_threshold)
-
-    app = build_execution_graph()
+    app = get_execution_graph()
     dsl_sequence = [
         {
             "id": "assign_leads_mom",
@@ -315,49 +323,10 @@ def analyze_point(target_date_str: str, args: argparse.Namespace) -> Dict[str, A
 
     final_state = app.invoke(initial_state)
 
-    conversion_stats = compute_rate_stats(
-        dm=dm,
-        numerator_col="下发线索 7 日锁单数",
-        denominator_col="下发线索数",
-        target_date=target_date,
-        history_start=history_start,
-        history_end=history_end,
-        n_min=N_min,
-        z_high=z_high,
-        z_mid=z_mid,
-        cv_low=cv_low,
-    )
-    test_drive_stats = compute_rate_stats(
-        dm=dm,
-        numerator_col="下发线索 7 日试驾数",
-        denominator_col="下发线索数",
-        target_date=target_date,
-        history_start=history_start,
-        history_end=history_end,
-        n_min=N_min,
-        z_high=z_high,
-        z_mid=z_mid,
-        cv_low=cv_low,
-    )
-
-    leads_stats = compute_volume_stats(
-        dm=dm,
-        col="下发线索数",
-        target_date=target_date,
-        history_start=history_start,
-        history_end=history_end,
-    )
-
-    final_state["results"]["rate_stats"] = {
-        "history_window_days_ago": {
-            "start_days_ago": int(args.history_start_days_ago),
-            "end_days_ago": int(args.history_end_days_ago),
-        },
-        "params": {"N_min": N_min, "z_high": z_high, "z_mid": z_mid, "cv_low": cv_low},
-        "leads_stats": leads_stats,
-        "7d_conversion_rate": conversion_stats,
-        "7d_test_drive_rate": test_drive_stats,
-    }
+    final_state["results"]["rate_stats"] = _rate_stats_for_days(dm, [target_date], args)[0]
+    leads_stats = final_state["results"]["rate_stats"]["leads_stats"]
+    conversion_stats = final_state["results"]["rate_stats"]["7d_conversion_rate"]
+    test_drive_stats = final_state["results"]["rate_stats"]["7d_test_drive_rate"]
 
     final_state["signals"].append(
         {
@@ -472,13 +441,19 @@ def analyze_range(start_date: str, end_date: str, args: argparse.Namespace):
     
     trajectory = []
     
-    for d in dates:
-        d_str = d.strftime("%Y-%m-%d")
-        state = analyze_point(d_str, args)
-        
-        # Print concise result for each day
-        assessment = generate_assessment(state, d_str, verbose=True)
-        trajectory.append(assessment)
+    if getattr(args, "per_day", False):
+        for d in dates:
+            d_str = d.strftime("%Y-%m-%d")
+            state = analyze_point(d_str, args)
+            
+            # Print concise result for each day
+            assessment = generate_assessment(state, d_str, verbose=True)
+            trajectory.append(assessment)
+    else:
+        # The assessment only reads rate_stats, so every day comes from one vectorized pass
+        for d, rate_stats in zip(dates, _rate_stats_for_days(DataManager(), dates, args)):
+            state = {"results": {"rate_stats": rate_stats}, "signals": []}
+            trajectory.append(generate_assessment(state, d.strftime("%Y-%m-%d"), verbose=True))
         
     # Summary of trajectory
     print("\n" + "="*50)
@@ -9,9 +9,8 @@
 import os
 import sys
 import argparse
-import json
-import time
-from typing import Dict, Any, List, Tuple
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -19,16 +18,20 @@ import pandas as pd
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.execution_graph import build_execution_graph
+from agents.execution_graph import get_execution_graph
 from runtime.context import DataManager
+from runtime.assign_stats import SortedKeyIndex, safe_rate
 from runtime.signals import classify_anomaly_from_stats
+from runtime.parallel import parallel_map
+from runtime.llm_client import LLMError, chat_text, console_printer, offline_api_key
+from runtime.payload import REASONER_TOKEN_BUDGET, dump_payload, rate_payload
 
 
 def _safe_rate(n: float, d: float) -> float:
     return float(n / d) if d and d > 0 else 0.0
 
 
-def _parse_args() -> argparse.Namespace:
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument("--date", type=str, help="Single date to analyze (YYYY-MM-DD or 'yesterday')")
     p.add_argument("--start", type=str, help="Start date for range analysis (YYYY-MM-DD)")
@@ -38,47 +41,41 @@ def _parse_args() -> argparse.Namespace:
     p.add_argument("--z-threshold", type=float, default=2.0)
     p.add_argument("--z-mid", type=float, default=1.2)
     p.add_argument("--share-window", type=float, default=0.05, help="条件对比时门店线索占比的容忍窗口")
-    args = p.parse_args()
+    p.add_argument("--share-windows", type=float, nargs="+", help="条件对比的多个容忍窗口（敏感性扫描）")
+    p.add_argument("--workers", type=int, default=1, help="Worker processes for --per-day range analysis")
+    p.add_argument("--per-day", action="store_true", help="Run the full execution graph for each day of a range instead of the vectorized trajectory")
+    p.add_argument("--no-stream", action="store_true", help="Wait for the whole reasoner report instead of streaming it")
+    args = p.parse_args(argv)
     if not args.date and not args.start:
         args.date = "yesterday"
     return args
 
 
+_STRUCTURE_COLUMNS = {
+    "leads": "下发线索数",
+    "store_leads": "下发线索数 (门店)",
+    "store_lock_same_day": "下发线索当日锁单数 (门店)",
+}
+
+
 def _compute_today_and_history(dm: DataManager, target_date: pd.Timestamp, h_start: pd.Timestamp, h_end: pd.Timestamp) -> Dict[str, Any]:
-    df = dm.get_assign_data().copy()
-    if df.empty or "assign_date" not in df.columns:
+    stats = dm.get_assign_stats()
+    if stats.n_days == 0:
         return {
             "today": {"leads": 0.0, "store_leads": 0.0, "store_lock_same_day": 0.0},
             "history": pd.DataFrame(columns=["assign_date", "leads", "store_leads", "store_lock_same_day"]),
         }
-    df["assign_date"] = pd.to_datetime(df["assign_date"], errors="coerce")
-    df = df[df["assign_date"].notna()]
-    cols = ["下发线索数", "下发线索数 (门店)", "下发线索当日锁单数 (门店)"]
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0)
-        else:
-            df[c] = 0.0
-    d_target = df[df["assign_date"].dt.normalize() == target_date.normalize()]
     today = {
-        "leads": float(d_target["下发线索数"].sum()),
-        "store_leads": float(d_target["下发线索数 (门店)"].sum()),
-        "store_lock_same_day": float(d_target["下发线索当日锁单数 (门店)"].sum()),
+        key: float(stats.at(stats.column(col), [target_date])[0])
+        for key, col in _STRUCTURE_COLUMNS.items()
     }
-    df_hist = df[(df["assign_date"] >= h_start) & (df["assign_date"] <= h_end)]
-    if df_hist.empty:
-        hist_df = pd.DataFrame(columns=["assign_date", "leads", "store_leads", "store_lock_same_day"])
-    else:
-        daily = df_hist.groupby(df_hist["assign_date"].dt.normalize())[
-            ["下发线索数", "下发线索数 (门店)", "下发线索当日锁单数 (门店)"]
-        ].sum().reset_index()
-        daily.rename(columns={
-            "assign_date": "assign_date",
-            "下发线索数": "leads",
-            "下发线索数 (门店)": "store_leads",
-            "下发线索当日锁单数 (门店)": "store_lock_same_day",
-        }, inplace=True)
-        hist_df = daily
+    # History days are the days in [h_start, h_end] that have assign rows
+    i0 = int(np.clip(stats.positions([h_start])[0], 0, stats.n_days))
+    i1 = int(np.clip(stats.positions([h_end])[0] + 1, i0, stats.n_days))
+    pos = i0 + np.flatnonzero(stats.present[i0:i1])
+    hist_df = pd.DataFrame({"assign_date": stats.first_day + pd.to_timedelta(pos, unit="D")})
+    for key, col in _STRUCTURE_COLUMNS.items():
+        hist_df[key] = stats.column(col)[pos]
     return {"today": today, "history": hist_df}
 
 
@@ -89,20 +86,22 @@ def _percent_rank(values: np.ndarray, x: float) -> float:
     return float((values <= x).mean())
 
 
-def assess_structure_risk(stats: Dict[str, Any], z_high: float, z_mid: float) -> Dict[str, Any]:
-    today = stats["today"]
-    hist_df = stats["history"]
-    today_share = _safe_rate(today["store_leads"], today["leads"])
-    today_store_rate = _safe_rate(today["store_lock_same_day"], today["store_leads"])
-    share_hist = hist_df.copy()
-    share_hist["store_share"] = share_hist.apply(lambda r: _safe_rate(r["store_leads"], r["leads"]), axis=1)
-    share_hist["store_rate"] = share_hist.apply(lambda r: _safe_rate(r["store_lock_same_day"], r["store_leads"]), axis=1)
-    share_values = share_hist["store_share"].to_numpy(dtype=float)
-    rate_values = share_hist["store_rate"].to_numpy(dtype=float)
-    share_mean = float(np.mean(share_values)) if share_values.size > 0 else 0.0
-    share_std = float(np.std(share_values, ddof=1)) if share_values.size > 1 else 0.0
-    rate_mean = float(np.mean(rate_values)) if rate_values.size > 0 else 0.0
-    rate_std = float(np.std(rate_values, ddof=1)) if rate_values.size > 1 else 0.0
+def _structure_rates(hist_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily store lead share and store same-day lock rate of a history frame."""
+    share = safe_rate(hist_df["store_leads"].to_numpy(dtype=float), hist_df["leads"].to_numpy(dtype=float))
+    rate = safe_rate(hist_df["store_lock_same_day"].to_numpy(dtype=float), hist_df["store_leads"].to_numpy(dtype=float))
+    return share, rate
+
+
+def _structure_risk(
+    today_share: float,
+    today_store_rate: float,
+    share_mean: float,
+    share_std: float,
+    rate_mean: float,
+    rate_std: float,
+    z_mid: float,
+) -> Dict[str, Any]:
     share_decision = classify_anomaly_from_stats(
         value=today_share,
         mean=share_mean,
@@ -141,31 +140,131 @@ def assess_structure_risk(stats: Dict[str, Any], z_high: float, z_mid: float) ->
     }
 
 
+def assess_structure_risk(stats: Dict[str, Any], z_high: float, z_mid: float) -> Dict[str, Any]:
+    today = stats["today"]
+    today_share = _safe_rate(today["store_leads"], today["leads"])
+    today_store_rate = _safe_rate(today["store_lock_same_day"], today["store_leads"])
+    share_values, rate_values = _structure_rates(stats["history"])
+    share_mean = float(np.mean(share_values)) if share_values.size > 0 else 0.0
+    share_std = float(np.std(share_values, ddof=1)) if share_values.size > 1 else 0.0
+    rate_mean = float(np.mean(rate_values)) if rate_values.size > 0 else 0.0
+    rate_std = float(np.std(rate_values, ddof=1)) if rate_values.size > 1 else 0.0
+    return _structure_risk(today_share, today_store_rate, share_mean, share_std, rate_mean, rate_std, z_mid)
+
+
+def structure_risk_range(dm: DataManager, dates: pd.DatetimeIndex, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    assess_structure_risk for every day in `dates` from the cached daily assign
+    arrays: one windowed-statistics call per ratio instead of a history rescan per day.
+    Entries have the same shape as _structure_risk_day.
+    """
+    stats = dm.get_assign_stats()
+    dates = pd.DatetimeIndex(dates).normalize()
+    h_starts = dates - pd.Timedelta(days=int(args.history_start_days_ago))
+    h_ends = dates - pd.Timedelta(days=int(args.history_end_days_ago))
+    daily = {key: stats.column(col) for key, col in _STRUCTURE_COLUMNS.items()}
+    today = {key: stats.at(values, dates) for key, values in daily.items()}
+
+    share = stats.window_stats(
+        safe_rate(daily["store_leads"], daily["leads"]),
+        safe_rate(today["store_leads"], today["leads"]),
+        h_starts, h_ends,
+    )
+    rate = stats.window_stats(
+        safe_rate(daily["store_lock_same_day"], daily["store_leads"]),
+        safe_rate(today["store_lock_same_day"], today["store_leads"]),
+        h_starts, h_ends,
+    )
+
+    trajectory = []
+    for k, d in enumerate(dates):
+        today_k = {key: float(values[k]) for key, values in today.items()}
+        risk = _structure_risk(
+            _safe_rate(today_k["store_leads"], today_k["leads"]),
+            _safe_rate(today_k["store_lock_same_day"], today_k["store_leads"]),
+            float(share["mean"][k]), float(share["std"][k]),
+            float(rate["mean"][k]), float(rate["std"][k]),
+            float(args.z_mid),
+        )
+        trajectory.append({
+            "date": d.strftime("%Y-%m-%d"),
+            "risk_level": risk["risk_level"],
+            "flag": risk["flag"],
+            "share_z": risk["share_z"],
+            "rate_z": risk["rate_z"],
+            "today": today_k,
+        })
+    return trajectory
+
+
+def _conditional_rows(
+    today_share: np.ndarray,
+    today_store_rate: np.ndarray,
+    index: SortedKeyIndex,
+    windows: List[float],
+) -> List[List[Dict[str, Any]]]:
+    """conditional_rate_assessment results for every index row (target day) and share window."""
+    widths = np.asarray(windows, dtype=float)[None, :]
+    lower = np.maximum(0.0, today_share[:, None] - widths)
+    upper = np.minimum(1.0, today_share[:, None] + widths)
+    cond = index.query(lower, upper)
+    rows = []
+    for k in range(len(today_share)):
+        row = []
+        for j, window in enumerate(windows):
+            cond_mean = float(cond["mean"][k, j])
+            cond_std = float(cond["std"][k, j])
+            rate = float(today_store_rate[k])
+            row.append({
+                "window": window,
+                "share_lower": float(lower[k, j]),
+                "share_upper": float(upper[k, j]),
+                "conditional_mean": cond_mean,
+                "conditional_std": cond_std,
+                "today_store_rate": rate,
+                "conditional_z": float((rate - cond_mean) / cond_std) if cond_std > 0 else 0.0,
+                "n_days": int(cond["n_days"][k, j]),
+            })
+        rows.append(row)
+    return rows
+
+
 def conditional_rate_assessment(stats: Dict[str, Any], window: float) -> Dict[str, Any]:
     today = stats["today"]
-    hist_df = stats["history"]
     today_share = _safe_rate(today["store_leads"], today["leads"])
-    hist_df = hist_df.copy()
-    hist_df["store_share"] = hist_df.apply(lambda r: _safe_rate(r["store_leads"], r["leads"]), axis=1)
-    hist_df["store_rate"] = hist_df.apply(lambda r: _safe_rate(r["store_lock_same_day"], r["store_leads"]), axis=1)
-    lower = max(0.0, today_share - window)
-    upper = min(1.0, today_share + window)
-    cond = hist_df[(hist_df["store_share"] >= lower) & (hist_df["store_share"] <= upper)]
-    cond_values = cond["store_rate"].to_numpy(dtype=float)
-    cond_mean = float(np.mean(cond_values)) if cond_values.size > 0 else 0.0
-    cond_std = float(np.std(cond_values, ddof=1)) if cond_values.size > 1 else 0.0
     today_store_rate = _safe_rate(today["store_lock_same_day"], today["store_leads"])
-    cond_z = float((today_store_rate - cond_mean) / cond_std) if cond_std > 0 else 0.0
-    return {
-        "window": window,
-        "share_lower": lower,
-        "share_upper": upper,
-        "conditional_mean": cond_mean,
-        "conditional_std": cond_std,
-        "today_store_rate": today_store_rate,
-        "conditional_z": cond_z,
-        "n_days": int(cond_values.size),
-    }
+    share_values, rate_values = _structure_rates(stats["history"])
+    index = SortedKeyIndex(share_values[None, :], rate_values[None, :])
+    return _conditional_rows(np.array([today_share]), np.array([today_store_rate]), index, [window])[0][0]
+
+
+def conditional_rate_range(
+    dm: DataManager,
+    dates: pd.DatetimeIndex,
+    args: argparse.Namespace,
+    windows: List[float],
+) -> List[List[Dict[str, Any]]]:
+    """
+    conditional_rate_assessment for every day in `dates` and every share window
+    (a sensitivity sweep), from one sorted-share index over all history windows.
+    """
+    stats = dm.get_assign_stats()
+    dates = pd.DatetimeIndex(dates).normalize()
+    h_starts = dates - pd.Timedelta(days=int(args.history_start_days_ago))
+    h_ends = dates - pd.Timedelta(days=int(args.history_end_days_ago))
+    daily = {key: stats.column(col) for key, col in _STRUCTURE_COLUMNS.items()}
+    today = {key: stats.at(values, dates) for key, values in daily.items()}
+    index = stats.conditional_index(
+        safe_rate(daily["store_leads"], daily["leads"]),
+        safe_rate(daily["store_lock_same_day"], daily["store_leads"]),
+        h_starts, h_ends,
+    )
+    return _conditional_rows(
+        safe_rate(today["store_leads"], today["leads"]),
+        safe_rate(today["store_lock_same_day"], today["store_leads"]),
+        index,
+        windows,
+    )
 
 
 def _build_dsl(date_range: str) -> List[Dict[str, Any]]:
@@ -190,13 +289,14 @@ def _build_dsl(date_range: str) -> List[Dict[str, Any]]:
 
 def _toolbox_for_high_risk(date_range: str, compare_date_range: str = None) -> List[Dict[str, Any]]:
     tasks = [
-        # 1. 结构分布 (仅保留车型 Series，因其对产品策略影响最大)
+        # 1. 结构分布 (车型 Series 为主维度，城市/渠道/大区在同一次调用中一并扫描)
         {
             "id": "sales_dist_by_series",
             "tool": "distribution",
             "parameters": {
                 "metric": "sales", 
                 "dimension": "series_group", 
+                "dimensions": ["series_group", "store_city", "first_middle_channel_name", "parent_region_name"],
                 "date_range": date_range,
                 "compare_date_range": compare_date_range
             },
@@ -260,7 +360,9 @@ def _get_wow_tasks(date_range: str) -> List[Dict[str, Any]]:
     ]
 
 
-def _call_deepseek_reasoner(payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+def _call_deepseek_reasoner(
+    payload: Dict[str, Any], on_delta: Optional[Callable[[str], None]] = None
+) -> Tuple[str, Dict[str, Any]]:
     api_key = None
     env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
     if os.path.exists(env_path):
@@ -270,10 +372,10 @@ def _call_deepseek_reasoner(payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any
                     if "deepseek=" in line or "deepseek =" in line:
                         api_key = line.split("=", 1)[1].strip()
                         break
+    # Replaying from the response cache (LLM_CACHE=replay) needs no key
+    api_key = api_key or offline_api_key()
     if not api_key:
         return "⚠️ Error: DeepSeek API Key not found in .env", {}
-    base_url = "https://api.deepseek.com"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     system_prompt = (
         "你是一位高密度业务诊断专家。请基于提供的 JSON 数据字典（包含 keys: 'core', 'sales_orders', 'leads_trend', 'rate_trend', 'signals'），输出一份**极简、去噪、高密度**的诊断报告。\n"
         "数据源映射说明：\n"
@@ -320,31 +422,35 @@ def _call_deepseek_reasoner(payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any
         "**量化优先**：禁止使用“大幅上升”等模糊词，必须使用“低-2.44σ”、“SAD 0.33”等精确数据。\n"
         "**逻辑闭环**：最后的归因综述必须基于 Checklist 中发现的问题。"
     )
+    # Only the fields the prompt references, compact and within the token budget
+    data_str, payload_tokens = dump_payload(rate_payload(payload), max_tokens=REASONER_TOKEN_BUDGET)
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": json.dumps(payload, ensure_ascii=False, indent=2, default=str)},
+        {"role": "user", "content": data_str},
     ]
-    req = {"model": "deepseek-reasoner", "messages": messages, "stream": False}
+    req = {"model": "deepseek-reasoner", "messages": messages, "stream": on_delta is not None}
     try:
         print("🤔 DeepSeek Reasoner is thinking...", end="", flush=True)
-        t0 = time.time()
-        import requests
-        resp = requests.post(f"{base_url}/chat/completions", json=req, headers=headers)
-        t1 = time.time()
-        print(f" Done. ({t1 - t0:.2f}s)")
-        if resp.status_code != 200:
-            return f"Error from API: {resp.text}", {}
-        data = resp.json()
-        usage = data.get("usage", {})
-        content = ""
-        if "choices" in data and data["choices"]:
-            content = data["choices"][0]["message"].get("content", "")
-        return content, {"elapsed_sec": t1 - t0, "usage": usage}
+        try:
+            # With on_delta the report is streamed piece by piece as it is generated
+            content, metrics = chat_text(req, api_key, on_delta=on_delta)
+        except LLMError as e:
+            print(" Failed.")
+            return f"Error from API: {e.body}", {}
+        metrics["payload_tokens"] = payload_tokens
+        if on_delta is None:
+            print(f" Done. ({metrics['elapsed_sec']:.2f}s)")
+        return content, metrics
     except Exception as e:
         return f"Error calling API: {str(e)}", {}
 
 
-def analyze_point(target_date_str: str, args: argparse.Namespace, use_reasoner: bool = True) -> Dict[str, Any]:
+def analyze_point(
+    target_date_str: str,
+    args: argparse.Namespace,
+    use_reasoner: bool = True,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
     dm = DataManager()
     today = pd.Timestamp.now().normalize()
     if target_date_str == "yesterday":
@@ -357,7 +463,7 @@ def analyze_point(target_date_str: str, args: argparse.Namespace, use_reasoner:
     h_end = target_date - pd.Timedelta(days=int(args.history_end_days_ago))
     history_range_str = f"{h_start.strftime('%Y-%m-%d')}/{h_end.strftime('%Y-%m-%d')}"
     print(f"\n🔍 Analyzing Date: {date_range} (History Baseline: {history_range_str})")
-    app = build_execution_graph()
+    app = get_execution_graph()
     state = {
         "dsl_sequence": _build_dsl(date_range),
         "current_step": 0,
@@ -374,6 +480,10 @@ def analyze_point(target_date_str: str, args: argparse.Namespace, use_reasoner:
         "structure_risk": structure_risk,
         "conditional": conditional,
     }
+    if getattr(args, "share_windows", None):
+        final_state["results"]["assign_structure"]["conditional_sweep"] = conditional_rate_range(
+            dm, pd.DatetimeIndex([target_date]), args, args.share_windows
+        )[0]
     final_state["signals"].append(
         {
             "type": "structure_anomaly",
@@ -455,40 +565,48 @@ def analyze_point(target_date_str: str, args: argparse.Namespace, use_reasoner:
             "rate_trend": rate_trend,
             "signals": final_state["signals"],
         }
-        report, metrics = _call_deepseek_reasoner(payload)
+        report, metrics = _call_deepseek_reasoner(payload, on_delta=on_delta)
         final_state["results"]["reasoner_report"] = report
         final_state["results"]["reasoner_metrics"] = metrics
     return final_state
 
 
+def _structure_risk_day(d_str: str, args: argparse.Namespace) -> Dict[str, Any]:
+    state = analyze_point(d_str, args, use_reasoner=False)
+    structure = state["results"].get("assign_structure", {})
+    risk = structure.get("structure_risk", {})
+    return {
+        "date": d_str,
+        "risk_level": risk.get("risk_level", "低"),
+        "flag": risk.get("flag", ""),
+        "share_z": float(risk.get("share_z", 0.0)),
+        "rate_z": float(risk.get("rate_z", 0.0)),
+        "today": structure.get("today", {}),
+    }
+
+
 def analyze_range(start_date: str, end_date: str, args: argparse.Namespace) -> None:
     print(f"🚀 Structure Risk Trajectory Analysis (No per-day LLM): {start_date} to {end_date}")
     s = pd.to_datetime(start_date)
     e = pd.to_datetime(end_date)
     dates = pd.date_range(start=s, end=e, freq="D")
-    trajectory: List[Dict[str, Any]] = []
-    for d in dates:
-        d_str = d.strftime("%Y-%m-%d")
-        state = analyze_point(d_str, args, use_reasoner=False)
-        structure = state["results"].get("assign_structure", {})
-        risk = structure.get("structure_risk", {})
-        risk_level = risk.get("risk_level", "低")
-        flag = risk.get("flag", "")
-        share_z = float(risk.get("share_z", 0.0))
-        rate_z = float(risk.get("rate_z", 0.0))
-        today = structure.get("today", {})
-        trajectory.append(
-            {
-                "date": d_str,
-                "risk_level": risk_level,
-                "flag": flag,
-                "share_z": share_z,
-                "rate_z": rate_z,
-                "today": today,
-            }
+    if getattr(args, "per_day", False):
+        # Days are independent; with --workers > 1 they fan out to a process pool and
+        # come back in date order
+        trajectory: List[Dict[str, Any]] = parallel_map(
+            partial(_structure_risk_day, args=args),
+            [d.strftime("%Y-%m-%d") for d in dates],
+            getattr(args, "workers", 1),
         )
-        icon = {"低": "🟢", "中": "🟡", "高": "🔴"}.get(risk_level, "❓")
-        print(f"{icon} {d_str} 结构风险：{risk_level} ({flag}) share_z={share_z:.2f}, rate_z={rate_z:.2f}")
+    else:
+        trajectory = structure_risk_range(DataManager(), dates, args)
+    if getattr(args, "share_windows", None):
+        sweeps = conditional_rate_range(DataManager(), dates, args, args.share_windows)
+        for t, sweep in zip(trajectory, sweeps):
+            t["conditional_sweep"] = sweep
+    for t in trajectory:
+        icon = {"低": "🟢", "中": "🟡", "高": "🔴"}.get(t["risk_level"], "❓")
+        print(f"{icon} {t['date']} 结构风险：{t['risk_level']} ({t['flag']}) share_z={t['share_z']:.2f}, rate_z={t['rate_z']:.2f}")
     payload = {
         "date": f"{start_date}/{end_date}",
         "core": {
@@ -504,8 +622,14 @@ def analyze_range(start_date: str, end_date: str, args: argparse.Namespace) -> N
     print("\n" + "=" * 50)
     print(f"📊 Assign Structure Reasoner Trajectory Report ({start_date} ~ {end_date})")
     print("=" * 50)
-    report, _metrics = _call_deepseek_reasoner(payload)
-    print(report)
+    if getattr(args, "no_stream", False):
+        report, _metrics = _call_deepseek_reasoner(payload)
+        print(report)
+    else:
+        report, _metrics = _call_deepseek_reasoner(payload, on_delta=console_printer())
+        print()
+        if not _metrics:
+            print(report)
     print("\n" + "=" * 50)
     print(f"📅 区间结构风险轨迹汇总 ({start_date} ~ {end_date})")
     print("=" * 50)
@@ -531,19 +655,32 @@ def main() -> None:
     if args.start and args.end:
         analyze_range(args.start, args.end, args)
     elif args.date:
-        state = analyze_point(args.date, args)
-        print("\n" + "=" * 50)
-        print(f"📊 Assign Structure Reasoner Report ({args.date})")
-        print("=" * 50)
-        print(state["results"].get("reasoner_report", ""))
+        header = "\n" + "=" * 50 + f"\n📊 Assign Structure Reasoner Report ({args.date})\n" + "=" * 50 + "\n"
+        if args.no_stream:
+            state = analyze_point(args.date, args)
+            print(header + state["results"].get("reasoner_report", ""))
+        else:
+            # The header goes out with the first streamed piece of the report
+            state = analyze_point(args.date, args, on_delta=console_printer(prefix=header))
+            print()
         m = state["results"].get("reasoner_metrics", {})
+        if not m:
+            print(state["results"].get("reasoner_report", ""))
         if m:
             usage = m.get("usage", {})
             print("\n------------------------------")
             print("⏱️  性能统计 (Performance Metrics)")
             print("------------------------------")
             print(f"⏳ 运行耗时: {float(m.get('elapsed_sec', 0)):.2f} 秒")
+            if m.get("streamed"):
+                ttft, first = m.get("ttft_sec"), m.get("first_content_sec")
+                print(f"⚡ 首 token: {ttft:.2f} 秒" if ttft is not None else "⚡ 首 token: -")
+                print(f"📝 首段正文: {first:.2f} 秒" if first is not None else "📝 首段正文: -")
+                if m.get("interrupted"):
+                    print(f"⚠️ 流式连接中断: {m.get('error', '')}")
             print("🎫 Token 开销:")
+            if "payload_tokens" in m:
+                print(f"   - Payload Tokens (est.): {m['payload_tokens']}")
             print(f"   - Input Tokens: {usage.get('prompt_tokens', 0)}")
             print(f"   - Output Tokens: {usage.get('completion_tokens', 0)}")
             print(f"   - Total Tokens: {usage.get('total_tokens', 0)}")
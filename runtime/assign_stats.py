@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+
+def safe_rate(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """Element-wise num / den, 0 where den <= 0 (same rule as the pipelines' _safe_rate)."""
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+class AssignDailyStats:
+    """
+    Dense per-day sums of the assign data, built once per load.
+
+    History-window statistics for one or many target days come from these arrays:
+    count/mean/std from prefix sums, min/max and percentile rank from the window's
+    sorted values. Only days that have assign rows count as history days, matching
+    a groupby over the filtered frame.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Iterable[str]):
+        self.first_day: Optional[pd.Timestamp] = None
+        self.n_days = 0
+        self._sums: Dict[str, np.ndarray] = {}
+        self.present = np.zeros(0, dtype=bool)
+        if df.empty or "assign_date" not in df.columns:
+            return
+
+        dates = pd.to_datetime(df["assign_date"], errors="coerce")
+        valid = dates.notna().to_numpy()
+        days = dates.to_numpy()[valid].astype("datetime64[D]")
+        if days.size == 0:
+            return
+        first = days.min()
+        codes = (days - first).astype(np.int64)
+        self.first_day = pd.Timestamp(first)
+        self.n_days = int(codes.max()) + 1
+        self.present = np.bincount(codes, minlength=self.n_days) > 0
+        for col in columns:
+            if col in df.columns:
+                weights = pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)[valid]
+                self._sums[col] = np.bincount(codes, weights=weights, minlength=self.n_days)
+
+    def has(self, *cols: str) -> bool:
+        return all(c in self._sums for c in cols)
+
+    def column(self, col: str) -> np.ndarray:
+        """Per-day sums of `col` (zeros when the column is missing)."""
+        return self._sums.get(col, np.zeros(self.n_days))
+
+    def rate(self, numerator_col: str, denominator_col: str) -> np.ndarray:
+        return safe_rate(self.column(numerator_col), self.column(denominator_col))
+
+    def positions(self, days) -> np.ndarray:
+        """Calendar offsets of `days` from the first assign day (may fall outside [0, n_days))."""
+        days = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(days))).normalize()
+        if self.first_day is None:
+            return np.zeros(len(days), dtype=np.int64)
+        return ((days - self.first_day) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+
+    def at(self, values: np.ndarray, days) -> np.ndarray:
+        """`values` on the given days; 0 for days outside the data."""
+        pos = self.positions(days)
+        inside = (pos >= 0) & (pos < self.n_days)
+        out = np.zeros(len(pos))
+        out[inside] = values[pos[inside]]
+        return out
+
+    def _bounds(self, starts, ends):
+        # Inclusive [start, end] calendar windows as half-open array slices
+        i0 = np.clip(self.positions(starts), 0, self.n_days)
+        i1 = np.clip(self.positions(ends) + 1, 0, self.n_days)
+        return i0, np.maximum(i1, i0)
+
+    def _window_matrix(self, values: np.ndarray, i0: np.ndarray, i1: np.ndarray) -> np.ndarray:
+        """One row per target: the window's history values, NaN-padded."""
+        width = int((i1 - i0).max()) if len(i0) else 0
+        idx = i0[:, None] + np.arange(width)[None, :]
+        inside = idx < i1[:, None]
+        idx = np.minimum(idx, max(self.n_days - 1, 0))
+        if self.n_days == 0:
+            return np.full((len(i0), width), np.nan)
+        keep = inside & self.present[idx]
+        return np.where(keep, values[idx], np.nan)
+
+    def window_stats(self, values: np.ndarray, targets: np.ndarray, starts, ends) -> Dict[str, np.ndarray]:
+        """
+        Statistics of the per-day `values` over each inclusive [start, end] history
+        window, with `targets` (one value per window) ranked against it.
+
+        Returns arrays: n_days, mean, std (ddof=1), min, max and percentile
+        (share of history days <= target, i.e. the empirical CDF).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        targets = np.asarray(targets, dtype=np.float64)
+        i0, i1 = self._bounds(starts, ends)
+
+        present = self.present.astype(np.float64)
+        shift = float(values[self.present].mean()) if self.present.any() else 0.0
+        centered = np.where(self.present, values - shift, 0.0) if self.n_days else np.zeros(0)
+        cnt_prefix, s1_prefix, s2_prefix = (
+            np.concatenate([[0.0], np.cumsum(a)]) for a in (present, centered, centered ** 2)
+        )
+        n = cnt_prefix[i1] - cnt_prefix[i0]
+        s1 = s1_prefix[i1] - s1_prefix[i0]
+        s2 = s2_prefix[i1] - s2_prefix[i0]
+        mean = np.where(n > 0, shift + np.divide(s1, n, out=np.zeros_like(s1), where=n > 0), 0.0)
+        var = np.divide(s2 - np.divide(s1 * s1, n, out=np.zeros_like(s1), where=n > 0), n - 1,
+                        out=np.zeros_like(s1), where=n > 1)
+        std = np.sqrt(np.clip(var, 0.0, None))
+
+        window = np.sort(self._window_matrix(values, i0, i1), axis=1)  # NaN padding sorts last
+        n_int = n.astype(np.int64)
+        rows = np.arange(len(n_int))
+        has = n_int > 0
+        lo = np.zeros(len(n_int))
+        hi = np.zeros(len(n_int))
+        if window.shape[1]:
+            lo[has] = window[rows[has], 0]
+            hi[has] = window[rows[has], n_int[has] - 1]
+        below = (window <= targets[:, None]).sum(axis=1)
+        percentile = np.divide(below, n, out=np.zeros_like(n), where=n > 0)
+        return {"n_days": n_int, "mean": mean, "std": std, "min": lo, "max": hi, "percentile": percentile}
+
+    def conditional_index(self, key: np.ndarray, values: np.ndarray, starts, ends) -> "SortedKeyIndex":
+        """A SortedKeyIndex over each inclusive [start, end] history window."""
+        i0, i1 = self._bounds(starts, ends)
+        return SortedKeyIndex(
+            self._window_matrix(np.asarray(key, dtype=np.float64), i0, i1),
+            self._window_matrix(np.asarray(values, dtype=np.float64), i0, i1),
+        )
+
+    def conditional_stats(self, values: np.ndarray, key: np.ndarray, lower, upper, starts, ends) -> Dict[str, np.ndarray]:
+        """
+        Count/mean/std (ddof=1) of `values` over history days in each window whose
+        `key` lies in [lower, upper] (one bound pair per window).
+        """
+        return self.conditional_index(key, values, starts, ends).query(lower, upper)
+
+
+class SortedKeyIndex:
+    """
+    Rows of (key, value) pairs, each row sorted by key with prefix sums of value and
+    value². Count/mean/std of the values whose key lies in [lower, upper] is two
+    binary searches per query, for any number of rows and bound pairs per row.
+
+    Keys are replaced by their rank among all keys, so the per-row searches run on
+    one flattened integer array and boundary comparisons stay exact.
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray):
+        keys = np.atleast_2d(np.asarray(keys, dtype=np.float64))
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        n_rows, width = keys.shape
+        valid = ~np.isnan(keys) & ~np.isnan(values)
+        order = np.argsort(np.where(valid, keys, np.inf), axis=1, kind="stable")
+        keys = np.take_along_axis(keys, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        valid = np.take_along_axis(valid, order, axis=1)
+
+        self.n_rows = n_rows
+        self.width = width
+        self._uniq = np.unique(keys[valid])
+        ranks = np.where(valid, np.searchsorted(self._uniq, np.where(valid, keys, 0.0)), len(self._uniq))
+        self._stride = len(self._uniq) + 1
+        self._flat = (np.arange(n_rows)[:, None] * self._stride + ranks).ravel()
+
+        # Shifted sums keep the variance difference well conditioned
+        self._shift = float(values[valid].mean()) if valid.any() else 0.0
+        centered = np.where(valid, values - self._shift, 0.0)
+        zero = np.zeros((n_rows, 1))
+        self._p1 = np.concatenate([zero, np.cumsum(centered, axis=1)], axis=1)
+        self._p2 = np.concatenate([zero, np.cumsum(centered ** 2, axis=1)], axis=1)
+
+    def _positions(self, rows: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+        # Index within each row of the first key whose rank is >= `ranks`
+        flat = np.searchsorted(self._flat, rows * self._stride + ranks, side="left")
+        return flat - rows * self.width
+
+    def query(self, lower, upper) -> Dict[str, np.ndarray]:
+        """
+        `lower`/`upper` have one entry per row, or shape (n_rows, k) for k bound pairs
+        per row. Returns count/mean/std (ddof=1) arrays of the same shape.
+        """
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        shape = np.broadcast(lower, upper).shape or (self.n_rows,)
+        lower = np.broadcast_to(lower, shape)
+        upper = np.broadcast_to(upper, shape)
+        rows = np.broadcast_to(np.arange(self.n_rows).reshape((self.n_rows,) + (1,) * (len(shape) - 1)), shape)
+        lo = self._positions(rows, np.searchsorted(self._uniq, lower, side="left"))
+        hi = self._positions(rows, np.searchsorted(self._uniq, upper, side="right"))
+        hi = np.maximum(hi, lo)
+
+        n = (hi - lo).astype(np.int64)
+        s1 = self._p1[rows, hi] - self._p1[rows, lo]
+        s2 = self._p2[rows, hi] - self._p2[rows, lo]
+        mean = np.where(n > 0, self._shift + np.divide(s1, n, out=np.zeros(shape), where=n > 0), 0.0)
+        var = np.divide(s2 - np.divide(s1 * s1, n, out=np.zeros(shape), where=n > 0), n - 1,
+                        out=np.zeros(shape), where=n > 1)
+        return {"n_days": n, "mean": mean, "std": np.sqrt(np.clip(var, 0.0, None))}
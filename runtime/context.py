@@ -1,11 +1,63 @@
 import pandas as pd
-from typing import Optional
+from typing import Optional, Tuple
 import datetime
 from pathlib import Path
 import glob
 import numpy as np
 import re
 import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from runtime.cube import DailyCube
+from runtime.sketch import DailyHistogram
+from runtime.assign_stats import AssignDailyStats
+
+# Derived lead-time metrics (in days): name -> (start column, end column).
+# Computed lazily per snapshot as nullable Int32 day counts (DataManager.duration_values).
+DURATION_METRICS = {
+    "assign_to_lock": ("first_assign_time", "lock_time"),
+    "create_to_lock": ("order_create_date", "lock_time"),
+    "lock_to_delivery": ("lock_time", "delivery_date"),
+    "lock_to_invoice": ("lock_time", "invoice_upload_time"),
+}
+
+# Numeric order columns with per-day histograms: name -> bin width (1 keeps integer values exact)
+NUMERIC_METRICS = {
+    "age": 1,
+    "invoice_amount": 100,
+}
+
+_DATEDIFF_RE = re.compile(r"datediff\('day',\s*([a-zA-Z0-9_]+),\s*([a-zA-Z0-9_]+)\)")
+
+ASSIGN_PATTERN = "/Users/zihao*/Documents/coding/dataset/original/assign_data.csv"
+
+# Time axes whose daily cubes are prebuilt by DataManager.warm()
+WARM_TIME_COLUMNS = ("order_create_date", "lock_time", "delivery_date", "invoice_upload_time")
+
+
+class DataSnapshot:
+    """
+    One version of the loaded datasets together with everything derived from them
+    (duration arrays, cubes, histograms and memoized aggregates). The frames are not
+    modified after loading, so a reload can carry an unchanged one over by reference;
+    it builds a new snapshot and swaps it in whole.
+    """
+
+    def __init__(self, version: int, fingerprints: Optional[dict] = None):
+        self.version = version
+        self.fingerprints = fingerprints or {}
+        self.data = None
+        self.assign_data = None
+        self.cubes = {}
+        # (start_col, end_col) -> Int32 Series of whole days, aligned with data's index
+        self.durations = {}
+        self.memo = OrderedDict()
+        # Guards lazy loads and derived caches written onto this version
+        self.lock = threading.RLock()
+
 
 class DataManager:
     _instance = None
@@ -13,13 +65,158 @@ class DataManager:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(DataManager, cls).__new__(cls)
-            cls._instance.data = None
+            cls._instance._snapshot = DataSnapshot(0)
+            cls._instance._local = threading.local()
+            cls._instance._swap_lock = threading.Lock()
+            cls._instance._watcher = None
+            cls._instance._watch_stop = threading.Event()
             cls._instance.data_path = "/Users/zihao_/Documents/coding/dataset/formatted/order_full_data.parquet"
-            cls._instance.assign_data = None
             cls._instance.assign_path = None
             cls._instance.business_definition = None
         return cls._instance
 
+    # Version-bound state resolves through the snapshot pinned by this thread
+    # (see pinned()) or, outside a pin, the current one.
+    @property
+    def snapshot(self) -> DataSnapshot:
+        return getattr(self._local, "snapshot", None) or self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def latest_version(self) -> int:
+        """Version new requests will see (ignores this thread's pin)."""
+        return self._snapshot.version
+
+    @property
+    def data(self) -> Optional[pd.DataFrame]:
+        return self.snapshot.data
+
+    @data.setter
+    def data(self, value: Optional[pd.DataFrame]):
+        self.snapshot.data = value
+
+    @property
+    def assign_data(self) -> Optional[pd.DataFrame]:
+        return self.snapshot.assign_data
+
+    @assign_data.setter
+    def assign_data(self, value: Optional[pd.DataFrame]):
+        self.snapshot.assign_data = value
+
+    @property
+    def _cubes(self) -> dict:
+        return self.snapshot.cubes
+
+    @property
+    def _memo(self) -> OrderedDict:
+        return self.snapshot.memo
+
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.snapshot.lock
+
+    @contextmanager
+    def pinned(self, snapshot: Optional[DataSnapshot] = None):
+        """
+        Keep this thread on one data version (the current one by default) for the
+        duration of the block, even if a reload swaps in a newer snapshot meanwhile.
+        """
+        previous = getattr(self._local, "snapshot", None)
+        self._local.snapshot = snapshot or self.snapshot
+        try:
+            yield self._local.snapshot
+        finally:
+            self._local.snapshot = previous
+
+    @staticmethod
+    def _fingerprint(path: Optional[str]) -> Optional[Tuple[str, int, int]]:
+        if not path or not os.path.exists(path):
+            return None
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _resolve_assign_path() -> Optional[str]:
+        matches = glob.glob(ASSIGN_PATTERN)
+        return matches[0] if matches else None
+
+    def source_fingerprints(self) -> dict:
+        """(path, mtime, size) of each source file, None when it is absent."""
+        return {
+            "data": self._fingerprint(self.data_path),
+            "assign_data": self._fingerprint(self._resolve_assign_path()),
+        }
+
+    def warm(self):
+        """Load both datasets and prebuild the derived caches most tools read."""
+        self.get_data()
+        self.get_assign_data()
+        for time_col in WARM_TIME_COLUMNS:
+            self.get_cube(time_col)
+        self.get_assign_stats()
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the snapshot if a source file changed (or `force`) and swap it in.
+
+        The new version is loaded and warmed on the calling thread while other threads
+        keep serving the current one; a dataset whose file did not change is carried
+        over as-is. Returns True when a new version was installed.
+        """
+        current = self._snapshot
+        fingerprints = self.source_fingerprints()
+        if all(fp is None for fp in fingerprints.values()):
+            return False
+        changed = {name for name, fp in fingerprints.items() if fp != current.fingerprints.get(name)}
+        if not changed and not force:
+            return False
+
+        fresh = DataSnapshot(current.version + 1, fingerprints)
+        if not force:
+            if "data" not in changed:
+                fresh.data = current.data
+            if "assign_data" not in changed:
+                fresh.assign_data = current.assign_data
+        with self.pinned(fresh):
+            self.warm()
+        with self._swap_lock:
+            if self._snapshot is not current:
+                # Another reload won the race; keep its (at least as new) version
+                return False
+            self._snapshot = fresh
+        print(f"Data reloaded (version {fresh.version}): {sorted(changed) or ['forced']}")
+        return True
+
+    def start_watcher(self, interval: float = 60.0) -> threading.Thread:
+        """Poll the source files every `interval` seconds and reload on change."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+        if not self._snapshot.fingerprints:
+            # Baseline for data loaded before watching started
+            self._snapshot.fingerprints = self.source_fingerprints()
+        self._watch_stop.clear()
+
+        def _loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Keep serving the current version; retry on the next tick
+                    print(f"Data reload failed: {e}")
+
+        self._watcher = threading.Thread(target=_loop, name="data-watcher", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watcher(self):
+        self._watch_stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
     def load_business_definition(self):
         if self.business_definition is None:
             path = Path("/Users/zihao_/Documents/github/W52_reasoning/world/business_definition.json")
@@ -49,6 +246,7 @@ class DataManager:
     def load_data(self):
         if self.data is None:
             print(f"Loading data from {self.data_path}...")
+            self.snapshot.fingerprints.setdefault("data", self._fingerprint(self.data_path))
             self.data = pd.read_parquet(self.data_path)
             # Ensure date columns are datetime
             for col in ['order_create_date', 'lock_time', 'delivery_date']:
@@ -96,17 +294,14 @@ class DataManager:
     
     def get_data(self) -> pd.DataFrame:
         if self.data is None:
-            self.load_data()
+            with self._lock:
+                self.load_data()
         return self.data
     
     def load_assign_data(self):
         if self.assign_data is None:
-            pattern = "/Users/zihao*/Documents/coding/dataset/original/assign_data.csv"
-            matches = glob.glob(pattern)
-            if matches:
-                self.assign_path = matches[0]
-            else:
-                self.assign_path = None
+            self.assign_path = self._resolve_assign_path()
+            self.snapshot.fingerprints.setdefault("assign_data", self._fingerprint(self.assign_path))
             if self.assign_path:
                 encodings = ['utf-8', 'utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be', 'gbk', 'latin1']
                 last_err = None
@@ -161,7 +356,8 @@ class DataManager:
     
     def get_assign_data(self) -> pd.DataFrame:
         if self.assign_data is None:
-            self.load_assign_data()
+            with self._lock:
+                self.load_assign_data()
         return self.assign_data
 
     def apply_filters(self, df: pd.DataFrame, filters: list) -> pd.DataFrame:
@@ -171,6 +367,18 @@ class DataManager:
         """
         if df.empty or not filters:
             return df
+        mask = self.filter_mask(df, filters)
+        if mask is None:
+            return df
+        return df[mask]
+
+    def filter_mask(self, df: pd.DataFrame, filters: list) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for `filters` on `df` (same semantics as apply_filters),
+        or None when no filter applies. Lets callers combine slices without copying rows.
+        """
+        if df.empty or not filters:
+            return None
 
         if self.business_definition is None:
             self.load_business_definition()
@@ -180,7 +388,14 @@ class DataManager:
             filters = [{"field": k, "op": "=", "value": v} for k, v in filters.items()]
 
         if not isinstance(filters, list):
-            return df
+            return None
+
+        mask = None
+
+        def _and(cond) -> None:
+            nonlocal mask
+            cond = np.asarray(cond, dtype=bool)
+            mask = cond if mask is None else (mask & cond)
 
         for f in filters:
             if not isinstance(f, dict):
@@ -212,38 +427,39 @@ class DataManager:
                         value = new_values
                         op = 'in'
 
+            col = df[field]
             if op in ["=", "=="]:
                 if isinstance(value, list):
                     if len(value) == 1:
-                        df = df[df[field] == value[0]]
+                        _and(col == value[0])
                     else:
                         # Auto-switch to 'in' if multiple values provided with '='
-                        df = df[df[field].isin(value)]
+                        _and(col.isin(value))
                 else:
-                    df = df[df[field] == value]
+                    _and(col == value)
             elif op in ["!=", "<>"]:
-                df = df[df[field] != value]
+                _and(col != value)
             elif op == "in":
                 values = value if isinstance(value, list) else [value]
-                df = df[df[field].isin(values)]
+                _and(col.isin(values))
             elif op == "contains":
-                df = df[df[field].astype(str).str.contains(str(value), na=False)]
+                _and(col.astype(str).str.contains(str(value), na=False))
             elif op in ["not_null", "notna", "exists", "is not null", "not null", "is_not_null"]:
-                df = df[df[field].notna()]
+                _and(col.notna())
             elif op in [">", ">=", "<", "<="]:
-                s = pd.to_numeric(df[field], errors="coerce")
+                s = pd.to_numeric(col, errors="coerce")
                 v = pd.to_numeric(pd.Series([value]), errors="coerce").iloc[0]
                 if pd.isna(v):
                     continue
                 if op == ">":
-                    df = df[s > v]
+                    _and(s > v)
                 elif op == ">=":
-                    df = df[s >= v]
+                    _and(s >= v)
                 elif op == "<":
-                    df = df[s < v]
+                    _and(s < v)
                 elif op == "<=":
-                    df = df[s <= v]
-        return df
+                    _and(s <= v)
+        return mask
 
     def filter_data(self, date_range: Optional[str] = None, time_col: str = 'order_create_date') -> pd.DataFrame:
         df = self.get_data()
@@ -257,101 +473,17 @@ class DataManager:
         if time_col not in df.columns:
             return pd.DataFrame()
             
-        # Use current system time as today
-        today = pd.Timestamp.now().normalize()
-        # Use dataset max date based on the specific time column
-        max_data_date = df[time_col].max()
-        
-        if date_range == "yesterday":
-            # For "yesterday", we might want just the previous day, or up to yesterday.
-            # Assuming strictly the day before today
-            target_date = today - pd.Timedelta(days=1)
-            
-            # Validation: check if target date exists in dataset
-            if pd.isna(max_data_date) or target_date > max_data_date:
-                print(f"Warning: Requesting data for {target_date.date()} but dataset max date for {time_col} is {max_data_date}. Data might be incomplete or missing.")
-            
-            # Filter for that specific day
-            return df[df[time_col].dt.date == target_date.date()]
-        elif date_range == "last_30_days":
-            start_date = today - pd.Timedelta(days=30)
-            return df[df[time_col] >= start_date]
-        elif date_range == "last_7_days":
-            start_date = today - pd.Timedelta(days=7)
-            return df[df[time_col] >= start_date]
-        elif str(date_range).startswith("last_") and str(date_range).endswith("_days"):
-            try:
-                days = int(str(date_range).split("_")[1])
-                start_date = today - pd.Timedelta(days=days)
-                return df[df[time_col] >= start_date]
-            except Exception:
-                pass
-        elif str(date_range).startswith("last_") and str(date_range).endswith("_weeks"):
-            try:
-                weeks = int(str(date_range).split("_")[1])
-                start_date = today - pd.Timedelta(weeks=weeks)
-                return df[df[time_col] >= start_date]
-            except Exception:
-                pass
-        
-        # Try to parse specific date formats
-        if date_range:
-            # Support various separators including Chinese '至' and tilde
-            for sep in ['至', '～', '~']:
-                if sep in str(date_range):
-                    parts = str(date_range).split(sep)
-                    if len(parts) == 2:
-                        try:
-                            start = pd.to_datetime(parts[0].strip()).normalize()
-                            end = pd.to_datetime(parts[1].strip()).normalize()
-                            return df[(df[time_col] >= start) & (df[time_col] < end + pd.Timedelta(days=1))]
-                        except Exception:
-                            pass
-
-            # Support "至今" suffix (Chinese for "to present")
-            if '至今' in str(date_range):
-                start_str = str(date_range).replace('至今', '').strip()
-                try:
-                    start = pd.to_datetime(start_str).normalize()
-                    return df[df[time_col] >= start]
-                except Exception:
-                    pass
-
-            # Check for date range format: YYYY-MM-DD/YYYY-MM-DD
-            if '/' in date_range:
-                parts = date_range.split('/')
-                if len(parts) == 2:
-                    try:
-                        start = pd.to_datetime(parts[0]).normalize()
-                        end = pd.to_datetime(parts[1]).normalize()
-                        return df[(df[time_col] >= start) & (df[time_col] < end + pd.Timedelta(days=1))]
-                    except Exception:
-                        pass
-
-            # Support " to " separator
-            if ' to ' in date_range:
-                parts = date_range.split(' to ')
-                if len(parts) == 2:
-                    try:
-                        start = pd.to_datetime(parts[0]).normalize()
-                        end = pd.to_datetime(parts[1]).normalize()
-                        return df[(df[time_col] >= start) & (df[time_col] < end + pd.Timedelta(days=1))]
-                    except Exception:
-                        pass
-
-            try:
-                # YYYY (Year)
-                if re.match(r'^\d{4}$', date_range):
-                    year_val = int(date_range)
-                    return df[df[time_col].dt.year == year_val]
-                # YYYY-MM (Month)
-                if re.match(r'^\d{4}-\d{2}$', date_range):
-                    return df[df[time_col].dt.strftime('%Y-%m') == date_range]
-                # YYYY-MM-DD (Day)
-                if re.match(r'^\d{4}-\d{2}-\d{2}$', date_range):
-                    return df[df[time_col].dt.strftime('%Y-%m-%d') == date_range]
-            except Exception:
-                pass
+        # Calendar ranges (yesterday, last_N_days/weeks, YYYY[-MM[-DD]], a/b spans) share
+        # resolve_date_bounds with the mask-based paths; only row-context ranges fall through
+        bounds = self.resolve_date_bounds(date_range)
+        if bounds is not None:
+            if date_range == "yesterday":
+                # Validation: check if target date exists in dataset
+                target_date = bounds[0]
+                max_data_date = df[time_col].max()
+                if pd.isna(max_data_date) or target_date > max_data_date:
+                    print(f"Warning: Requesting data for {target_date.date()} but dataset max date for {time_col} is {max_data_date}. Data might be incomplete or missing.")
+            return df[self.bounds_mask(df, bounds, time_col)]
 
         # Handle "launch_plus_Nd" relative format
         if date_range.startswith("launch_plus_"):
@@ -392,6 +524,242 @@ class DataManager:
                 
         return df
     
+    def resolve_date_bounds(self, date_range: Optional[str]) -> Optional[Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]]:
+        """
+        Translate a date_range into [start, end) day bounds (the parser behind filter_data_on_df and date_mask).
+        Returns None when the range needs row context (e.g. launch_plus_Nd) or cannot be parsed,
+        so callers fall back to the row-level filter.
+        """
+        if not date_range:
+            return None
+        dr = str(date_range)
+        today = pd.Timestamp.now().normalize()
+        one_day = pd.Timedelta(days=1)
+
+        if dr == "yesterday":
+            target_date = today - one_day
+            return target_date, target_date + one_day
+        if dr.startswith("last_") and dr.endswith("_days"):
+            try:
+                return today - pd.Timedelta(days=int(dr.split("_")[1])), None
+            except Exception:
+                pass
+        elif dr.startswith("last_") and dr.endswith("_weeks"):
+            try:
+                return today - pd.Timedelta(weeks=int(dr.split("_")[1])), None
+            except Exception:
+                pass
+
+        for sep in ['至', '～', '~']:
+            if sep in dr:
+                parts = dr.split(sep)
+                if len(parts) == 2:
+                    try:
+                        start = pd.to_datetime(parts[0].strip()).normalize()
+                        end = pd.to_datetime(parts[1].strip()).normalize()
+                        return start, end + one_day
+                    except Exception:
+                        pass
+        if '至今' in dr:
+            try:
+                return pd.to_datetime(dr.replace('至今', '').strip()).normalize(), None
+            except Exception:
+                pass
+        for sep in ['/', ' to ']:
+            if sep in dr:
+                parts = dr.split(sep)
+                if len(parts) == 2:
+                    try:
+                        start = pd.to_datetime(parts[0]).normalize()
+                        end = pd.to_datetime(parts[1]).normalize()
+                        return start, end + one_day
+                    except Exception:
+                        pass
+
+        try:
+            if re.match(r'^\d{4}$', dr):
+                start = pd.Timestamp(year=int(dr), month=1, day=1)
+                return start, start + pd.DateOffset(years=1)
+            if re.match(r'^\d{4}-\d{2}$', dr):
+                start = pd.to_datetime(dr + "-01")
+                return start, start + pd.DateOffset(months=1)
+            if re.match(r'^\d{4}-\d{2}-\d{2}$', dr):
+                start = pd.to_datetime(dr)
+                return start, start + one_day
+        except Exception:
+            pass
+        return None
+
+    def get_cube(self, time_col: str, dimension: Optional[str] = None, require: Tuple[str, ...] = ()) -> Optional[DailyCube]:
+        """
+        Cached per-day counts of orders on `time_col` (optionally split by `dimension`),
+        built once per process from the full dataset. `require` lists extra columns that
+        must be non-null for a row to count (e.g. lock_time for invoices).
+        """
+        df = self.get_data()
+        if time_col not in df.columns or (dimension is not None and dimension not in df.columns):
+            return None
+        require = tuple(c for c in require if c != time_col)
+        if any(c not in df.columns for c in require):
+            return None
+        key = (time_col, dimension, require)
+        cube = self._cubes.get(key)
+        if cube is None:
+            with self._lock:
+                cube = self._cubes.get(key)
+                if cube is None:
+                    mask = None
+                    for c in require:
+                        present = df[c].notna().to_numpy()
+                        mask = present if mask is None else (mask & present)
+                    cube = DailyCube.from_frame(df, time_col, dimension, mask=mask)
+                    self._cubes[key] = cube
+        return cube
+
+    @staticmethod
+    def resolve_duration(metric: Optional[str]) -> Optional[Tuple[str, str]]:
+        """(start, end) columns for a registered duration name or a datediff('day', a, b) expression."""
+        if not isinstance(metric, str):
+            return None
+        if metric in DURATION_METRICS:
+            return DURATION_METRICS[metric]
+        m = _DATEDIFF_RE.search(metric)
+        return m.groups() if m else None
+
+    @staticmethod
+    def _as_datetime(series: pd.Series) -> pd.Series:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        parsed = pd.to_datetime(series, errors='coerce')
+        if parsed.isna().any() and series.dtype == 'object':
+            mask = parsed.isna() & series.notna()
+            if mask.any():
+                cleaned = series[mask].astype(str).str.replace('年', '-').str.replace('月', '-').str.replace('日', '')
+                parsed.loc[mask] = pd.to_datetime(cleaned, errors='coerce')
+        return parsed
+
+    def duration_values(self, start_col: str, end_col: str) -> Optional[pd.Series]:
+        """
+        Int32 Series (indexed like the order data) of whole days from start_col to
+        end_col, computed once per snapshot. Returns None if either column is missing.
+        """
+        key = (start_col, end_col)
+        durations = self.snapshot.durations
+        if key in durations:
+            return durations[key]
+        df = self.get_data()
+        if start_col not in df.columns or end_col not in df.columns:
+            return None
+        with self._lock:
+            if key not in durations:
+                start = self._as_datetime(df[start_col])
+                end = self._as_datetime(df[end_col])
+                durations[key] = (end - start).dt.days.astype("Int32")
+        return durations[key]
+
+    def get_assign_stats(self) -> AssignDailyStats:
+        """Cached dense daily sums of the assign data's columns (non-numeric cells count as 0)."""
+        key = ("assign_stats",)
+        stats = self._cubes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._cubes.get(key)
+                if stats is None:
+                    df = self.get_assign_data()
+                    stats = AssignDailyStats(df, [c for c in df.columns if c != "assign_date"])
+                    self._cubes[key] = stats
+        return stats
+
+    def get_duration_histogram(self, start_col: str, end_col: str) -> Optional[DailyHistogram]:
+        """
+        Cached per-day histograms of the start_col -> end_col duration, dated by end_col.
+        None when a column is missing or the value range is too wide for a dense table.
+        """
+        key = ("duration", start_col, end_col)
+        if key in self._cubes:
+            return self._cubes[key]
+        with self._lock:
+            if key in self._cubes:
+                return self._cubes[key]
+            durations = self.duration_values(start_col, end_col)
+            hist = None
+            if durations is not None:
+                df = self.get_data()
+                days = self._as_datetime(df[end_col]).to_numpy()
+                valid = durations.notna().to_numpy() & ~np.isnat(days)
+                values = durations.to_numpy(dtype=np.int64, na_value=0)
+                hist = DailyHistogram.from_arrays(days[valid], values[valid])
+            self._cubes[key] = hist
+        return hist
+
+    def get_value_histogram(self, column: str, time_col: str) -> Optional[DailyHistogram]:
+        """
+        Cached per-day histograms of a NUMERIC_METRICS column, dated by time_col. None
+        when it is not registered, a column is missing, or the table would be too large.
+        """
+        key = ("values", column, time_col)
+        if key in self._cubes:
+            return self._cubes[key]
+        with self._lock:
+            if key in self._cubes:
+                return self._cubes[key]
+            hist = None
+            df = self.get_data()
+            if column in NUMERIC_METRICS and column in df.columns and time_col in df.columns:
+                days = self._as_datetime(df[time_col]).to_numpy()
+                values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                valid = ~np.isnan(values) & ~np.isnat(days)
+                hist = DailyHistogram.from_arrays(days[valid], values[valid], NUMERIC_METRICS[column])
+            self._cubes[key] = hist
+        return hist
+
+    def date_mask(self, df: pd.DataFrame, date_range: Optional[str], time_col: str, base_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Boolean row mask for `date_range` on `time_col`, optionally ANDed with `base_mask`.
+        Parseable ranges are vectorized comparisons; others (e.g. launch_plus_Nd) fall back
+        to filter_data_on_df on the masked rows so series context is still honoured.
+        """
+        mask = np.ones(len(df), dtype=bool) if base_mask is None else np.asarray(base_mask, dtype=bool)
+        if not date_range:
+            return mask
+        if time_col not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        bounds = self.resolve_date_bounds(date_range)
+        if bounds is None:
+            in_range = self.filter_data_on_df(df[mask], date_range, time_col=time_col).index
+            return mask & df.index.isin(in_range)
+        return self.bounds_mask(df, bounds, time_col, base_mask=mask)
+
+    @staticmethod
+    def bounds_mask(df: pd.DataFrame, bounds: Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]], time_col: str, base_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boolean row mask for start <= time_col < end; a None bound is open."""
+        mask = np.ones(len(df), dtype=bool) if base_mask is None else np.asarray(base_mask, dtype=bool)
+        if time_col not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        t = df[time_col].to_numpy()
+        start, end = bounds
+        if start is not None:
+            mask = mask & (t >= np.datetime64(start))
+        if end is not None:
+            mask = mask & (t < np.datetime64(end))
+        return mask
+
+    def memoize(self, key, builder, maxsize: int = 64):
+        """
+        Small LRU for intermediate aggregates shared by tools within a process
+        (e.g. grouped counts reused by composition and pareto on the same slice).
+        """
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        value = builder()
+        with self._lock:
+            self._memo[key] = value
+            while len(self._memo) > maxsize:
+                self._memo.popitem(last=False)
+        return value
+
     def filter_assign_data(self, date_range: Optional[str] = None) -> pd.DataFrame:
         df = self.get_assign_data()
         if df.empty or not date_range:
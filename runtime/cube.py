@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class DailyCube:
+    """
+    Per-day row counts on one time axis, optionally split by one dimension.
+
+    Counts are stored as prefix sums over a dense calendar, so the total for any
+    [start, end) window is two row lookups instead of a rescan of the order data.
+    """
+
+    def __init__(
+        self,
+        first_day: Optional[pd.Timestamp],
+        all_counts: np.ndarray,
+        member_counts: Optional[np.ndarray] = None,
+        members: Optional[np.ndarray] = None,
+    ):
+        self.first_day = first_day
+        self.n_days = int(all_counts.shape[0])
+        self.members = members
+        # Prefix sums with a leading zero row: total(i0, i1) = P[i1] - P[i0]
+        self._all_prefix = np.concatenate([[0], np.cumsum(all_counts, dtype=np.int64)])
+        self._member_prefix = None
+        if member_counts is not None:
+            zero = np.zeros((1, member_counts.shape[1]), dtype=np.int64)
+            self._member_prefix = np.concatenate([zero, np.cumsum(member_counts, axis=0, dtype=np.int64)])
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        time_col: str,
+        dimension: Optional[str] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> "DailyCube":
+        if time_col not in df.columns:
+            return cls(None, np.zeros(0, dtype=np.int64))
+
+        valid = df[time_col].notna().to_numpy()
+        if mask is not None:
+            valid = valid & mask
+        days = df[time_col].to_numpy()[valid].astype("datetime64[D]")
+        if days.size == 0:
+            return cls(None, np.zeros(0, dtype=np.int64))
+
+        first = days.min()
+        day_codes = (days - first).astype(np.int64)
+        n_days = int(day_codes.max()) + 1
+        all_counts = np.bincount(day_codes, minlength=n_days)
+
+        member_counts = None
+        members = None
+        if dimension is not None and dimension in df.columns:
+            codes, members = pd.factorize(df[dimension].to_numpy()[valid])
+            has_member = codes >= 0
+            n_members = len(members)
+            flat = day_codes[has_member] * n_members + codes[has_member]
+            member_counts = np.bincount(flat, minlength=n_days * n_members).reshape(n_days, n_members)
+            members = np.asarray(members)
+
+        return cls(pd.Timestamp(first), all_counts, member_counts, members)
+
+    def _window(self, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> Tuple[int, int]:
+        if self.first_day is None:
+            return 0, 0
+        i0 = 0 if start is None else (pd.Timestamp(start).normalize() - self.first_day).days
+        i1 = self.n_days if end is None else (pd.Timestamp(end).normalize() - self.first_day).days
+        i0 = min(max(i0, 0), self.n_days)
+        i1 = min(max(i1, 0), self.n_days)
+        return i0, max(i0, i1)
+
+    def total(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> int:
+        """Row count in [start, end), including rows with a null dimension value."""
+        i0, i1 = self._window(start, end)
+        return int(self._all_prefix[i1] - self._all_prefix[i0])
+
+    def member_totals(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> np.ndarray:
+        """Per-member row counts in [start, end), aligned with `self.members`."""
+        if self._member_prefix is None:
+            return np.zeros(0, dtype=np.int64)
+        i0, i1 = self._window(start, end)
+        return self._member_prefix[i1] - self._member_prefix[i0]
+
+    def daily(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> pd.Series:
+        """Dense per-day row counts in [start, end), indexed by day."""
+        i0, i1 = self._window(start, end)
+        if i1 <= i0:
+            return pd.Series(dtype="int64", index=pd.DatetimeIndex([]))
+        counts = np.diff(self._all_prefix[i0:i1 + 1])
+        index = pd.date_range(self.first_day + pd.Timedelta(days=i0), periods=i1 - i0, freq="D")
+        return pd.Series(counts, index=index)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def top_n_indices(values: np.ndarray, n: int, ascending: bool = False) -> np.ndarray:
+    """
+    Indices of the n largest (or smallest) values, ordered best first.
+
+    Uses argpartition so only the selected n items are sorted, instead of the
+    whole aggregated array.
+    """
+    values = np.asarray(values)
+    size = values.shape[0]
+    if size == 0 or n is None or n <= 0:
+        return np.arange(0)
+    keys = values if ascending else -values
+    if n >= size:
+        return np.argsort(keys, kind="stable")
+    picked = np.argpartition(keys, n - 1)[:n]
+    return picked[np.argsort(keys[picked], kind="stable")]
+
+
+def ranked_shares(values: np.ndarray, total: float):
+    """
+    Rank grouped counts descending and return (order, share, cumulative_share).
+    Shares are relative to `total`, which may include rows outside the ranked groups.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(-values, kind="stable")
+    ranked = values[order]
+    if total > 0:
+        share = ranked / total
+        cumulative = np.cumsum(ranked) / total
+    else:
+        share = np.zeros_like(ranked)
+        cumulative = np.zeros_like(ranked)
+    return order, share, cumulative
+
+
+def grouped_box_stats(codes: np.ndarray, values: np.ndarray, n_groups: int, max_per_group=None, seed: int = 0):
+    """
+    Boxplot statistics per group code (codes in [0, n_groups); negative codes are skipped).
+
+    Returns a dict of arrays aligned with group code: count, mean, min, q1, median,
+    q3, max and sample_size. Quartiles use linear interpolation like pandas describe().
+    Count and mean always cover every value; when `max_per_group` is set, quartiles of
+    larger groups come from a uniform random sample of that many values.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    ok = (codes >= 0) & ~np.isnan(values)
+    codes = codes[ok]
+    values = values[ok]
+
+    count = np.bincount(codes, minlength=n_groups)
+    total = np.bincount(codes, weights=values, minlength=n_groups)
+    mean = np.divide(total, count, out=np.full(n_groups, np.nan), where=count > 0)
+
+    if max_per_group is not None and max_per_group > 0 and (count > max_per_group).any():
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(codes.shape[0]), codes))
+        starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+        rank = np.arange(order.shape[0]) - starts[codes[order]]
+        keep = order[rank < max_per_group]
+        codes = codes[keep]
+        values = values[keep]
+
+    size = np.bincount(codes, minlength=n_groups)
+    order = np.lexsort((values, codes))
+    ordered = values[order]
+    starts = np.concatenate([[0], np.cumsum(size)[:-1]])
+
+    stats = {"count": count, "mean": mean, "sample_size": size}
+    present = size > 0
+    for name, q in (("min", 0.0), ("q1", 0.25), ("median", 0.5), ("q3", 0.75), ("max", 1.0)):
+        out = np.full(n_groups, np.nan)
+        pos = q * (size[present] - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        base = starts[present]
+        x_lo = ordered[base + lo]
+        x_hi = ordered[base + hi]
+        out[present] = x_lo + (x_hi - x_lo) * (pos - lo)
+        stats[name] = out
+    return stats
@@ -0,0 +1,194 @@
+"""
+Content-addressed on-disk cache of chat-completion responses.
+
+The key is a hash of the request payload (model, messages and every other
+parameter) minus the transport-only `stream` / `stream_options`, so a streamed
+and a blocking call of the same prompt share one entry. Entries live as one JSON
+file each under `.cache/llm/`. `LLMClient` consults the cache according to its
+mode:
+
+    bypass   never read or write (default)
+    record   serve hits, call the API on a miss and store the response
+    replay   serve hits only; a miss is an error, so runs stay offline and deterministic
+
+Configuration: LLM_CACHE=bypass|record|replay, LLM_CACHE_DIR (default .cache/llm).
+
+    LLM_CACHE=record python pipelines/yesterday_lock_reasoner.py --date 2025-12-01
+    LLM_CACHE=replay python pipelines/yesterday_lock_reasoner.py --date 2025-12-01   # no network
+    python runtime/llm_cache.py stats
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+MODES = ("bypass", "record", "replay")
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "llm")
+
+# Request fields that change how the reply is delivered, not what it says
+_TRANSPORT_FIELDS = ("stream", "stream_options")
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    request = {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS}
+    canonical = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory: str = DEFAULT_DIR, mode: str = "record"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}', expected one of {MODES}")
+        self.directory = directory
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """The cache configured by LLM_CACHE / LLM_CACHE_DIR, None in bypass mode."""
+        mode = (os.environ.get("LLM_CACHE") or "bypass").strip().lower()
+        if mode in ("", "0", "off", "bypass"):
+            return None
+        return cls(os.environ.get("LLM_CACHE_DIR") or DEFAULT_DIR, mode)
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The cached response for `payload`, or None on a miss (always None in bypass mode)."""
+        if self.mode == "bypass":
+            return None
+        try:
+            with open(self._path(cache_key(payload)), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry["response"] if entry else None
+
+    def put(self, payload: Dict[str, Any], response: Dict[str, Any], elapsed_sec: Optional[float] = None) -> None:
+        if self.mode != "record":
+            return
+        key = cache_key(payload)
+        entry = {
+            "key": key,
+            "model": payload.get("model"),
+            "request": {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS},
+            "response": response,
+            "created": time.time(),
+            # Latency of the original call, for comparing replayed benchmark runs
+            "elapsed_sec": elapsed_sec,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def stats(self) -> Dict[str, Any]:
+        entries = 0
+        size = 0
+        models: Dict[str, int] = {}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    size += os.path.getsize(path)
+                    with open(path, "r", encoding="utf-8") as f:
+                        model = json.load(f).get("model") or "?"
+                except (OSError, ValueError):
+                    continue
+                entries += 1
+                models[model] = models.get(model, 0) + 1
+        return {"directory": self.directory, "entries": entries, "bytes": size, "models": models, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+
+def stream_chunks(response: Dict[str, Any]):
+    """A cached chat completion as the chunk sequence of a streamed reply (reasoning, content, usage)."""
+    choice = (response.get("choices") or [{}])[0]
+    message = choice.get("message") or {}
+    if message.get("reasoning_content"):
+        yield {"choices": [{"index": 0, "delta": {"reasoning_content": message["reasoning_content"]}, "finish_reason": None}]}
+    if message.get("content"):
+        yield {"choices": [{"index": 0, "delta": {"content": message["content"]}, "finish_reason": None}]}
+    yield {"choices": [], "usage": response.get("usage") or {}}
+
+
+class StreamRecorder:
+    """Accumulates streamed chunks into a regular chat.completion body for the cache."""
+
+    def __init__(self, model: Optional[str]):
+        self.model = model
+        self.content = []
+        self.reasoning = []
+        self.usage: Dict[str, Any] = {}
+        self.finish_reason = None
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        self.usage = chunk.get("usage") or self.usage
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            if delta.get("content"):
+                self.content.append(delta["content"])
+            if delta.get("reasoning_content"):
+                self.reasoning.append(delta["reasoning_content"])
+            self.finish_reason = choice.get("finish_reason") or self.finish_reason
+
+    def response(self) -> Dict[str, Any]:
+        message = {"role": "assistant", "content": "".join(self.content)}
+        if self.reasoning:
+            message["reasoning_content"] = "".join(self.reasoning)
+        return {
+            "object": "chat.completion",
+            "model": self.model,
+            "choices": [{"index": 0, "message": message, "finish_reason": self.finish_reason or "stop"}],
+            "usage": self.usage,
+        }
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("command", choices=["stats", "clear"])
+    p.add_argument("--dir", type=str, default=None, help="Cache directory (default: $LLM_CACHE_DIR or .cache/llm)")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    cache = ResponseCache(args.dir or os.environ.get("LLM_CACHE_DIR") or DEFAULT_DIR, "bypass")
+    if args.command == "clear":
+        cache.clear()
+        print(f"🧹 Cleared {cache.directory}")
+    else:
+        print(json.dumps(cache.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
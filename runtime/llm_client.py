@@ -0,0 +1,550 @@
+"""
+Shared HTTP client for the DeepSeek (OpenAI-compatible) API.
+
+Every agent and reasoner pipeline posts through one process-wide `LLMClient`
+(see `get_client()`), so connections are pooled and kept alive across calls and
+only the first request pays the TLS handshake. HTTP/2 is used when httpx + h2
+are installed, otherwise a stdlib keep-alive pool. Transient failures (connect
+errors, 429, 5xx) are retried with jittered exponential backoff, and a
+semaphore caps the number of in-flight requests.
+
+Configuration (constructor arguments win over the environment):
+    DEEPSEEK_BASE_URL     https://api.deepseek.com (point at runtime/llm_stub.py for offline runs)
+    LLM_CONNECT_TIMEOUT   10     seconds
+    LLM_READ_TIMEOUT      300    seconds; reasoner calls are slow
+    LLM_MAX_RETRIES       3
+    LLM_MAX_CONCURRENCY   4
+    LLM_POOL_SIZE         4      idle connections kept per host
+    LLM_HTTP2             auto   auto | 0 | 1
+    LLM_CACHE             bypass bypass | record | replay (see runtime/llm_cache.py)
+"""
+from __future__ import annotations
+
+import asyncio
+import http.client
+import json
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from runtime.llm_cache import ResponseCache, StreamRecorder, cache_key, stream_chunks
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+# Statuses worth another attempt; everything else is returned to the caller as is
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# A kept-alive connection the server already closed fails with one of these on reuse
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError)
+_TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+
+class StreamInterrupted(Exception):
+    """The connection dropped (or stalled past the read timeout) after the stream started."""
+
+
+class LLMError(Exception):
+    """Non-200 reply (after retries). `body` is the raw response text."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"{status} - {body}")
+        self.status = status
+        self.body = body
+
+
+class CacheMiss(LLMError):
+    """Replay mode and no cached response for the request (status 0: no request was sent)."""
+
+    def __init__(self, key: str):
+        super().__init__(0, f"No cached response for request {key[:16]} (LLM_CACHE=replay)")
+        self.key = key
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class _ConnectionPool:
+    """LIFO pool of keep-alive http.client connections to one host."""
+
+    def __init__(self, scheme: str, host: str, port: Optional[int], maxsize: int, connect_timeout: float):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.connect_timeout = connect_timeout
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context() if scheme == "https" else None
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """(connection, reused)."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout, context=self._ssl_context
+            )
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        return conn, False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class _StdlibTransport:
+    http_version = "HTTP/1.1"
+
+    def __init__(self, base_url: str, pool_size: int, connect_timeout: float):
+        parsed = urlparse(base_url)
+        self.prefix = parsed.path.rstrip("/")
+        self.pool = _ConnectionPool(parsed.scheme or "https", parsed.hostname, parsed.port, pool_size, connect_timeout)
+
+    def _open(self, path: str, body: bytes, headers: Dict[str, str], read_timeout: float):
+        """Send the request and return (connection, response) once the headers are in."""
+        while True:
+            conn, reused = self.pool.acquire()
+            try:
+                if conn.sock is None:
+                    try:
+                        conn.connect()
+                    except (socket.timeout, TimeoutError) as e:
+                        # Connect timeouts are retried; read timeouts are not
+                        raise ConnectionError(f"connect timeout: {e}") from e
+                conn.sock.settimeout(read_timeout)
+                conn.request("POST", self.prefix + path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if reused:
+                    continue  # the server dropped an idle connection; not a real failure
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def _finish(self, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse) -> None:
+        # Only a fully read response leaves the connection reusable
+        if resp.isclosed() and not resp.will_close:
+            self.pool.release(conn)
+        else:
+            conn.close()
+
+    def post(self, path: str, body: bytes, headers: Dict[str, str], read_timeout: float) -> Tuple[int, bytes]:
+        conn, resp = self._open(path, body, headers, read_timeout)
+        try:
+            data = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._finish(conn, resp)
+        return resp.status, data
+
+    @contextmanager
+    def stream(self, path: str, body: bytes, headers: Dict[str, str], read_timeout: float) -> Iterator[Tuple[int, Iterator[str]]]:
+        """(status, decoded lines without line endings); read timeouts apply per line."""
+        conn, resp = self._open(path, body, headers, read_timeout)
+
+        def lines() -> Iterator[str]:
+            for raw in iter(resp.readline, b""):
+                yield raw.decode("utf-8", errors="replace").rstrip("\r\n")
+
+        try:
+            yield resp.status, lines()
+        except BaseException:
+            conn.close()
+            raise
+        self._finish(conn, resp)
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class _HttpxTransport:
+    http_version = "HTTP/2"
+
+    def __init__(self, base_url: str, pool_size: int, connect_timeout: float):
+        import httpx
+
+        self.client = httpx.Client(
+            base_url=base_url,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(None, connect=connect_timeout),
+        )
+        self._timeout = httpx.Timeout
+        self.connect_timeout = connect_timeout
+
+    def post(self, path: str, body: bytes, headers: Dict[str, str], read_timeout: float) -> Tuple[int, bytes]:
+        import httpx
+
+        try:
+            resp = self.client.post(
+                path, content=body, headers=headers,
+                timeout=self._timeout(read_timeout, connect=self.connect_timeout),
+            )
+        except (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout) as e:
+            raise TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            # Same retry contract as the stdlib transport
+            raise ConnectionError(str(e)) from e
+        return resp.status_code, resp.content
+
+    @contextmanager
+    def stream(self, path: str, body: bytes, headers: Dict[str, str], read_timeout: float) -> Iterator[Tuple[int, Iterator[str]]]:
+        import httpx
+
+        def lines(resp) -> Iterator[str]:
+            try:
+                yield from resp.iter_lines()
+            except httpx.TransportError as e:
+                raise ConnectionError(str(e)) from e
+
+        try:
+            with self.client.stream(
+                "POST", path, content=body, headers=headers,
+                timeout=self._timeout(read_timeout, connect=self.connect_timeout),
+            ) as resp:
+                yield resp.status_code, lines(resp)
+        except (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout) as e:
+            raise TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class LLMClient:
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        pool_size: Optional[int] = None,
+        http2: Optional[bool] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.base_url = (base_url or os.environ.get("DEEPSEEK_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.connect_timeout = connect_timeout if connect_timeout is not None else _env_float("LLM_CONNECT_TIMEOUT", 10.0)
+        self.read_timeout = read_timeout if read_timeout is not None else _env_float("LLM_READ_TIMEOUT", 300.0)
+        self.max_retries = int(max_retries if max_retries is not None else _env_float("LLM_MAX_RETRIES", 3))
+        concurrency = int(max_concurrency if max_concurrency is not None else _env_float("LLM_MAX_CONCURRENCY", 4))
+        pool_size = int(pool_size if pool_size is not None else _env_float("LLM_POOL_SIZE", 4))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+
+        if http2 is None:
+            flag = os.environ.get("LLM_HTTP2", "auto").strip().lower()
+            http2 = _http2_available() if flag == "auto" else flag in ("1", "true", "yes")
+        if http2 and urlparse(self.base_url).scheme == "https":
+            self.transport = _HttpxTransport(self.base_url, pool_size, self.connect_timeout)
+        else:
+            self.transport = _StdlibTransport(self.base_url, pool_size, self.connect_timeout)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, path: str, payload: Dict[str, Any], api_key: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        POST `payload` to `path` and return the decoded JSON body.
+        Raises LLMError on a non-200 reply and the last transport error when retries run out.
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    status, data = self.transport.post(path, body, headers, read_timeout)
+            except (socket.timeout, TimeoutError):
+                # A read timeout on a slow completion is not worth repeating
+                raise
+            except _TRANSIENT_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if status == 200:
+                    return json.loads(data.decode("utf-8"))
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise LLMError(status, data.decode("utf-8", errors="replace"))
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    @property
+    def offline(self) -> bool:
+        """True when every reply comes from the response cache (replay mode)."""
+        return self.cache is not None and self.cache.replay
+
+    def _cached(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        response = self.cache.get(payload)
+        if response is None and self.cache.replay:
+            raise CacheMiss(cache_key(payload))
+        return response
+
+    def chat_completion(self, payload: Dict[str, Any], api_key: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """POST /chat/completions, served from / recorded to the response cache when one is configured."""
+        cached = self._cached(payload)
+        if cached is not None:
+            return cached
+        t0 = time.time()
+        data = self.post_json("/chat/completions", payload, api_key, timeout=timeout)
+        if self.cache is not None:
+            self.cache.put(payload, data, elapsed_sec=time.time() - t0)
+        return data
+
+    def stream_chat_completion(self, payload: Dict[str, Any], api_key: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the chunks of a streamed chat completion (server-sent events). Failures
+        before the first byte are retried like post_json; a drop afterwards raises
+        StreamInterrupted, since a partially consumed stream cannot be replayed.
+        Cached replies are replayed as a short chunk sequence; only complete streams are recorded.
+        """
+        cached = self._cached(payload)
+        if cached is not None:
+            yield from stream_chunks(cached)
+            return
+        if self.cache is None:
+            yield from self._stream_chat_completion(payload, api_key, timeout)
+            return
+        recorder = StreamRecorder(payload.get("model"))
+        t0 = time.time()
+        for chunk in self._stream_chat_completion(payload, api_key, timeout):
+            recorder.add(chunk)
+            yield chunk
+        self.cache.put(payload, recorder.response(), elapsed_sec=time.time() - t0)
+
+    def _stream_chat_completion(self, payload: Dict[str, Any], api_key: str, timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        }
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        attempt = 0
+        while True:
+            try:
+                with self._slots, self.transport.stream("/chat/completions", body, headers, read_timeout) as (status, lines):
+                    if status != 200:
+                        text = "\n".join(lines)
+                        if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                            raise LLMError(status, text)
+                    else:
+                        try:
+                            for line in lines:
+                                # Blank separators and ": keep-alive" comments carry no data
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    for _ in lines:  # drain so the connection can be reused
+                                        pass
+                                    return
+                                if data:
+                                    yield json.loads(data)
+                        except _TRANSIENT_ERRORS as e:
+                            raise StreamInterrupted(f"{type(e).__name__}: {e}") from e
+                        raise StreamInterrupted("stream ended without [DONE]")
+            except (socket.timeout, TimeoutError):
+                raise
+            except _TRANSIENT_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def achat_completion(self, payload: Dict[str, Any], api_key: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """chat_completion on a worker thread; the pool and the concurrency cap are shared with sync callers."""
+        return await asyncio.to_thread(self.chat_completion, payload, api_key, timeout)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimiter:
+    """
+    Caps concurrent tasks and spaces their starts at least 1 / `rate_per_sec` apart.
+
+        limiter = AsyncRateLimiter(concurrency=4, rate_per_sec=2)
+        async with limiter:
+            await client.achat_completion(...)
+    """
+
+    def __init__(self, concurrency: int = 4, rate_per_sec: Optional[float] = None):
+        self._sem = asyncio.Semaphore(max(1, int(concurrency)))
+        self._interval = 1.0 / rate_per_sec if rate_per_sec else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        await self._sem.acquire()
+        try:
+            if self._interval:
+                async with self._lock:
+                    loop = asyncio.get_running_loop()
+                    wait = self._next_start - loop.time()
+                    self._next_start = max(self._next_start, loop.time()) + self._interval
+                if wait > 0:
+                    await asyncio.sleep(wait)
+        except BaseException:
+            # Cancelled while waiting for the slot's start time; __aexit__ will not run
+            self._sem.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self._sem.release()
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """The process-wide client, created from the environment on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+
+def set_client(client: Optional[LLMClient]) -> None:
+    """Swap the shared client (e.g. one pointed at a stub server); None resets to the default."""
+    global _client
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None and old is not client:
+        old.close()
+
+
+def offline_api_key() -> Optional[str]:
+    """Placeholder API key when the shared client replays from the cache (no key needed), else None."""
+    return "replay" if get_client().offline else None
+
+
+def message_content(data: Dict[str, Any]) -> str:
+    """`choices[0].message.content` of a chat completion ("" when absent)."""
+    choices = data.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("message") or {}).get("content") or ""
+
+
+INTERRUPTED_NOTE = "\n\n⚠️ 连接中断，报告可能不完整。"
+
+
+def chat_text(
+    payload: Dict[str, Any],
+    api_key: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    client: Optional[LLMClient] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Run a chat completion and return (content, metrics).
+
+    With `on_delta` the reply is streamed and each content piece is passed to it as
+    it arrives; metrics then also carry `ttft_sec` (first token, reasoning included)
+    and `first_content_sec`. A stream that drops before any content is re-requested
+    without streaming; one that drops mid-report returns the partial text with a note
+    and `interrupted: True`. Non-200 replies raise LLMError.
+    """
+    client = client or get_client()
+    t0 = time.time()
+    if on_delta is None:
+        data = client.chat_completion({**payload, "stream": False}, api_key)
+        return message_content(data), {"elapsed_sec": time.time() - t0, "usage": data.get("usage", {})}
+
+    content: List[str] = []
+    usage: Dict[str, Any] = {}
+    metrics: Dict[str, Any] = {"streamed": True, "ttft_sec": None, "first_content_sec": None, "interrupted": False}
+    try:
+        for chunk in client.stream_chat_completion(payload, api_key):
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                delta = choice.get("delta") or {}
+                if metrics["ttft_sec"] is None and (delta.get("reasoning_content") or delta.get("content")):
+                    metrics["ttft_sec"] = time.time() - t0
+                piece = delta.get("content")
+                if piece:
+                    if metrics["first_content_sec"] is None:
+                        metrics["first_content_sec"] = time.time() - t0
+                    content.append(piece)
+                    on_delta(piece)
+    except StreamInterrupted as e:
+        metrics["interrupted"] = True
+        metrics["error"] = str(e)
+        if not content:
+            # Nothing shown yet: a blocking retry costs latency but keeps the report whole
+            data = client.chat_completion({**payload, "stream": False}, api_key)
+            text = message_content(data)
+            on_delta(text)
+            metrics.update({"fallback": True, "interrupted": False})
+            metrics["elapsed_sec"] = time.time() - t0
+            metrics["usage"] = data.get("usage", {})
+            return text, metrics
+        on_delta(INTERRUPTED_NOTE)
+        content.append(INTERRUPTED_NOTE)
+    metrics["elapsed_sec"] = time.time() - t0
+    metrics["usage"] = usage
+    return "".join(content), metrics
+
+
+def console_printer(prefix: str = "\n") -> Callable[[str], None]:
+    """on_delta callback that prints the streamed text; `prefix` goes out before the first piece."""
+    started = False
+
+    def emit(text: str) -> None:
+        nonlocal started
+        if not started:
+            print(prefix, end="")
+            started = True
+        print(text, end="", flush=True)
+
+    return emit
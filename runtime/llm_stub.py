@@ -0,0 +1,195 @@
+"""
+Local stand-in for the DeepSeek chat-completions endpoint.
+
+Lets the agents and reasoner pipelines run offline: start it, then point the
+shared client at it with DEEPSEEK_BASE_URL (any non-empty API key is accepted).
+
+    python runtime/llm_stub.py --port 8999 --reply '[]'
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8999 python agents/planning_agent.py "昨日销量如何"
+
+In-process:
+
+    with StubLLMServer(reply=lambda payload: "ok", fail_first=2) as stub:
+        set_client(LLMClient(base_url=stub.url))
+        ...
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Union
+
+Reply = Union[str, Callable[[Dict[str, Any]], str]]
+
+
+def echo_reply(payload: Dict[str, Any]) -> str:
+    """Default reply: the last user message, so callers can see what they sent."""
+    users = [m.get("content", "") for m in payload.get("messages") or [] if m.get("role") == "user"]
+    return f"[stub:{payload.get('model', '')}] {users[-1] if users else ''}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubHTTPServer"
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests.append({"path": self.path, "headers": dict(self.headers), "body": raw})
+            failing = stub.fail_first > 0
+            if failing:
+                stub.fail_first -= 1
+        if failing:
+            self._send(stub.fail_status, {"error": {"message": "stub failure"}})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"No route for {self.path}"}})
+            return
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            self._send(401, {"error": {"message": "Missing API key"}})
+            return
+        payload = json.loads(raw or b"{}")
+        if stub.delay:
+            time.sleep(stub.delay)
+        content = stub.reply(payload) if callable(stub.reply) else stub.reply
+        if payload.get("stream"):
+            self._stream(stub, payload, content)
+            return
+        self._send(200, {
+            "id": f"stub-{len(stub.requests)}",
+            "object": "chat.completion",
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _stream(self, stub: "StubLLMServer", payload: Dict[str, Any], content: str) -> None:
+        """Server-sent events in chunked encoding: reasoning pieces, content pieces, usage, [DONE]."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(obj: Any) -> None:
+            data = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False)
+            raw = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(raw):X}\r\n".encode("ascii") + raw + b"\r\n")
+            self.wfile.flush()
+
+        size = max(1, stub.stream_chunk_size)
+        deltas = [{"reasoning_content": "…"}] * stub.reasoning_chunks
+        deltas += [{"content": content[i:i + size]} for i in range(0, len(content), size)]
+        for n, delta in enumerate(deltas):
+            if stub.drop_stream_after is not None and n >= stub.drop_stream_after:
+                # Simulate a dropped connection: no terminating chunk
+                self.close_connection = True
+                return
+            event({"choices": [{"index": 0, "delta": delta, "finish_reason": None}], "model": payload.get("model", "")})
+            if stub.stream_delay:
+                time.sleep(stub.stream_delay)
+        event({"choices": [], "usage": {"prompt_tokens": 0, "completion_tokens": len(deltas), "total_tokens": len(deltas)}})
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubLLMServer"
+
+
+class StubLLMServer:
+    """
+    Threaded stub server on 127.0.0.1. `reply` is a fixed string or a callable over
+    the request payload; the first `fail_first` requests get `fail_status` (to
+    exercise retries). Received requests are kept in `requests`.
+
+    Requests with "stream": true get server-sent events: `reasoning_chunks` reasoning
+    deltas, then the reply in `stream_chunk_size`-character pieces `stream_delay`
+    seconds apart; `drop_stream_after` cuts the connection after that many deltas.
+    """
+
+    def __init__(
+        self,
+        reply: Reply = echo_reply,
+        port: int = 0,
+        fail_first: int = 0,
+        fail_status: int = 503,
+        delay: float = 0.0,
+        stream_chunk_size: int = 8,
+        stream_delay: float = 0.0,
+        reasoning_chunks: int = 0,
+        drop_stream_after: Optional[int] = None,
+    ):
+        self.reply = reply
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_delay = stream_delay
+        self.reasoning_chunks = reasoning_chunks
+        self.drop_stream_after = drop_stream_after
+        self.requests: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.httpd = _StubHTTPServer(("127.0.0.1", port), _StubHandler)
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("--port", type=int, default=8999)
+    p.add_argument("--reply", type=str, help="Fixed reply content (default: echo the last user message)")
+    p.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each reply")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    stub = StubLLMServer(reply=args.reply if args.reply is not None else echo_reply, port=args.port, delay=args.delay)
+    print(f"🧪 Stub LLM listening on {stub.url} (set DEEPSEEK_BASE_URL to use it)")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nBye! 👋")
+    finally:
+        stub.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
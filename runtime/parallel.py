@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from runtime.context import DataManager
+
+
+# Schema metadata key describing how the columns and index were encoded
+_META_KEY = b"bi_snapshot"
+
+
+def write_snapshot(dm: DataManager, directory: str) -> Dict[str, Optional[str]]:
+    """
+    Write the preprocessed order and assign data to uncompressed Arrow IPC files so
+    pool workers can memory-map them instead of re-reading and re-deriving the parquet.
+
+    Numeric and datetime columns are written as raw values (NaN kept as a value,
+    datetimes as int64 with NaT as its sentinel) without validity bitmaps, so workers
+    view them straight from the shared mapping. String, boolean and extension columns
+    are converted per worker and cost one private copy each.
+    """
+    import pyarrow as pa
+
+    paths: Dict[str, Optional[str]] = {}
+    for name, df in (("data", dm.get_data()), ("assign_data", dm.get_assign_data())):
+        if df is None or df.empty:
+            paths[name] = None
+            continue
+        arrays, names = [], []
+        meta: Dict[str, Any] = {"datetime": {}, "index": None}
+        columns = [(str(c), df[c]) for c in df.columns]
+        if isinstance(df.index, pd.RangeIndex):
+            meta["index"] = [df.index.start, df.index.stop, df.index.step]
+        else:
+            columns.append(("__index__", pd.Series(df.index)))
+        for col, series in columns:
+            # Plain numpy numeric / naive datetime columns are stored raw for zero-copy reads
+            raw = isinstance(series.dtype, np.dtype) and series.dtype.kind in "iufM"
+            values = series.to_numpy() if raw else None
+            if values is not None and values.dtype.kind == "M":
+                meta["datetime"][col] = str(values.dtype)
+                values = values.view("int64")
+            arrays.append(pa.array(values, from_pandas=False) if values is not None else pa.Array.from_pandas(series))
+            names.append(col)
+        table = pa.Table.from_arrays(arrays, names=names).replace_schema_metadata({_META_KEY: json.dumps(meta)})
+        path = os.path.join(directory, f"{name}.arrow")
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        paths[name] = path
+    return paths
+
+
+def _read_snapshot(path: Optional[str]) -> pd.DataFrame:
+    if path is None:
+        return pd.DataFrame()
+    import pyarrow as pa
+
+    # The arrays keep the mapping alive; raw columns are read-only views of the shared page cache
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all().combine_chunks()
+    meta = json.loads(table.schema.metadata[_META_KEY])
+    columns = {}
+    for col in table.column_names:
+        chunk = table.column(col).chunk(0) if table.column(col).num_chunks else pa.array([], table.schema.field(col).type)
+        if chunk.null_count == 0 and (pa.types.is_integer(chunk.type) or pa.types.is_floating(chunk.type)):
+            values = chunk.to_numpy(zero_copy_only=True)
+            if col in meta["datetime"]:
+                values = values.view(meta["datetime"][col])
+            columns[col] = values
+        else:
+            columns[col] = chunk.to_pandas().array
+    index = columns.pop("__index__", None)
+    if index is None:
+        index = pd.RangeIndex(*meta["index"])
+    return pd.DataFrame(columns, index=pd.Index(index), copy=False)
+
+
+def attach_snapshot(paths: Dict[str, Optional[str]], business_definition: Optional[dict]) -> None:
+    """Pool initializer: point this process's DataManager at the snapshot."""
+    dm = DataManager()
+    dm.data = _read_snapshot(paths.get("data"))
+    dm.assign_data = _read_snapshot(paths.get("assign_data"))
+    dm.business_definition = business_definition
+
+
+def parallel_map(fn: Callable[[Any], Any], items: Iterable[Any], workers: int) -> List[Any]:
+    """
+    Run `fn` over `items` on a process pool and return results in input order.
+
+    Workers are spawned (no inherited locks or sockets) and attach to an Arrow snapshot
+    of the parent's already-loaded data. `fn` must be importable at module level.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    dm = DataManager()
+    business_definition = dm.load_business_definition()
+    with tempfile.TemporaryDirectory(prefix="bi_snapshot_") as directory:
+        paths = write_snapshot(dm, directory)
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(items)),
+            mp_context=mp.get_context("spawn"),
+            initializer=attach_snapshot,
+            initargs=(paths, business_definition),
+        ) as pool:
+            return list(pool.map(fn, items))
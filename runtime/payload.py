@@ -0,0 +1,321 @@
+"""
+Compact context payloads for the reasoner pipelines.
+
+The reasoners used to send the whole execution-graph state (30-day TrendPoint
+series, histogram bins, every rollup row) as indented JSON. The builders here
+project only the fields their system prompts reference, round floats, drop
+empty values, and serialize without whitespace; `fit_budget` then shortens the
+longest lists until the payload fits a token budget.
+
+    payload = rate_payload(raw)                  # or lock_daily_payload / lock_range_payload
+    text, tokens = dump_payload(payload, max_tokens=REASONER_TOKEN_BUDGET)
+
+Long ranges are summarized hierarchically instead: `weekly_digests` aggregates the
+days locally, `segment_digests` splits the weeks into budget-sized groups, and
+`range_overview` gives the whole-range figures for the final merge.
+"""
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agents.prompt_builder import estimate_tokens
+
+# Upper bound on the reasoner user message, in estimated tokens
+REASONER_TOKEN_BUDGET = int(os.environ.get("REASONER_TOKEN_BUDGET", "3000"))
+
+FLOAT_DIGITS = 4
+# Rows kept from ranked lists (rollup rows, pareto, top movers)
+TOP_ROWS = 5
+
+_SIGNAL_FIELDS = (
+    "type", "metric", "dimension", "status", "flag", "risk_level", "anomaly_detected",
+    "z", "cv", "score", "share_z", "rate_z", "date_range", "message",
+)
+_POSITION_FIELDS = ("current_value", "historical_mean", "percentile", "z_score", "rank_desc")
+
+
+def round_floats(obj: Any, digits: int = FLOAT_DIGITS) -> Any:
+    """JSON-ready copy of `obj`: floats rounded, numpy scalars / dataclasses converted, None and empty values dropped."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        obj = dataclasses.asdict(obj)
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            v = round_floats(v, digits)
+            if v is None or v == {} or v == []:
+                continue
+            out[str(k)] = v
+        return out
+    if isinstance(obj, (list, tuple)):
+        return [round_floats(v, digits) for v in obj]
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, (int, np.integer)):
+        return int(obj)
+    if isinstance(obj, (float, np.floating)):
+        f = float(obj)
+        if not np.isfinite(f):
+            return None
+        r = round(f, digits)
+        return int(r) if r.is_integer() else r
+    if obj is None or isinstance(obj, str):
+        return obj
+    return str(obj)
+
+
+def _pick(d: Optional[Dict[str, Any]], fields: Iterable[str]) -> Dict[str, Any]:
+    d = d or {}
+    return {f: d[f] for f in fields if f in d}
+
+
+def compact_series(series: Optional[List[Any]]) -> Optional[Dict[str, Any]]:
+    """TrendPoint list -> {"end": last date, "values": [...]} (daily values ending at `end`)."""
+    points = [dataclasses.asdict(p) if dataclasses.is_dataclass(p) else p for p in series or []]
+    points = [p for p in points if isinstance(p, dict) and "date" in p]
+    if not points:
+        return None
+    return {"end": str(points[-1]["date"]), "values": [p.get("value") for p in points]}
+
+
+def compact_signals(signals: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [_pick(s, _SIGNAL_FIELDS) for s in signals or [] if isinstance(s, dict)]
+
+
+def compact_trend(result: Optional[Dict[str, Any]], keep_series: bool = False) -> Dict[str, Any]:
+    """Trend tool result: change / change_pct / yesterday_change, plus the series only when asked for."""
+    result = result or {}
+    out = _pick(result, ("metric", "compare_type", "date_range", "change", "change_pct", "yesterday_change"))
+    if keep_series:
+        out["series"] = compact_series(result.get("series"))
+    if result.get("signals"):
+        out["signals"] = compact_signals(result["signals"])
+    return out
+
+
+def compact_distribution(result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Distribution tool result: SAD score, position percentile / z, top movers; no bins or full shares."""
+    result = result or {}
+    out = _pick(result, ("metric", "dimension", "date_range"))
+    comparison = result.get("comparison") or {}
+    if comparison:
+        out["sad"] = comparison.get("distance")
+        out["threshold"] = comparison.get("threshold")
+    if result.get("position"):
+        out["position"] = _pick(result["position"], _POSITION_FIELDS)
+    elif result.get("distribution"):
+        out["distribution"] = result["distribution"][:TOP_ROWS]
+    by_dim = result.get("dimensions")
+    if isinstance(by_dim, dict):
+        # A dimension without a comparison range only has shares; keep their head
+        out["dimensions"] = {
+            dim: {"sad": v.get("distance"), "top_movers": (v.get("top_movers") or [])[:TOP_ROWS]}
+            if "distance" in v else {"distribution": (v.get("distribution") or [])[:TOP_ROWS]}
+            for dim, v in by_dim.items()
+            if isinstance(v, dict)
+        }
+    signals = [s for s in result.get("signals") or [] if isinstance(s, dict)]
+    if signals:
+        out["signals"] = [_pick(s, ("dimension", "status", "score", "message")) for s in signals]
+    return out
+
+
+def _compact_rows(result: Optional[Dict[str, Any]], key: str) -> Dict[str, Any]:
+    result = result or {}
+    out = _pick(result, ("dimension", "date_range"))
+    rows = result.get(key) or []
+    out[key] = rows[:TOP_ROWS]
+    if len(rows) > TOP_ROWS:
+        out[f"{key}_total"] = len(rows)
+    return out
+
+
+# ---------- per-pipeline projections ----------
+def lock_daily_payload(context_data: Dict[str, Any]) -> Dict[str, Any]:
+    """yesterday_lock_reasoner daily context -> fields the 每日经营诊断 prompt uses."""
+    results = context_data.get("results") or {}
+    anomaly = results.get("anomaly_check") or {}
+    payload = {
+        "date": context_data.get("date"),
+        "risk_assessment": context_data.get("risk_assessment"),
+        "sales": (results.get("baseline_query") or {}).get("value"),
+        "mom": compact_trend(results.get("short_term_trend")),
+        "wow": compact_trend(results.get("cycle_comparison")),
+        "vs_avg": _pick(anomaly, ("date_range", "value", "mean", "std")),
+        "structure": _compact_rows(results.get("structural_rollup"), "rows"),
+        "pareto": _compact_rows(results.get("pareto_scan"), "ranked"),
+        "distribution": compact_distribution(results.get("distribution_analysis")),
+        "signals": compact_signals(context_data.get("signals")),
+    }
+    return round_floats(payload)
+
+
+def lock_range_payload(daily_summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Range summary input: one row per day with the sales value, its mom / wow change and compact signals."""
+    days = []
+    for day in daily_summaries:
+        core = day.get("core_metric") or {}
+        days.append({
+            "date": day.get("date"),
+            "sales": core.get("value") if isinstance(core, dict) else core,
+            "mom": _pick(day.get("mom"), ("change", "change_pct")),
+            "wow": _pick(day.get("wow"), ("change", "change_pct")),
+            "signals": compact_signals(day.get("signals")),
+        })
+    return round_floats({"range_data": days})
+
+
+def rate_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """yesterday_rate_reasoner payload with the tool results reduced to what its prompt references."""
+    sales_orders = payload.get("sales_orders") or {}
+    out = {
+        "date": payload.get("date"),
+        "core": payload.get("core"),
+        "sales_orders": {
+            "structure": {k: compact_distribution(v) for k, v in (sales_orders.get("structure") or {}).items()},
+            # The prompt reads the 30-day shape from the series; changes come from yesterday_change
+            "trend": {k: compact_trend(v, keep_series=True) for k, v in (sales_orders.get("trend") or {}).items()},
+        },
+        "leads_trend": {k: compact_trend(v) for k, v in (payload.get("leads_trend") or {}).items()},
+        "rate_trend": {k: compact_distribution(v) for k, v in (payload.get("rate_trend") or {}).items()},
+        "signals": compact_signals(payload.get("signals")),
+    }
+    return round_floats(out)
+
+
+# ---------- hierarchical range summaries ----------
+def _salience(day: Dict[str, Any]) -> float:
+    """How anomalous a compact range day is: the largest |z| of a detected anomaly or abnormal shift score."""
+    best = 0.0
+    for s in day.get("signals") or []:
+        if s.get("anomaly_detected"):
+            best = max(best, abs(float(s.get("z") or 0.0)))
+        if s.get("status") == "abnormal":
+            best = max(best, float(s.get("score") or 0.0))
+    return best
+
+
+def _anomaly_day(day: Dict[str, Any]) -> Dict[str, Any]:
+    signals = [
+        _pick(s, ("type", "metric", "flag", "z", "score"))
+        for s in day.get("signals") or []
+        if s.get("anomaly_detected") or s.get("status") == "abnormal"
+    ]
+    return {"date": day.get("date"), "sales": day.get("sales"), "signals": signals}
+
+
+def _sales_stats(days: List[Dict[str, Any]], top_days: int) -> Dict[str, Any]:
+    valued = [d for d in days if isinstance(d.get("sales"), (int, float))]
+    out: Dict[str, Any] = {"days": len(days)}
+    if valued:
+        total = sum(d["sales"] for d in valued)
+        hi = max(valued, key=lambda d: d["sales"])
+        lo = min(valued, key=lambda d: d["sales"])
+        out.update({
+            "total": total,
+            "mean": total / len(valued),
+            "max": {"date": hi["date"], "sales": hi["sales"]},
+            "min": {"date": lo["date"], "sales": lo["sales"]},
+        })
+    salient = sorted((d for d in days if _salience(d) > 0), key=_salience, reverse=True)[:top_days]
+    out["anomaly_days"] = [_anomaly_day(d) for d in sorted(salient, key=lambda d: str(d.get("date")))]
+    return out
+
+
+def weekly_digests(days: List[Dict[str, Any]], top_days: int = 3) -> List[Dict[str, Any]]:
+    """
+    Monday-to-Sunday aggregates of `lock_range_payload` rows: total / mean / extreme
+    days and the `top_days` most anomalous days with only their abnormal signals.
+    """
+    weeks: Dict[str, List[Dict[str, Any]]] = {}
+    for day in days:
+        d = datetime.date.fromisoformat(str(day.get("date"))[:10])
+        weeks.setdefault((d - datetime.timedelta(days=d.weekday())).isoformat(), []).append(day)
+    digests = []
+    for start in sorted(weeks):
+        rows = weeks[start]
+        digests.append(round_floats({"week": f"{rows[0]['date']}~{rows[-1]['date']}", **_sales_stats(rows, top_days)}))
+    return digests
+
+
+def range_overview(days: List[Dict[str, Any]], top_days: int = 10) -> Dict[str, Any]:
+    """Whole-range aggregate in the same shape as a weekly digest."""
+    if not days:
+        return {}
+    return round_floats({"range": f"{days[0]['date']}~{days[-1]['date']}", **_sales_stats(days, top_days)})
+
+
+def segment_digests(digests: List[Dict[str, Any]], max_tokens: int) -> List[List[Dict[str, Any]]]:
+    """Consecutive digests grouped so that each group's compact JSON fits `max_tokens` (one digest minimum)."""
+    segments: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    for digest in digests:
+        if current and estimate_tokens(_dumps({"weekly": current + [digest]})) > max_tokens:
+            segments.append(current)
+            current = []
+        current.append(digest)
+    if current:
+        segments.append(current)
+    return segments
+
+
+# ---------- serialization ----------
+def _dumps(payload: Any) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _is_leaf(items: List[Any]) -> bool:
+    """True when no element of `items` holds a list itself."""
+    return not any(isinstance(x, list) for v in items for x in (v.values() if isinstance(v, dict) else [v]))
+
+
+def _lists(obj: Any, path: Tuple = ()) -> List[Tuple[Tuple, List[Any], int]]:
+    """(path, list, serialized size) for every list with more than one element."""
+    found = []
+    if isinstance(obj, list) and len(obj) > 1:
+        found.append((path, obj, len(_dumps(obj))))
+    children = obj.items() if isinstance(obj, dict) else enumerate(obj) if isinstance(obj, list) else ()
+    for k, v in children:
+        found.extend(_lists(v, path + (k,)))
+    return found
+
+
+def _is_dated(path: Tuple, items: List[Any]) -> bool:
+    return (bool(path) and path[-1] == "values") or all(isinstance(v, dict) and ("date" in v or "week" in v) for v in items)
+
+
+def fit_budget(payload: Dict[str, Any], max_tokens: int) -> Dict[str, Any]:
+    """
+    Halve the largest list until the serialized payload fits `max_tokens`. Lists
+    without nested lists go first, so per-day signals shrink before the days do;
+    series values and dated rows keep their most recent half, other lists
+    (ranked rows, signals) their head. Truncated paths are listed under "_truncated".
+    """
+    truncated: List[str] = []
+    while estimate_tokens(_dumps(payload)) > max_tokens:
+        lists = _lists(payload)
+        if not lists:
+            break
+        leaves = [c for c in lists if _is_leaf(c[1])]
+        path, items, _ = max(leaves or lists, key=lambda c: c[2])
+        keep = len(items) // 2
+        items[:] = items[-keep:] if _is_dated(path, items) else items[:keep]
+        label = ".".join(str(p) for p in path if not isinstance(p, int))
+        if label not in truncated:
+            truncated.append(label)
+    if truncated:
+        payload["_truncated"] = truncated
+    return payload
+
+
+def dump_payload(payload: Dict[str, Any], max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    """Compact JSON for the reasoner user message and its estimated token count."""
+    if max_tokens:
+        payload = fit_budget(payload, max_tokens)
+    text = _dumps(payload)
+    return text, estimate_tokens(text)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class ValueHistogram:
+    """
+    A multiset of numeric values stored as (sorted distinct values, counts).
+
+    Every statistic DistributionTool needs (percentiles, histograms, mean/std,
+    share below a value) is exact on this form, and two histograms over the same
+    value grid merge by adding counts.
+    """
+
+    def __init__(self, values: np.ndarray, counts: np.ndarray):
+        keep = counts > 0
+        self.values = np.asarray(values, dtype=np.float64)[keep]
+        self.counts = np.asarray(counts, dtype=np.int64)[keep]
+        self.n = int(self.counts.sum())
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "ValueHistogram":
+        arr = pd.to_numeric(series, errors="coerce").dropna().to_numpy(dtype=np.float64)
+        values, counts = np.unique(arr, return_counts=True)
+        return cls(values, counts)
+
+    @property
+    def empty(self) -> bool:
+        return self.n == 0
+
+    def merge(self, other: "ValueHistogram") -> "ValueHistogram":
+        values = np.concatenate([self.values, other.values])
+        counts = np.concatenate([self.counts, other.counts])
+        uniq, inverse = np.unique(values, return_inverse=True)
+        return ValueHistogram(uniq, np.bincount(inverse, weights=counts, minlength=len(uniq)).astype(np.int64))
+
+    def min(self) -> float:
+        return float(self.values[0])
+
+    def max(self) -> float:
+        return float(self.values[-1])
+
+    def mean(self) -> float:
+        return float(np.dot(self.values, self.counts) / self.n) if self.n else float("nan")
+
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1), matching pandas Series.std()."""
+        if self.n < 2:
+            return float("nan")
+        mu = self.mean()
+        return float(np.sqrt(np.dot(self.counts, (self.values - mu) ** 2) / (self.n - 1)))
+
+    def percentile(self, q: float) -> float:
+        """Same result as np.percentile on the expanded values (linear interpolation)."""
+        pos = q / 100.0 * (self.n - 1)
+        lo = int(np.floor(pos))
+        hi = int(np.ceil(pos))
+        cum = np.cumsum(self.counts)
+        x_lo = self.values[np.searchsorted(cum, lo, side="right")]
+        x_hi = self.values[np.searchsorted(cum, hi, side="right")]
+        return float(x_lo + (x_hi - x_lo) * (pos - lo))
+
+    def share_below(self, x: float) -> float:
+        """Fraction of values strictly below x."""
+        if not self.n:
+            return 0.0
+        k = np.searchsorted(self.values, x, side="left")
+        return float(self.counts[:k].sum() / self.n)
+
+    def histogram(self, bins, clip: Tuple[float, float], hist_range: Optional[Tuple[float, float]] = None):
+        """np.histogram of the values clipped to `clip`, weighted by counts."""
+        clipped = np.clip(self.values, clip[0], clip[1])
+        return np.histogram(clipped, bins=bins, range=hist_range, weights=self.counts)
+
+
+def binned_shares(primary: ValueHistogram, compare: Optional[ValueHistogram], bins):
+    """
+    Bin both histograms on shared edges spanning [min, P99] of their union (values
+    above P99 fall in the last bin). Returns (edges, upper_bound, primary_shares,
+    compare_shares); compare_shares is None without a comparison histogram.
+    """
+    combined = primary if compare is None else primary.merge(compare)
+    upper_bound = combined.percentile(99)
+    if upper_bound == combined.min():
+        upper_bound = combined.max()
+    hist_range = (combined.min(), upper_bound)
+    _, edges = combined.histogram(bins, clip=hist_range, hist_range=hist_range)
+
+    def shares(hist: ValueHistogram) -> np.ndarray:
+        counts, _ = hist.histogram(edges, clip=(edges[0], upper_bound))
+        if hist.n == 0:
+            return np.zeros(len(counts))
+        return counts / hist.n
+
+    return edges, upper_bound, shares(primary), (shares(compare) if compare is not None else None)
+
+
+class DailyHistogram:
+    """
+    Per-day histograms of a numeric metric, stored as prefix sums over a dense
+    calendar. The distribution over any [start, end) window is a row difference
+    instead of a rescan of raw orders. Values are rounded to multiples of `width`:
+    exact for integer-valued metrics (lead time in days, age) at width 1, fixed
+    bins for continuous ones (amounts).
+    """
+
+    # Refuse to build dense (days x values) tables larger than this many cells
+    MAX_CELLS = 8_000_000
+
+    def __init__(self, first_day: Optional[pd.Timestamp], min_value: int, counts: np.ndarray, width: float = 1):
+        self.first_day = first_day
+        self.min_value = int(min_value)
+        self.width = width
+        self.n_days = int(counts.shape[0])
+        self.grid = (self.min_value + np.arange(counts.shape[1] if counts.ndim == 2 else 0)) * width
+        zero = np.zeros((1, len(self.grid)), dtype=np.int64)
+        self._prefix = np.concatenate([zero, np.cumsum(counts, axis=0, dtype=np.int64)]) if counts.size else zero
+
+    @classmethod
+    def from_arrays(cls, days: np.ndarray, values: np.ndarray, width: float = 1) -> Optional["DailyHistogram"]:
+        """`days` are datetime64 event times, `values` numeric metric values; both non-null."""
+        days = np.asarray(days).astype("datetime64[D]")
+        if width == 1:
+            values = np.asarray(values, dtype=np.int64)
+        else:
+            values = np.rint(np.asarray(values, dtype=np.float64) / width).astype(np.int64)
+        if days.size == 0:
+            return cls(None, 0, np.zeros((0, 0), dtype=np.int64), width)
+        first = days.min()
+        day_codes = (days - first).astype(np.int64)
+        n_days = int(day_codes.max()) + 1
+        vmin = int(values.min())
+        n_values = int(values.max()) - vmin + 1
+        if n_days * n_values > cls.MAX_CELLS:
+            return None
+        flat = day_codes * n_values + (values - vmin)
+        counts = np.bincount(flat, minlength=n_days * n_values).reshape(n_days, n_values)
+        return cls(pd.Timestamp(first), vmin, counts, width)
+
+    def window(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> ValueHistogram:
+        """Merged histogram of all days in [start, end)."""
+        if self.first_day is None:
+            return ValueHistogram(np.zeros(0), np.zeros(0, dtype=np.int64))
+        i0 = 0 if start is None else (pd.Timestamp(start).normalize() - self.first_day).days
+        i1 = self.n_days if end is None else (pd.Timestamp(end).normalize() - self.first_day).days
+        i0 = min(max(i0, 0), self.n_days)
+        i1 = min(max(i1, i0), self.n_days)
+        return ValueHistogram(self.grid, self._prefix[i1] - self._prefix[i0])
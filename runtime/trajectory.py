@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+from runtime.context import DataManager
+from runtime.signals import classify_anomaly_from_stats
+from runtime.sketch import binned_shares
+
+# Mirrors the anomaly_check step wiring in agents/execution_graph.py
+BREADTH_DIMENSIONS = [
+    "store_name",
+    "store_city",
+    "parent_region_name",
+    "first_middle_channel_name",
+    "series_group",
+]
+CORE_METRICS = ["lock_rate", "delivery_rate"]
+LEAD_TIME_METRIC = "datediff('day',first_assign_time,lock_time)"
+
+
+def lock_trajectory(
+    start_date: str,
+    end_date: str,
+    history_days: int = 30,
+    bins: int = 30,
+    sad_threshold: float = 0.3,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Per-day results of the lock pipelines' DSL for every day in [start_date, end_date],
+    computed from daily arrays instead of one execution-graph run per day.
+
+    Each entry is {date, history_range, baseline_query, short_term_trend, cycle_comparison,
+    signals}; the trend entries hold the day-over-day (mom) and week-over-week (wow)
+    change of the lock count, as TrendTool reports for "yesterday". Signals carry the same
+    anomaly_decision / distribution_signal / data_quality_signal dicts the graph emits, so
+    the pipelines' risk assessment applies unchanged. Returns None when the lead-time
+    histograms cannot be built densely; callers then fall back to the per-day loop.
+    """
+    dm = DataManager()
+    dates = pd.date_range(pd.to_datetime(start_date).normalize(), pd.to_datetime(end_date).normalize(), freq="D")
+    if len(dates) == 0:
+        return []
+
+    lead_time = dm.get_duration_histogram("first_assign_time", "lock_time")
+    cube = dm.get_cube("lock_time")
+    if lead_time is None or cube is None:
+        return None
+
+    # Dense daily lock counts from the first history day (at least a week back) to the last target day
+    pad = max(history_days, 7)
+    first = dates[0] - pd.Timedelta(days=pad)
+    counts = cube.daily()
+    counts = counts.reindex(pd.date_range(first, dates[-1], freq="D"), fill_value=0).to_numpy(dtype=np.float64)
+
+    # anomaly_check: stats over the non-zero days in [d - history_days, d - 1]
+    # (TrendTool groups existing rows by day, so empty days do not enter mean/std)
+    nonzero = counts > 0
+    n_prefix, s1_prefix, s2_prefix = (np.concatenate([[0.0], np.cumsum(a)]) for a in (nonzero, counts, counts ** 2))
+    idx = np.arange(len(counts))
+    last_nonzero = np.maximum.accumulate(np.where(nonzero, idx, -1))
+
+    day_pos = idx[pad:]
+    lo, hi = day_pos - history_days, day_pos
+    n = n_prefix[hi] - n_prefix[lo]
+    s1 = s1_prefix[hi] - s1_prefix[lo]
+    s2 = s2_prefix[hi] - s2_prefix[lo]
+    mean = np.divide(s1, n, out=np.zeros_like(s1), where=n > 0)
+    var = np.divide(s2 - s1 * mean, n - 1, out=np.zeros_like(s1), where=n > 1)
+    std = np.sqrt(np.clip(var, 0.0, None))
+    last = last_nonzero[hi - 1]
+    value = np.where(n > 0, counts[np.clip(last, 0, None)], 0.0)
+
+    # mom / wow: the day's count against the previous day and the same weekday a week earlier
+    deltas = {}
+    for compare_type, lag in (("mom", 1), ("wow", 7)):
+        prev = counts[day_pos - lag]
+        change = counts[day_pos] - prev
+        deltas[compare_type] = (change, np.divide(change, prev, out=np.zeros_like(change), where=prev != 0))
+
+    trajectory = []
+    for k, day in enumerate(dates):
+        hist_s = day - pd.Timedelta(days=history_days)
+        hist_e = day - pd.Timedelta(days=1)
+        history_range = f"{hist_s.strftime('%Y-%m-%d')}/{hist_e.strftime('%Y-%m-%d')}"
+        locks = int(counts[pad + k])
+
+        decision = classify_anomaly_from_stats(value=float(value[k]), mean=float(mean[k]), std=float(std[k]))
+        signals = [{
+            "type": "anomaly_decision",
+            "flag": decision["flag"],
+            "z": decision["z"],
+            "cv": decision["cv"],
+            "anomaly_detected": decision["anomaly_detected"],
+            "metric": "sales",
+            "date_range": history_range,
+            "dimensions": list(BREADTH_DIMENSIONS),
+            "core_metrics": list(CORE_METRICS),
+        }]
+
+        # distribution_analysis: lead-time histogram of the day vs its history window
+        if locks == 0:
+            signals.append({
+                "type": "data_quality_signal",
+                "status": "warning",
+                "message": f"Insufficient data to calculate distribution for {LEAD_TIME_METRIC} in {day.strftime('%Y-%m-%d')}. (Sample size: 0)"
+            })
+        else:
+            primary = lead_time.window(day, day + pd.Timedelta(days=1))
+            compare = lead_time.window(hist_s, day)
+            if not primary.empty and not compare.empty:
+                _, _, p, c = binned_shares(primary, compare, bins)
+                sad = float(sum(abs(a - b) for a, b in zip(p, c)))
+                is_abnormal = sad > sad_threshold
+                current_mean = primary.mean()
+                percentile = compare.share_below(current_mean) * 100
+                std_hist = compare.std()
+                z_score = (current_mean - compare.mean()) / std_hist if std_hist > 1e-9 else 0.0
+                signals.append({
+                    "type": "distribution_signal",
+                    "metric": LEAD_TIME_METRIC,
+                    "status": "abnormal" if is_abnormal else "normal",
+                    "score": sad,
+                    "message": (
+                        f"Distribution difference score {sad:.2f} ({'Abnormal' if is_abnormal else 'Normal'})"
+                        f" | Position: P{percentile:.1f} (Z={z_score:.2f})"
+                    ),
+                })
+
+        trajectory.append({
+            "date": day.strftime("%Y-%m-%d"),
+            "history_range": history_range,
+            "baseline_query": {"value": locks, "metric": "sales", "sample_size": locks, "filters": None, "signals": []},
+            **{
+                key: {
+                    "metric": "sales",
+                    "time_grain": "day",
+                    "compare_type": compare_type,
+                    "date_range": day.strftime("%Y-%m-%d"),
+                    "change": float(deltas[compare_type][0][k]),
+                    "change_pct": float(deltas[compare_type][1][k]),
+                }
+                for key, compare_type in (("short_term_trend", "mom"), ("cycle_comparison", "wow"))
+            },
+            "signals": signals,
+        })
+    return trajectory
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import json
 from typing import Any, Dict, List
+import numpy as np
 import pandas as pd
 
 from tools.base import BaseTool
 from runtime.context import DataManager
+from runtime.cube import DailyCube
+from runtime.kernels import ranked_shares
 
 
 class AdditiveTool(BaseTool):
@@ -13,63 +17,174 @@ class AdditiveTool(BaseTool):
     def can_handle(self, step: dict) -> bool:
         return step.get("tool") == "additive"
 
+    def _baseline_bounds(self, dm: DataManager, date_range: Any, baseline_range: Any):
+        """Explicit baseline range, else the equal-length window right before date_range."""
+        if baseline_range:
+            return dm.resolve_date_bounds(baseline_range)
+        bounds = dm.resolve_date_bounds(date_range)
+        if bounds is None or bounds[0] is None:
+            return None
+        start, end = bounds
+        if end is None:
+            end = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+        return start - (end - start), start
+
+    def _member_counts(self, dm, metric, dims, date_range, filters, cur_bounds, base_bounds):
+        """
+        Current and baseline counts per member for every dimension. Unfiltered slices
+        with parseable ranges read the cached cubes; otherwise the slice is masked once
+        and each dimension is a single bincount over it.
+        """
+        time_col, require = _metric_axis(metric)
+        if metric in ['开票量', '开票数']:
+            # Additive invoice counts take every uploaded invoice, locked or not
+            require = ()
+        if not filters and cur_bounds is not None and (base_bounds is not None or date_range is None):
+            out = {}
+            cur_total = base_total = 0
+            for dim in dims:
+                cube = dm.get_cube(time_col, dim, require=require)
+                if cube is None:
+                    continue
+                cur = cube.member_totals(*cur_bounds)
+                base = cube.member_totals(*base_bounds) if base_bounds else np.zeros_like(cur)
+                cur_total = cube.total(*cur_bounds)
+                base_total = cube.total(*base_bounds) if base_bounds else 0
+                out[dim] = (cube.members, cur, base)
+            if out:
+                return out, cur_total, base_total
+
+        df = dm.get_data()
+        mask = dm.filter_mask(df, filters)
+        for c in (time_col,) + tuple(require):
+            if c in df.columns:
+                present = df[c].notna().to_numpy()
+                mask = present if mask is None else (mask & present)
+        cur_mask = dm.date_mask(df, date_range, time_col, base_mask=mask)
+        if base_bounds is not None:
+            base_mask = dm.bounds_mask(df, base_bounds, time_col, base_mask=mask)
+        else:
+            base_mask = np.zeros(len(df), dtype=bool)
+
+        rows = np.flatnonzero(cur_mask | base_mask)
+        w_cur = cur_mask[rows].astype(np.int64)
+        w_base = base_mask[rows].astype(np.int64)
+        out = {}
+        for dim in dims:
+            codes, members = pd.factorize(df[dim].to_numpy()[rows])
+            ok = codes >= 0
+            n = len(members)
+            cur = np.bincount(codes[ok], weights=w_cur[ok], minlength=n).astype(np.int64)
+            base = np.bincount(codes[ok], weights=w_base[ok], minlength=n).astype(np.int64)
+            out[dim] = (np.asarray(members), cur, base)
+        return out, int(w_cur.sum()), int(w_base.sum())
+
     def execute(self, step: dict, state: dict):
         params = step.get("parameters", {})
         metric = params.get("metric") or params.get("total_metric")
         dimensions = params.get("dimensions") or params.get("components") or []
         date_range = params.get("date_range")
+        filters = params.get("filters")
+        baseline_range = params.get("baseline_date_range") or params.get("compare_date_range")
+        top_k = int(params.get("top_k", 10))
 
         dm = DataManager()
-        
-        # Determine time column based on metric
-        check_metric = metric or params.get("total_metric")
-        time_col = 'order_create_date'
-        if check_metric in ['sales', '锁单量']:
-            time_col = 'lock_time'
-        elif check_metric in ['开票量', '开票数']:
-            time_col = 'invoice_upload_time'
-            
-        df = dm.filter_data(date_range, time_col=time_col)
-        
-        # Apply metric definition (check metric or total_metric)
-        if check_metric in ['sales', '锁单量'] and 'lock_time' in df.columns:
-            df = df[df['lock_time'].notna()]
-        elif check_metric in ['开票量', '开票数'] and 'invoice_upload_time' in df.columns:
-            df = df[df['invoice_upload_time'].notna()]
-            
-        total_val = len(df)
-
-        contributions: List[Dict[str, Any]] = []
-        
-        # Pick the first valid dimension to decompose by
-        target_dim = None
-        for dim in dimensions:
-            if dim in df.columns:
-                target_dim = dim
-                break
-        
-        if target_dim:
-            grouped = df.groupby(target_dim).size().sort_values(ascending=False)
-            contributions = [
-                {
-                    "dimension": str(k), 
-                    "value": int(v),
-                    "percent": float(v / total_val) if total_val > 0 else 0.0
+        df = dm.get_data()
+
+        valid_dims = [d for d in dict.fromkeys(dimensions) if isinstance(d, str) and d in df.columns]
+        cur_bounds = dm.resolve_date_bounds(date_range) if date_range else (None, None)
+        base_bounds = self._baseline_bounds(dm, date_range, baseline_range)
+
+        counts, total_val, baseline_total = self._member_counts(
+            dm, metric, valid_dims, date_range, filters, cur_bounds, base_bounds
+        )
+        has_baseline = base_bounds is not None
+        total_change = total_val - baseline_total
+
+        by_dimension: Dict[str, List[Dict[str, Any]]] = {}
+        drivers: List[Dict[str, Any]] = []
+        for dim, (members, cur, base) in counts.items():
+            present = (cur > 0) | (base > 0)
+            members, cur, base = members[present], cur[present], base[present]
+            delta = cur - base
+            share = cur / total_val if total_val > 0 else np.zeros(len(cur))
+            contrib = delta / total_change if total_change != 0 else np.zeros(len(delta))
+            # Rank by contribution to the change; without a baseline this is the value itself
+            order = np.argsort(-np.abs(delta if has_baseline else cur), kind="stable")
+            rows = []
+            for i in order:
+                row = {
+                    "dimension": str(members[i]),
+                    "value": int(cur[i]),
+                    "percent": float(share[i]),
                 }
-                for k, v in grouped.items()
-            ]
+                if has_baseline:
+                    row["baseline_value"] = int(base[i])
+                    row["delta"] = int(delta[i])
+                    row["contribution_to_change"] = float(contrib[i])
+                rows.append(row)
+            by_dimension[dim] = rows
+            drivers.extend({"field": dim, **r} for r in rows[:top_k])
+
+        rank_key = "delta" if has_baseline else "value"
+        drivers.sort(key=lambda r: -abs(r[rank_key]))
+
+        if valid_dims:
+            # Keep the single-dimension view (first valid dimension) for existing consumers
+            contributions = sorted(by_dimension[valid_dims[0]], key=lambda r: -r["value"])
         else:
-             contributions = [
+            contributions = [
                 {"dimension": "All", "value": total_val, "percent": 1.0},
             ]
 
-        return {
+        result = {
             "metric": metric,
             "dimensions": dimensions,
             "date_range": date_range,
+            "total": total_val,
             "contributions": contributions,
+            "by_dimension": by_dimension,
+            "drivers": drivers[:top_k],
             "signals": [],
         }
+        if has_baseline:
+            start, end = base_bounds
+            if end is None:
+                end = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+            result["baseline"] = {
+                "date_range": f"{start.date() if start is not None else ''}/{(end - pd.Timedelta(days=1)).date()}",
+                "total": baseline_total,
+                "change": total_change,
+            }
+        return result
+
+
+_ASSIGN_METRICS = [
+    "下发线索数", "下发线索当日试驾数", "下发线索 7 日试驾数", "下发线索 7 日锁单数",
+    "下发线索 30日试驾数", "下发线索 30 日锁单数", "下发门店数",
+    "下发线索当日锁单数 (门店)", "下发线索数 (门店)"
+]
+
+
+def _ratio_side(metric: Any):
+    """(time axis, column that must be non-null to count) for one side of a ratio."""
+    if metric in ["sales", "锁单量", "锁单数"]:
+        return "lock_time", "lock_time"
+    if metric in ["交付数", "交付量"]:
+        return "delivery_date", "delivery_date"
+    if metric in ["开票量", "开票数", "开票金额", "invoice_amount"]:
+        return "invoice_upload_time", None
+    return "order_create_date", None
+
+
+def _ratio_rows(labels, num: np.ndarray, den: np.ndarray, label_key: str) -> List[Dict[str, Any]]:
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    ratio = np.divide(num, den, out=np.zeros(len(num)), where=den > 0)
+    return [
+        {label_key: lbl, "numerator_value": int(n), "denominator_value": int(d), "ratio": float(r)}
+        for lbl, n, d, r in zip(labels, num, den, ratio)
+    ]
 
 
 class RatioTool(BaseTool):
@@ -78,112 +193,269 @@ class RatioTool(BaseTool):
     def can_handle(self, step: dict) -> bool:
         return step.get("tool") == "ratio"
 
+    @staticmethod
+    def _resample_rule(interval: Any) -> str:
+        return {"day": "D", "week": "W", "month": "ME", "year": "YE"}.get(str(interval), "D")
+
     def execute(self, step: dict, state: dict):
         params = step.get("parameters", {})
         date_range = params.get("date_range")
         metrics = params.get("metrics") or []
+        dimension = params.get("dimension")
+        interval = params.get("interval")
 
         dm = DataManager()
-        
-        # Determine time column based on metric (though Ratio tool handles multiple metrics, usually primary drives date filter)
-        # Defaulting to order_create_date as ratio usually implies a relationship over a common baseline (like orders created)
-        # But if specifically asking for "sales" (lock) ratio, maybe lock_time is better?
-        # Let's stick to order_create_date for Ratio unless strictly single metric 'sales'.
-        # Actually, for RatioTool, we often calculate rates (lock rate, delivery rate) on the base of Created Orders.
-        # So filtering by lock_time would be WRONG for "lock rate" (which is locks / created).
-        # Thus, we KEEP order_create_date as the time axis for RatioTool.
-        df = dm.filter_data(date_range)
-        
-        # Note: CompositionTool usually breaks down the same metric
-        # Wait, this is RatioTool...
-        
-        # If metric is 'sales' (unlikely for RatioTool which calculates rates), but let's see.
-        # RatioTool doesn't usually take a single 'metric' param that filters the whole dataset.
-        # It takes 'metrics' list (e.g. ['lock_rate']).
-        
-        # So we do NOT apply sales filter here.
-        
-        total = len(df)
-        
-        ratios = []
-        
-        if total > 0:
-            if "lock_rate" in metrics or (not metrics and "lock_time" in df.columns):
-                lock_count = df['lock_time'].notna().sum()
-                ratios.append({"name": "lock_rate", "value": float(lock_count / total)})
-                
-            if "delivery_rate" in metrics or (not metrics and "delivery_date" in df.columns):
-                delivery_count = df['delivery_date'].notna().sum()
-                ratios.append({"name": "delivery_rate", "value": float(delivery_count / total)})
-        else:
-            if "lock_rate" in metrics:
-                ratios.append({"name": "lock_rate", "value": 0.0})
-            if "delivery_rate" in metrics:
-                ratios.append({"name": "delivery_rate", "value": 0.0})
+        df = dm.get_data()
 
         # Handle numerator/denominator if provided
         if "numerator" in params and "denominator" in params:
-             num_metric = params["numerator"]
-             den_metric = params["denominator"]
-             filters = params.get("filters", [])
-             
-             # Helper to get value for a metric
-             def get_metric_value(metric_name, filters):
-                 # Check assign metrics
-                 assign_metrics = [
-                    "下发线索数", "下发线索当日试驾数", "下发线索 7 日试驾数", "下发线索 7 日锁单数",
-                    "下发线索 30日试驾数", "下发线索 30 日锁单数", "下发门店数",
-                    "下发线索当日锁单数 (门店)", "下发线索数 (门店)"
-                 ]
-                 if metric_name in assign_metrics:
-                     adf = dm.get_assign_data()
-                     adf = dm.filter_assign_data(date_range)
-                     # Apply filters if possible (assign data usually doesn't have series/product)
-                     # But we try anyway using dm.apply_filters
-                     adf = dm.apply_filters(adf, filters)
-                     return int(adf[metric_name].sum()) if not adf.empty and metric_name in adf.columns else 0
-                 
-                 # Order metrics
-                 odf = dm.get_data()
-                 time_col = "order_create_date"
-                 if metric_name in ["sales", "锁单量", "锁单数"]:
-                     time_col = "lock_time"
-                 elif metric_name in ["交付数", "交付量"]:
-                     time_col = "delivery_date"
-                 elif metric_name in ["开票量", "开票数", "开票金额", "invoice_amount"]:
-                     time_col = "invoice_upload_time"
-                 
-                 odf = dm.filter_data_on_df(odf, date_range, time_col)
-                 odf = dm.apply_filters(odf, filters)
-                 
-                 if metric_name in ["sales", "锁单量", "锁单数"]:
-                     return int(odf['lock_time'].notna().sum())
-                 elif metric_name in ["交付数", "交付量"]:
-                     return int(odf['delivery_date'].notna().sum())
-                 else:
-                     return len(odf) # Default count
-
-             num_val = get_metric_value(num_metric, filters)
-             den_val = get_metric_value(den_metric, filters)
-             
-             ratio = float(num_val / den_val) if den_val > 0 else 0.0
-             
-             return {
-                "date_range": date_range,
-                "ratio": ratio, 
-                "numerator": num_metric,
-                "denominator": den_metric,
-                "numerator_value": num_val,
-                "denominator_value": den_val,
-                "signals": [],
-            }
+            return self._execute_num_den(dm, df, params, date_range, dimension, interval)
 
-        return {
+        # Rates are measured on the base of created orders, so order_create_date is the
+        # time axis here (filtering by lock_time would be wrong for locks / created).
+        in_range = dm.date_mask(df, date_range, "order_create_date")
+        total = int(in_range.sum())
+
+        wanted = []
+        if "lock_rate" in metrics or (not metrics and "lock_time" in df.columns):
+            wanted.append(("lock_rate", "lock_time"))
+        if "delivery_rate" in metrics or (not metrics and "delivery_date" in df.columns):
+            wanted.append(("delivery_rate", "delivery_date"))
+
+        ratios = []
+        hits = {}
+        for name, col in wanted:
+            if col in df.columns:
+                hits[name] = in_range & df[col].notna().to_numpy()
+            else:
+                hits[name] = np.zeros(len(df), dtype=bool)
+            if total > 0:
+                ratios.append({"name": name, "value": float(hits[name].sum() / total)})
+            elif name in metrics:
+                ratios.append({"name": name, "value": 0.0})
+
+        result = {
             "date_range": date_range,
             "ratios": ratios,
             "signals": [],
         }
 
+        if dimension and dimension in df.columns and total > 0:
+            rows = np.flatnonzero(in_range)
+            codes, members = pd.factorize(df[dimension].to_numpy()[rows])
+            ok = codes >= 0
+            n = len(members)
+            base = np.bincount(codes[ok], minlength=n)
+            order = np.argsort(-base, kind="stable")
+            by_dim = []
+            per_rate = {
+                name: np.bincount(codes[ok], weights=hit[rows][ok].astype(np.float64), minlength=n)
+                for name, hit in hits.items()
+            }
+            for k in order:
+                row = {dimension: str(members[k]), "total": int(base[k])}
+                for name, cnt in per_rate.items():
+                    row[name] = float(cnt[k] / base[k]) if base[k] > 0 else 0.0
+                by_dim.append(row)
+            result["by_dimension"] = by_dim
+
+        if interval and total > 0:
+            rule = self._resample_rule(interval)
+            base = DailyCube.from_frame(df, "order_create_date", mask=in_range).daily().resample(rule).sum()
+            over_time = []
+            per_rate = {
+                name: DailyCube.from_frame(df, "order_create_date", mask=hit).daily().resample(rule).sum().reindex(base.index, fill_value=0)
+                for name, hit in hits.items()
+            }
+            for d, b in base.items():
+                row = {"date": str(d.date()), "total": int(b)}
+                for name, series in per_rate.items():
+                    row[name] = float(series[d] / b) if b > 0 else 0.0
+                over_time.append(row)
+            result["over_time"] = over_time
+
+        return result
+
+    def _execute_num_den(self, dm: DataManager, df: pd.DataFrame, params: dict, date_range, dimension, interval):
+        """
+        Plan numerator and denominator together: one shared filter mask, one date mask per
+        distinct time axis, and each side as a column predicate on top of them.
+        """
+        num_metric = params["numerator"]
+        den_metric = params["denominator"]
+        filters = params.get("filters", [])
+
+        shared_mask = dm.filter_mask(df, filters)
+        axis_masks: Dict[str, np.ndarray] = {}
+        assign_df = None
+
+        def side_mask(metric_name) -> np.ndarray:
+            time_col, count_col = _ratio_side(metric_name)
+            if time_col not in axis_masks:
+                axis_masks[time_col] = dm.date_mask(df, date_range, time_col, base_mask=shared_mask)
+            mask = axis_masks[time_col]
+            if count_col and count_col in df.columns:
+                mask = mask & df[count_col].notna().to_numpy()
+            return mask
+
+        def assign_frame() -> pd.DataFrame:
+            nonlocal assign_df
+            if assign_df is None:
+                # Assign data has no series/product dimensions; filters are applied best effort
+                assign_df = dm.apply_filters(dm.filter_assign_data(date_range), filters)
+            return assign_df
+
+        sides = {}
+        for metric_name in (num_metric, den_metric):
+            if metric_name in sides:
+                continue
+            if metric_name in _ASSIGN_METRICS:
+                adf = assign_frame()
+                value = int(adf[metric_name].sum()) if not adf.empty and metric_name in adf.columns else 0
+                sides[metric_name] = {"assign": True, "value": value}
+            else:
+                mask = side_mask(metric_name)
+                sides[metric_name] = {"assign": False, "value": int(mask.sum()), "mask": mask}
+
+        num_val = sides[num_metric]["value"]
+        den_val = sides[den_metric]["value"]
+        ratio = float(num_val / den_val) if den_val > 0 else 0.0
+
+        result = {
+            "date_range": date_range,
+            "ratio": ratio,
+            "numerator": num_metric,
+            "denominator": den_metric,
+            "numerator_value": num_val,
+            "denominator_value": den_val,
+            "signals": [],
+        }
+
+        order_sides = not sides[num_metric]["assign"] and not sides[den_metric]["assign"]
+        if dimension and order_sides and dimension in df.columns:
+            num_mask = sides[num_metric]["mask"]
+            den_mask = sides[den_metric]["mask"]
+            rows = np.flatnonzero(num_mask | den_mask)
+            codes, members = pd.factorize(df[dimension].to_numpy()[rows])
+            ok = codes >= 0
+            n = len(members)
+            num_counts = np.bincount(codes[ok], weights=num_mask[rows][ok].astype(np.float64), minlength=n)
+            den_counts = np.bincount(codes[ok], weights=den_mask[rows][ok].astype(np.float64), minlength=n)
+            order = np.argsort(-den_counts, kind="stable")
+            result["by_dimension"] = _ratio_rows(
+                [str(m) for m in np.asarray(members)[order]], num_counts[order], den_counts[order], dimension
+            )
+
+        if interval:
+            rule = self._resample_rule(interval)
+
+            def side_daily(metric_name) -> pd.Series:
+                side = sides[metric_name]
+                if side["assign"]:
+                    adf = assign_frame()
+                    if adf.empty or "assign_date" not in adf.columns:
+                        return pd.Series(dtype="float64")
+                    return adf.groupby(adf["assign_date"].dt.normalize())[metric_name].sum()
+                time_col, _ = _ratio_side(metric_name)
+                return DailyCube.from_frame(df, time_col, mask=side["mask"]).daily()
+
+            # Each side is bucketed on its own time axis, then aligned by bucket
+            num_series = side_daily(num_metric)
+            den_series = side_daily(den_metric)
+            if len(num_series) or len(den_series):
+                aligned = pd.concat([num_series.rename("num"), den_series.rename("den")], axis=1).fillna(0)
+                aligned = aligned.resample(rule).sum()
+                result["over_time"] = _ratio_rows(
+                    [str(d.date()) for d in aligned.index], aligned["num"].to_numpy(), aligned["den"].to_numpy(), "date"
+                )
+
+        return result
+
+
+def _share_time_col(metric: Any) -> str:
+    time_col = 'order_create_date'
+    if metric in ['sales', '锁单量']:
+        time_col = 'lock_time'
+    elif metric in ['开票量', '开票数']:
+        time_col = 'invoice_upload_time'
+    return time_col
+
+
+def _interval_rule(interval: Any) -> str:
+    rule = 'D'
+    if interval == 'week': rule = 'W'
+    elif interval == 'month': rule = 'ME'
+    elif interval == 'year': rule = 'YE'
+    return rule
+
+
+def grouped_share_counts(
+    dm: DataManager,
+    metric: Any,
+    dimension: str,
+    date_range: Any,
+    filters: Any = None,
+    interval: Any = None,
+) -> Dict[str, Any]:
+    """
+    Grouped row counts for one metric slice, computed once and memoized on the
+    DataManager so composition and pareto over the same slice share a single aggregation.
+
+    Returns {"counts": Series, "totals": int | Series, "found": bool}. For interval mode,
+    counts are indexed by (bucket, member) and totals by bucket; rows with a null member
+    still count towards the totals, matching the previous per-bucket Grouper totals.
+    """
+    time_col = _share_time_col(metric)
+    rule = _interval_rule(interval) if interval else None
+    key = (
+        "share_counts",
+        str(metric),
+        dimension,
+        str(date_range),
+        json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str),
+        rule,
+        str(pd.Timestamp.now().normalize().date()),
+    )
+
+    def build() -> Dict[str, Any]:
+        # Unfiltered static shares of a single-axis count come straight from the daily cube
+        bounds = dm.resolve_date_bounds(date_range)
+        if not filters and not rule and bounds is not None and metric not in ['开票量', '开票数']:
+            cube = dm.get_cube(time_col, dimension)
+            if cube is not None:
+                totals = cube.member_totals(*bounds)
+                present = totals > 0
+                counts = pd.Series(totals[present], index=cube.members[present])
+                return {"counts": counts, "totals": cube.total(*bounds), "found": True}
+
+        # Strategy: Apply filters first (for series/launch date context), then date filter
+        df = dm.apply_filters(dm.get_data(), filters)
+        df = dm.filter_data_on_df(df, date_range, time_col=time_col)
+
+        if metric in ['sales', '锁单量'] and 'lock_time' in df.columns:
+            df = df[df['lock_time'].notna()]
+        elif metric in ['开票量', '开票数'] and 'invoice_upload_time' in df.columns and 'lock_time' in df.columns:
+            df = df[df['invoice_upload_time'].notna() & df['lock_time'].notna()]
+
+        if df.empty or dimension not in df.columns:
+            return {"counts": pd.Series(dtype="int64"), "totals": len(df), "found": dimension in df.columns}
+
+        if rule:
+            # One grouping over (bucket, member); bucket totals are summed from it
+            grouped = df.groupby([pd.Grouper(key=time_col, freq=rule), dimension], dropna=False).size()
+            totals = grouped.groupby(level=0).sum()
+            members = grouped.index.get_level_values(1)
+            buckets = grouped.index.get_level_values(0)
+            grouped = grouped[~(pd.isna(members) | pd.isna(buckets)) & (grouped.to_numpy() > 0)]
+            return {"counts": grouped, "totals": totals, "found": True}
+
+        grouped = df.groupby(dimension, dropna=False).size()
+        total = int(grouped.sum())
+        grouped = grouped[~pd.isna(grouped.index)]
+        return {"counts": grouped, "totals": total, "found": True}
+
+    return dm.memoize(key, build)
+
 
 class CompositionTool(BaseTool):
     name = "composition"
@@ -200,70 +472,49 @@ class CompositionTool(BaseTool):
         filters = params.get("filters") # New: Support filters
 
         dm = DataManager()
-        
-        # Determine time column based on metric
-        time_col = 'order_create_date'
-        if metric in ['sales', '锁单量']:
-            time_col = 'lock_time'
-        elif metric in ['开票量', '开票数']:
-            time_col = 'invoice_upload_time'
-            
-        # Strategy: Apply filters first (for series/launch date context), then date filter
-        df = dm.get_data()
-        
-        # Apply filters
-        df = dm.apply_filters(df, filters)
-        
-        # Apply date range (using pre-filtered DF to support launch_plus logic)
-        df = dm.filter_data_on_df(df, date_range, time_col=time_col)
-        
-        if metric in ['sales', '锁单量'] and 'lock_time' in df.columns:
-            df = df[df['lock_time'].notna()]
-        elif metric in ['开票量', '开票数'] and 'invoice_upload_time' in df.columns and 'lock_time' in df.columns:
-            df = df[df['invoice_upload_time'].notna() & df['lock_time'].notna()]
-            
+
         rows = []
-        
-        if not df.empty and dimension and dimension in df.columns:
-            if interval:
+
+        if dimension:
+            shared = grouped_share_counts(dm, metric, dimension, date_range, filters, interval)
+            counts = shared["counts"]
+            if interval and not counts.empty:
                 # Time-series composition
-                rule = 'D'
-                if interval == 'week': rule = 'W'
-                elif interval == 'month': rule = 'ME'
-                elif interval == 'year': rule = 'YE'
-                
-                # Group by Time and Dimension
-                # We need to set index to time_col for Grouper to work
-                df_indexed = df.set_index(time_col)
-                grouped = df_indexed.groupby([pd.Grouper(freq=rule), dimension]).size()
-                
-                # Calculate totals per time bucket for percentage
-                totals = df_indexed.groupby(pd.Grouper(freq=rule)).size()
-                
-                for (time_val, dim_val), count in grouped.items():
-                    total_in_bucket = totals.get(time_val, 0)
+                totals = shared["totals"]
+                bucket_totals = totals.reindex(counts.index.get_level_values(0)).to_numpy(dtype=float)
+                values = counts.to_numpy()
+                percents = np.divide(values, bucket_totals, out=np.zeros(len(values)), where=bucket_totals > 0)
+                for ((time_val, dim_val), count, pct) in zip(counts.index, values, percents):
                     rows.append({
                         "date": str(time_val.date()),
                         dimension: str(dim_val),
                         "value": int(count),
-                        "percent": float(count / total_in_bucket) if total_in_bucket > 0 else 0.0
+                        "percent": float(pct)
                     })
-            else:
-                # Static composition (existing logic)
-                total = len(df)
-                grouped = df.groupby(dimension).size().sort_values(ascending=False)
+            elif not counts.empty:
+                # Static composition
+                order, share, _ = ranked_shares(counts.to_numpy(), shared["totals"])
+                labels = counts.index[order]
+                values = counts.to_numpy()[order]
                 rows = [
                     {
-                        dimension: str(k), 
+                        dimension: str(k),
                         "value": int(v),
-                        "percent": float(v / total) if total > 0 else 0.0
+                        "percent": float(p)
                     }
-                    for k, v in grouped.items()
+                    for k, v, p in zip(labels, values, share)
                 ]
-        elif not df.empty and not dimension:
-             # Fallback if no dimension provided (just total)
-             total = len(df)
-             rows = [{"value": total, "percent": 1.0}]
+        else:
+            # Fallback if no dimension provided (just total)
+            time_col = _share_time_col(metric)
+            df = dm.apply_filters(dm.get_data(), filters)
+            df = dm.filter_data_on_df(df, date_range, time_col=time_col)
+            if metric in ['sales', '锁单量'] and 'lock_time' in df.columns:
+                df = df[df['lock_time'].notna()]
+            elif metric in ['开票量', '开票数'] and 'invoice_upload_time' in df.columns and 'lock_time' in df.columns:
+                df = df[df['invoice_upload_time'].notna() & df['lock_time'].notna()]
+            if not df.empty:
+                rows = [{"value": len(df), "percent": 1.0}]
 
         return {
             "metric": metric,
@@ -286,30 +537,27 @@ class ParetoTool(BaseTool):
         metric = params.get("metric")
         dimension = params.get("dimension")
         date_range = params.get("date_range")
+        filters = params.get("filters")
 
         dm = DataManager()
-        
-        # Determine time column based on metric
-        time_col = 'order_create_date'
-        if metric in ['sales', '锁单量']:
-            time_col = 'lock_time'
-        elif metric in ['开票量']:
-            time_col = 'invoice_upload_time'
-            
-        df = dm.filter_data(date_range, time_col=time_col)
-        total = len(df)
-        
+
         ranked = []
-        if dimension and dimension in df.columns:
-            grouped = df.groupby(dimension).size().sort_values(ascending=False)
-            cumulative = 0
-            for k, v in grouped.items():
-                cumulative += v
-                ranked.append({
-                    "dimension": str(k), 
-                    "value": int(v),
-                    "cumulative_percent": float(cumulative / total) if total > 0 else 0.0
-                })
+        if dimension:
+            # Same memoized grouping as CompositionTool for this slice
+            shared = grouped_share_counts(dm, metric, dimension, date_range, filters)
+            counts = shared["counts"]
+            if not counts.empty:
+                order, _, cumulative = ranked_shares(counts.to_numpy(), shared["totals"])
+                labels = counts.index[order]
+                values = counts.to_numpy()[order]
+                ranked = [
+                    {
+                        "dimension": str(k),
+                        "value": int(v),
+                        "cumulative_percent": float(c)
+                    }
+                    for k, v, c in zip(labels, values, cumulative)
+                ]
 
         return {
             "metric": metric,
@@ -320,12 +568,53 @@ class ParetoTool(BaseTool):
         }
 
 
+def _metric_axis(metric: Any):
+    """Time axis and extra non-null columns that define a count metric."""
+    if metric in ['sales', '锁单量', '锁单数']:
+        return 'lock_time', ()
+    if metric in ['开票量', '开票数']:
+        return 'invoice_upload_time', ('lock_time',)
+    if metric in ['交付数', '交付量']:
+        return 'delivery_date', ()
+    if metric in ['小订数', '小订量']:
+        return 'intention_payment_time', ()
+    return 'order_create_date', ()
+
+
 class DualAxisTool(BaseTool):
     name = "dual_axis"
 
     def can_handle(self, step: dict) -> bool:
         return step.get("tool") == "dual_axis"
 
+    def _daily_counts(self, dm: DataManager, metric: Any, date_range: Any, filters: Any) -> pd.Series:
+        """
+        Dense daily counts of `metric` on its own time axis. Unfiltered metrics are read
+        from the cached cube; filtered ones build a throwaway cube from a row mask, so the
+        order frame is never copied.
+        """
+        time_col, require = _metric_axis(metric)
+        bounds = dm.resolve_date_bounds(date_range) if date_range else (None, None)
+        if not filters and bounds is not None:
+            cube = dm.get_cube(time_col, require=require)
+            return cube.daily(*bounds) if cube is not None else pd.Series(dtype="int64")
+
+        df = dm.get_data()
+        if time_col not in df.columns:
+            return pd.Series(dtype="int64")
+        mask = dm.filter_mask(df, filters)
+        if mask is None:
+            mask = np.ones(len(df), dtype=bool)
+        for c in require:
+            if c in df.columns:
+                mask = mask & df[c].notna().to_numpy()
+        if bounds is None:
+            # Relative ranges such as launch_plus_Nd need the filtered rows for context
+            in_range = dm.filter_data_on_df(df[mask], date_range, time_col=time_col).index
+            mask = df.index.isin(in_range)
+            bounds = (None, None)
+        return DailyCube.from_frame(df, time_col, mask=mask).daily(*bounds)
+
     def execute(self, step: dict, state: dict):
         params = step.get("parameters", {})
         left_metric = params.get("left_metric")
@@ -334,103 +623,40 @@ class DualAxisTool(BaseTool):
         date_range = params.get("date_range")
 
         dm = DataManager()
-        
-        # DualAxis is tricky because it involves TWO metrics potentially with different time axes.
-        # However, usually we align on a primary time axis (order_create_date) or the time axis of the left metric.
-        # If left_metric is sales, we might want to use lock_time as the axis.
-        # But right_metric might be something else.
-        # Simplification: Use order_create_date as the common timeline for now, 
-        # unless both imply lock_time.
-        # Or, we fetch full data and resample separately.
-        
-        # Let's fetch FULL data for the range (using broad filter if possible, or just all data and filter in memory)
-        # But filter_data applies date_range on ONE column.
-        # If we use order_create_date, we might miss orders created earlier but locked in range.
-        
-        # Better approach for DualAxis: Get all data for the broad period relative to TODAY, 
-        # then resample each metric on its own appropriate time column.
-        
-        # But filter_data is designed for single date_range.
-        # Let's try to infer a "safe" range. 
-        # If date_range is relative (last_12_weeks), we can calculate start date.
-        
-        # Actually, let's stick to order_create_date for the *Timeline Axis* of the chart.
-        # In BI, usually "Weekly Sales" chart uses the date the order was booked (locked) or created.
-        # If users want to see "Sales by Lock Date", the x-axis is Lock Date.
-        # If users want "Sales by Create Date", x-axis is Create Date.
-        
-        # Given "Sales" = "Locked Orders", the X-Axis should likely be Lock Time.
-        # If Left Metric is Sales, let's assume X-Axis is Lock Time.
-        
-        time_col = 'order_create_date'
-        if left_metric in ['sales', '锁单量']:
-            time_col = 'lock_time'
-            
-        df = dm.filter_data(date_range, time_col=time_col)
-        
+
         filters_left = params.get("filters_left") or params.get("filters")
         filters_right = params.get("filters_right")
 
-        # Note: DualAxis might use different metrics for left/right
-        # If left_metric is sales, apply filter for left series calculation
-        
+        # Each metric is counted on its own time axis (e.g. sales on lock_time, invoices on
+        # invoice_upload_time), then both are aligned on a shared dense calendar.
+        left_daily = self._daily_counts(dm, left_metric, date_range, filters_left)
+        right_daily = self._daily_counts(dm, right_metric, date_range, filters_right)
+
         series = []
-        if not df.empty:
-            base_df = df.copy()
+        active = [d[d > 0] for d in (left_daily, right_daily) if (d > 0).any()]
+        if active:
+            first = min(d.index[0] for d in active)
+            last = max(d.index[-1] for d in active)
+            calendar = pd.date_range(first, last, freq='D')
+            left = left_daily.reindex(calendar, fill_value=0)
+            right = right_daily.reindex(calendar, fill_value=0)
+
             rule = 'W'
             if time_grain == 'day':
                 rule = 'D'
             elif time_grain == 'month':
                 rule = 'ME'
+            left = left.resample(rule).sum()
+            right = right.resample(rule).sum()
 
-            # --- Left Series Calculation ---
-            # Apply left filters
-            df_left_filtered = dm.apply_filters(base_df, filters_left)
-            
-            if left_metric in ['sales', '锁单量']:
-                 # Ensure lock_time exists for sales
-                 if 'lock_time' in df_left_filtered.columns:
-                     df_left_filtered = df_left_filtered[df_left_filtered['lock_time'].notna()]
-            
-            # Resample left
-            if not df_left_filtered.empty:
-                left_series = df_left_filtered.set_index(time_col).resample(rule).size()
-            else:
-                left_series = pd.Series(dtype=int)
-
-            # --- Right Series Calculation ---
-            # Apply right filters
-            df_right_filtered = dm.apply_filters(base_df, filters_right)
-            
-            if right_metric in ['sales', '锁单量']:
-                if 'lock_time' in df_right_filtered.columns:
-                    df_right_filtered = df_right_filtered[df_right_filtered['lock_time'].notna()]
-            elif right_metric in ['开票量', '开票数']:
-                if 'invoice_upload_time' in df_right_filtered.columns and 'lock_time' in df_right_filtered.columns:
-                    df_right_filtered = df_right_filtered[
-                        df_right_filtered['invoice_upload_time'].notna() & 
-                        df_right_filtered['lock_time'].notna()
-                    ]
-            
-            # Resample right
-            if not df_right_filtered.empty:
-                right_series = df_right_filtered.set_index(time_col).resample(rule).size()
-            else:
-                right_series = pd.Series(dtype=int)
-            
-            # --- Align and Merge ---
-            # Union of indexes to ensure we cover both ranges
-            all_dates = sorted(list(set(left_series.index) | set(right_series.index)))
-            
-            for d in all_dates:
-                l_val = left_series.get(d, 0)
-                r_val = right_series.get(d, 0)
-                
-                series.append({
+            series = [
+                {
                     "time": str(d.date()),
                     "left_value": int(l_val),
                     "right_value": int(r_val)
-                })
+                }
+                for d, l_val, r_val in zip(left.index, left.to_numpy(), right.to_numpy())
+            ]
 
         return {
             "left_metric": left_metric,
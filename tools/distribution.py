@@ -3,10 +3,11 @@ from __future__ import annotations
 from typing import Any, Dict, List, Optional
 import pandas as pd
 import numpy as np
-import re
 
 from tools.base import BaseTool
-from runtime.context import DataManager
+from runtime.context import NUMERIC_METRICS, DataManager
+from runtime.sketch import ValueHistogram, binned_shares
+from runtime.kernels import grouped_box_stats
 
 class DistributionTool(BaseTool):
     name = "distribution"
@@ -22,55 +23,45 @@ class DistributionTool(BaseTool):
         group_by = params.get("group_by") # For boxplot
         if not dimension and group_by:
              dimension = group_by # normalize
+        # Multi-dimension structural shift: every listed dimension in one call
+        dimensions = [d for d in (params.get("dimensions") or []) if d]
+        if dimensions and dimension and dimension not in dimensions:
+            dimensions = [dimension] + dimensions
+        if dimensions and not dimension:
+            dimension = dimensions[0]
 
         bins_param = params.get("bins", 30)
         date_range = params.get("date_range")
         compare_date_range = params.get("compare_date_range")
         return_buckets = params.get("return_buckets", True)
         
+        dm = DataManager()
+
+        # Lead-time metrics come from the duration registry (day counts cached per data
+        # snapshot) and are dated by the event that ends the duration.
+        duration = dm.resolve_duration(metric)
+        durations = dm.duration_values(*duration) if duration else None
+        use_assign = 'assign' in str(metric) and duration is None
+
         # Determine time column
         time_col = 'order_create_date'
-        if 'lock' in str(metric) or 'lock_time' in str(metric):
+        if duration:
+            time_col = duration[1]
+        elif 'lock' in str(metric) or 'lock_time' in str(metric):
             time_col = 'lock_time'
-        if 'assign' in str(metric): # Handle assign data if needed, though mostly sales
+        if use_assign: # Handle assign data if needed, though mostly sales
              time_col = 'assign_date'
 
-        dm = DataManager()
-        
-        # Helper to parse dates robustly including Chinese format
-        def parse_dates(series: pd.Series) -> pd.Series:
-            if series.empty:
-                return pd.to_datetime(series)
-            parsed = pd.to_datetime(series, errors='coerce')
-            if parsed.isna().all() and series.dtype == 'object':
-                try:
-                    cleaned = series.astype(str).str.replace('年', '-').str.replace('月', '-').str.replace('日', '')
-                    parsed = pd.to_datetime(cleaned, errors='coerce')
-                except Exception:
-                    pass
-            if parsed.isna().any() and series.dtype == 'object':
-                 mask = parsed.isna()
-                 try:
-                     cleaned = series[mask].astype(str).str.replace('年', '-').str.replace('月', '-').str.replace('日', '')
-                     parsed.loc[mask] = pd.to_datetime(cleaned, errors='coerce')
-                 except Exception:
-                     pass
-            return parsed
-
         # Helper to get series
         def get_metric_series(df: pd.DataFrame, metric_expr: str) -> pd.Series:
             if not isinstance(metric_expr, str):
                 return pd.Series()
             
-            # 1. Datediff pattern
-            match = re.search(r"datediff\('day',\s*([a-zA-Z0-9_]+),\s*([a-zA-Z0-9_]+)\)", metric_expr)
-            if match:
-                start_col, end_col = match.groups()
-                if start_col in df.columns and end_col in df.columns:
-                    s = parse_dates(df[start_col])
-                    e = parse_dates(df[end_col])
-                    diff = (e - s).dt.days
-                    return diff.dropna()
+            # 1. Duration metrics (registry name or datediff expression)
+            if duration:
+                if durations is not None:
+                    return durations.reindex(df.index).dropna().astype("int32")
+                return pd.Series(dtype="int32")
             
             # 2. Conversion Rates (Assign Data) - Pre-calculated columns? No, need to calc on the fly or assume exist.
             # But wait, assign data is usually daily aggregated.
@@ -104,12 +95,6 @@ class DistributionTool(BaseTool):
                 return pd.to_numeric(df[metric_expr], errors='coerce').dropna()
             return pd.Series()
 
-        # Get data
-        if 'assign' in str(metric):
-             df_primary = dm.filter_assign_data(date_range)
-        else:
-             df_primary = dm.filter_data(date_range, time_col=time_col)
-
         result = {
             "metric": metric,
             "dimension": dimension,
@@ -117,22 +102,42 @@ class DistributionTool(BaseTool):
             "signals": []
         }
 
+        # Duration and registered numeric metrics are answered from per-day histograms
+        # when both ranges resolve to plain date bounds, instead of rescanning the raw rows.
+        # (Numeric ones need a date range: without one the raw path also counts undated rows.)
+        numeric = not duration and not use_assign and date_range and isinstance(metric, str) and metric in NUMERIC_METRICS
+        if (duration or numeric) and tool_name != "boxplot" and not dimension:
+            sketch = dm.get_duration_histogram(*duration) if duration else dm.get_value_histogram(metric, time_col)
+            bounds = dm.resolve_date_bounds(date_range) if date_range else (None, None)
+            compare_bounds = dm.resolve_date_bounds(compare_date_range) if compare_date_range else None
+            if sketch is not None and bounds is not None and (not compare_date_range or compare_bounds is not None):
+                rows = dm.get_cube(time_col).total(*bounds) if date_range else len(dm.get_data())
+                if rows == 0:
+                    result["signals"].append(self._insufficient_signal(metric, date_range))
+                    return result
+                hist_primary = sketch.window(*bounds)
+                if hist_primary.empty:
+                    return result
+                hist_compare = sketch.window(*compare_bounds) if compare_bounds else None
+                return self._histogram_result(
+                    result, metric, hist_primary, hist_compare, bins_param, compare_date_range, return_buckets
+                )
+
+        # Get data
+        if use_assign:
+             df_primary = dm.filter_assign_data(date_range)
+        else:
+             df_primary = dm.filter_data(date_range, time_col=time_col)
+
         if df_primary.empty:
-             result["signals"].append({
-                "type": "data_quality_signal",
-                "status": "warning",
-                "message": f"Insufficient data to calculate distribution for {metric} in {date_range}. (Sample size: 0)"
-            })
+             result["signals"].append(self._insufficient_signal(metric, date_range))
              return result
 
         # --- Boxplot Logic ---
         if tool_name == "boxplot":
-            if not dimension:
-                # If no dimension, just one box
-                dimension = "all"
-                df_primary["all"] = "All"
-            
-            if dimension not in df_primary.columns:
+            # df_primary may be the shared dataset itself, so nothing is written into it:
+            # group codes and values are extracted as arrays and reduced by a kernel.
+            if dimension and dimension not in df_primary.columns:
                  result["signals"].append({
                     "type": "error",
                     "status": "failed",
@@ -140,9 +145,6 @@ class DistributionTool(BaseTool):
                 })
                  return result
 
-            # We need the numeric metric column. 
-            # get_metric_series extracts it, but we need it aligned with the dataframe to group by dimension.
-            # So we add it as a column.
             metric_series = get_metric_series(df_primary, metric)
             if metric_series.empty:
                  result["signals"].append({
@@ -151,106 +153,109 @@ class DistributionTool(BaseTool):
                     "message": f"Could not calculate metric {metric}."
                 })
                  return result
-            
-            # Align indices
-            df_primary = df_primary.loc[metric_series.index]
-            df_primary["_metric_value"] = metric_series
-            
-            # Group by dimension and calc stats
-            stats = df_primary.groupby(dimension)["_metric_value"].describe(percentiles=[0.25, 0.5, 0.75])
-            
+
+            if dimension:
+                codes, groups = pd.factorize(df_primary.loc[metric_series.index, dimension], sort=True)
+            else:
+                # If no dimension, just one box
+                codes, groups = np.zeros(len(metric_series), dtype=np.int64), np.array(["All"])
+
+            stats = grouped_box_stats(
+                codes,
+                pd.to_numeric(metric_series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan),
+                len(groups),
+                max_per_group=params.get("max_samples_per_group"),
+            )
+
             boxplot_data = []
-            for name, row in stats.iterrows():
-                boxplot_data.append({
+            for k, name in enumerate(groups):
+                if stats["count"][k] == 0:
+                    continue
+                row = {
                     "group": str(name),
-                    "min": row["min"],
-                    "q1": row["25%"],
-                    "median": row["50%"],
-                    "q3": row["75%"],
-                    "max": row["max"],
-                    "count": row["count"],
-                    "mean": row["mean"]
-                })
+                    "min": float(stats["min"][k]),
+                    "q1": float(stats["q1"][k]),
+                    "median": float(stats["median"][k]),
+                    "q3": float(stats["q3"][k]),
+                    "max": float(stats["max"][k]),
+                    "count": float(stats["count"][k]),
+                    "mean": float(stats["mean"][k])
+                }
+                if stats["sample_size"][k] < stats["count"][k]:
+                    row["sample_size"] = int(stats["sample_size"][k])
+                boxplot_data.append(row)
             
             result["boxplot"] = boxplot_data
             return result
 
         # --- Categorical Distribution (if dimension is provided) ---
         if dimension:
-            if dimension not in df_primary.columns:
+            dims = dimensions or [dimension]
+            missing = [d for d in dims if d not in df_primary.columns]
+            if dimension in missing:
                  result["signals"].append({
                     "type": "error",
                     "status": "failed",
                     "message": f"Dimension {dimension} not found in data."
                 })
                  return result
-            
-            # Calculate primary distribution (PMF)
-            primary_counts = df_primary[dimension].value_counts(normalize=True)
-            primary_total = len(df_primary)
-            
+            dims = [d for d in dims if d not in missing]
+
+            # Calculate primary distribution (PMF): one grouped count table per range,
+            # marginalized per dimension
+            primary_counts = self._dimension_counts(df_primary, dims)
+
             # Comparison
-            compare_counts = pd.Series(dtype=float)
+            compare_counts = {}
             if compare_date_range:
-                if 'assign' in str(metric):
+                if use_assign:
                      df_compare = dm.filter_assign_data(compare_date_range)
                 else:
                      df_compare = dm.filter_data(compare_date_range, time_col=time_col)
                 
-                if not df_compare.empty and dimension in df_compare.columns:
-                    compare_counts = df_compare[dimension].value_counts(normalize=True)
-            
-            # Align categories
-            all_cats = set(primary_counts.index) | set(compare_counts.index)
-            # Sort categories (by primary value descending, then name)
-            sorted_cats = sorted(list(all_cats), key=lambda x: (-primary_counts.get(x, 0), x))
-            
-            dist_data = []
-            sad = 0.0 # Sum of Absolute Differences
-            
-            # Limit to top N categories to avoid huge payload, but keep tail sum?
-            # User wants analysis, usually top 20 is enough.
-            # But for SAD calculation we need all.
-            
-            for cat in sorted_cats:
-                p = float(primary_counts.get(cat, 0))
-                c = float(compare_counts.get(cat, 0))
-                diff = p - c
-                sad += abs(diff)
-                
-                # Only include in output if significant or top ranked
-                # Let's return top 20 + others
-                dist_data.append({
-                    "category": str(cat),
-                    "primary_pct": p,
-                    "compare_pct": c,
-                    "diff_pct": diff
-                })
-            
-            # Trim result for display if too long (keep top 30)
-            final_dist_data = dist_data[:30]
-            if len(dist_data) > 30:
-                # Aggregate rest? Or just truncate. Truncate for now.
-                pass
+                present = [d for d in dims if d in df_compare.columns]
+                if not df_compare.empty and present:
+                    compare_counts = self._dimension_counts(df_compare, present)
 
-            result["distribution"] = final_dist_data
-            
-            if not compare_counts.empty:
-                threshold = 0.2 # 20% total shift is significant
-                is_abnormal = sad > threshold
+            shifts = {}
+            for dim in dims:
+                shift = self._categorical_shift(primary_counts[dim], compare_counts.get(dim))
+                shifts[dim] = shift
+                if shift["has_compare"]:
+                    threshold = 0.2 # 20% total shift is significant
+                    sad = shift["distance"]
+                    is_abnormal = sad > threshold
+                    result["signals"].append({
+                        "type": "distribution_signal",
+                        "metric": metric,
+                        "dimension": dim,
+                        "status": "abnormal" if is_abnormal else "normal",
+                        "score": sad,
+                        "message": f"Structural shift score {sad:.2f} ({'Abnormal' if is_abnormal else 'Normal'})"
+                    })
+
+            # Legacy single-dimension fields describe the primary dimension
+            head = shifts[dimension]
+            result["distribution"] = head["distribution"]
+            if head["has_compare"]:
                 result["comparison"] = {
                     "compare_date_range": compare_date_range,
-                    "distance": sad,
-                    "threshold": threshold
+                    "distance": head["distance"],
+                    "threshold": 0.2
                 }
-                result["signals"].append({
-                    "type": "distribution_signal",
-                    "metric": metric,
-                    "dimension": dimension,
-                    "status": "abnormal" if is_abnormal else "normal",
-                    "score": sad,
-                    "message": f"Structural shift score {sad:.2f} ({'Abnormal' if is_abnormal else 'Normal'})"
-                })
+
+            if dimensions:
+                result["dimensions"] = {
+                    dim: {
+                        "distribution": shift["distribution"],
+                        "distance": shift["distance"],
+                        "js_divergence": shift["js_divergence"],
+                        "top_movers": shift["top_movers"],
+                    } if shift["has_compare"] else {"distribution": shift["distribution"]}
+                    for dim, shift in shifts.items()
+                }
+                if missing:
+                    result["missing_dimensions"] = missing
             
             return result
 
@@ -259,38 +264,89 @@ class DistributionTool(BaseTool):
         if series_primary.empty:
              return result
 
-        series_compare = pd.Series(dtype=float)
+        hist_compare = None
         if compare_date_range:
-            if 'assign' in str(metric):
+            if use_assign:
                  df_compare = dm.filter_assign_data(compare_date_range)
             else:
                  df_compare = dm.filter_data(compare_date_range, time_col=time_col)
-            series_compare = get_metric_series(df_compare, metric)
+            hist_compare = ValueHistogram.from_series(get_metric_series(df_compare, metric))
 
-        combined = series_primary
-        if not series_compare.empty:
-            combined = pd.concat([series_primary, series_compare])
-            
-        if combined.empty:
-             return result
+        return self._histogram_result(
+            result, metric, ValueHistogram.from_series(series_primary), hist_compare,
+            bins_param, compare_date_range, return_buckets
+        )
 
-        upper_bound = np.percentile(combined, 99)
-        if upper_bound == combined.min():
-            upper_bound = combined.max()
-        
-        hist_range = (combined.min(), upper_bound)
-        combined_clipped = np.clip(combined, hist_range[0], hist_range[1])
-        hist_values, bin_edges = np.histogram(combined_clipped, bins=bins_param, range=hist_range)
-        
-        def calc_dist(series, edges, clip_max):
-            series_clipped = np.clip(series, edges[0], clip_max)
-            counts, _ = np.histogram(series_clipped, bins=edges)
-            total = len(series)
-            if total == 0:
-                return [0.0] * len(counts)
-            return [float(c)/total for c in counts]
-
-        dist_primary = calc_dist(series_primary, bin_edges, upper_bound)
+    @staticmethod
+    def _dimension_counts(df: pd.DataFrame, dims: List[str]) -> Dict[str, pd.Series]:
+        """Category counts per dimension, marginalized from one grouped count table (nulls excluded)."""
+        if len(dims) == 1:
+            return {dims[0]: df[dims[0]].value_counts()}
+        table = df.groupby(dims, dropna=False, observed=True).size()
+        return {
+            dim: table.groupby(level=dim, dropna=True, observed=True).sum()
+            for dim in dims
+        }
+
+    @staticmethod
+    def _categorical_shift(primary: pd.Series, compare: Optional[pd.Series], limit: int = 30, movers: int = 5) -> Dict[str, Any]:
+        """Aligned PMFs for one dimension with SAD, Jensen-Shannon divergence and top movers."""
+        has_compare = compare is not None and compare.sum() > 0
+        frame = pd.DataFrame({
+            "p": primary / primary.sum() if primary.sum() > 0 else primary.astype(float),
+            "c": compare / compare.sum() if has_compare else pd.Series(dtype=float),
+        }).fillna(0.0)
+        frame.index = frame.index.rename("category")
+        # Sort categories (by primary value descending, then name)
+        frame = frame.reset_index().sort_values(["p", "category"], ascending=[False, True], kind="stable")
+        frame["diff"] = frame["p"] - frame["c"]
+
+        rows = [
+            {"category": str(cat), "primary_pct": float(p), "compare_pct": float(c), "diff_pct": float(d)}
+            for cat, p, c, d in zip(frame["category"], frame["p"], frame["c"], frame["diff"])
+        ]
+        shift = {
+            # Trim result for display if too long (keep top 30)
+            "distribution": rows[:limit],
+            "has_compare": bool(has_compare),
+        }
+        if has_compare:
+            p = frame["p"].to_numpy()
+            c = frame["c"].to_numpy()
+            m = (p + c) / 2
+            with np.errstate(divide="ignore", invalid="ignore"):
+                kl_p = np.where(p > 0, p * np.log2(p / m), 0.0).sum()
+                kl_c = np.where(c > 0, c * np.log2(c / m), 0.0).sum()
+            order = np.argsort(-np.abs(frame["diff"].to_numpy()), kind="stable")[:movers]
+            shift["distance"] = float(np.abs(frame["diff"].to_numpy()).sum())
+            shift["js_divergence"] = float(0.5 * kl_p + 0.5 * kl_c)
+            shift["top_movers"] = [rows[k] for k in order]
+        return shift
+
+    @staticmethod
+    def _insufficient_signal(metric: Any, date_range: Any) -> Dict[str, Any]:
+        return {
+            "type": "data_quality_signal",
+            "status": "warning",
+            "message": f"Insufficient data to calculate distribution for {metric} in {date_range}. (Sample size: 0)"
+        }
+
+    def _histogram_result(
+        self,
+        result: Dict[str, Any],
+        metric: Any,
+        hist_primary: ValueHistogram,
+        hist_compare: Optional[ValueHistogram],
+        bins_param: Any,
+        compare_date_range: Any,
+        return_buckets: bool,
+    ) -> Dict[str, Any]:
+        """Binned distribution, comparison score and position stats from value histograms."""
+        if hist_compare is not None and hist_compare.empty:
+            hist_compare = None
+
+        bin_edges, upper_bound, shares_primary, shares_compare = binned_shares(hist_primary, hist_compare, bins_param)
+        dist_primary = [float(v) for v in shares_primary]
         
         bins_data = []
         for i in range(len(bin_edges)-1):
@@ -302,8 +358,8 @@ class DistributionTool(BaseTool):
                 "compare_pct": 0.0
             })
             
-        if not series_compare.empty:
-            dist_compare = calc_dist(series_compare, bin_edges, upper_bound)
+        if hist_compare is not None:
+            dist_compare = [float(v) for v in shares_compare]
             for i, d in enumerate(bins_data):
                 d["compare_pct"] = dist_compare[i]
             
@@ -324,31 +380,29 @@ class DistributionTool(BaseTool):
             })
 
             # Calculate Position Statistics (New)
-            if not series_primary.empty:
-                current_mean = series_primary.mean()
-                # Percentile
-                comp_values = series_compare.values
-                percentile = (comp_values < current_mean).mean() * 100
-                
-                # Z-Score
-                mean_hist = series_compare.mean()
-                std_hist = series_compare.std()
-                z_score = 0.0
-                if std_hist > 1e-9:
-                    z_score = (current_mean - mean_hist) / std_hist
-                
-                result["position"] = {
-                    "current_value": float(current_mean),
-                    "historical_mean": float(mean_hist),
-                    "historical_std": float(std_hist),
-                    "percentile": float(percentile),
-                    "z_score": float(z_score),
-                    "rank_desc": f"P{percentile:.1f}"
-                }
-                
-                # Update signal message
-                if result["signals"]:
-                    result["signals"][-1]["message"] += f" | Position: P{percentile:.1f} (Z={z_score:.2f})"
+            current_mean = hist_primary.mean()
+            # Percentile
+            percentile = hist_compare.share_below(current_mean) * 100
+            
+            # Z-Score
+            mean_hist = hist_compare.mean()
+            std_hist = hist_compare.std()
+            z_score = 0.0
+            if std_hist > 1e-9:
+                z_score = (current_mean - mean_hist) / std_hist
+            
+            result["position"] = {
+                "current_value": float(current_mean),
+                "historical_mean": float(mean_hist),
+                "historical_std": float(std_hist),
+                "percentile": float(percentile),
+                "z_score": float(z_score),
+                "rank_desc": f"P{percentile:.1f}"
+            }
+            
+            # Update signal message
+            if result["signals"]:
+                result["signals"][-1]["message"] += f" | Position: P{percentile:.1f} (Z={z_score:.2f})"
 
         if return_buckets:
             result["bins"] = bins_data
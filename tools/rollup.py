@@ -1,10 +1,27 @@
 import json
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+import numpy as np
 import pandas as pd
 
 from tools.base import BaseTool
 from runtime.context import DataManager
+from runtime.kernels import top_n_indices
+
+
+def _select_top_n(grouped: pd.Series, n_limit: Optional[int], ascending: bool) -> pd.Series:
+    """Top-N of an aggregated series via partial selection instead of a full sort."""
+    if not n_limit:
+        return grouped.sort_values(ascending=ascending)
+    idx = top_n_indices(grouped.to_numpy(), int(n_limit), ascending=ascending)
+    return grouped.iloc[idx]
+
+
+def _others_row(group_fields: List[str], value: float, total_val: float) -> Dict[str, Any]:
+    row: Dict[str, Any] = {g: "Others" for g in group_fields}
+    row["value"] = value
+    row["percent"] = float(value / total_val) if total_val > 0 else 0.0
+    return row
 
 
 class RollupTool(BaseTool):
@@ -26,6 +43,7 @@ class RollupTool(BaseTool):
         # Top N specific params
         n_limit = params.get("n", 5)
         order = params.get("order", "desc")
+        include_others = bool(params.get("include_others", False))
 
         # Load business definition for age limits
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,6 +70,36 @@ class RollupTool(BaseTool):
         elif metric in ["小订数", "小订量"]:
             time_col = "intention_payment_time"
 
+        # Fast path: top_n of a count metric by a single dimension without row filters
+        # is answered from the cached daily cube, so no order rows are scanned or sorted.
+        if (
+            tool_name == "top_n"
+            and not filters
+            and not interval
+            and metric not in ["开票金额", "invoice_amount", "age", "年龄", "平均年龄"]
+        ):
+            if dimensions and isinstance(dimensions, list):
+                cube_dim = dimensions[0] if len(dimensions) == 1 else None
+            else:
+                cube_dim = dimension
+            bounds = dm.resolve_date_bounds(date_range)
+            if cube_dim and bounds is not None:
+                cube = dm.get_cube(time_col, str(cube_dim))
+                if cube is not None:
+                    rows, total_val = self._top_n_from_cube(
+                        cube, str(cube_dim), bounds, n_limit, order == "asc", include_others
+                    )
+                    return {
+                        "metric": metric,
+                        "dimension": dimension,
+                        "dimensions": dimensions,
+                        "date_range": date_range,
+                        "sample_size": total_val,
+                        "filters": filters,
+                        "rows": rows,
+                        "signals": [],
+                    }
+
         # Special handling for relative launch date:
         # We need to pre-filter by series to allow filter_data to resolve "launch_plus_Nd"
         # because filter_data needs to know WHICH series' launch date to use.
@@ -274,10 +322,7 @@ class RollupTool(BaseTool):
                      grouped = grouped.sort_index()
                 else:
                      if tool_name == "top_n":
-                         ascending = (order == "asc")
-                         grouped = grouped.sort_values(ascending=ascending)
-                         if n_limit:
-                             grouped = grouped.head(n_limit)
+                         grouped = _select_top_n(grouped, n_limit, order == "asc")
                      else:
                          grouped = grouped.sort_values(ascending=False)
                 
@@ -289,6 +334,10 @@ class RollupTool(BaseTool):
                     row["value"] = float(v)
                     row["percent"] = float(v / total_val) if total_val > 0 else 0.0
                     rows.append(row)
+                if tool_name == "top_n" and include_others and time_dim not in valid_group_fields:
+                    rest = float(total_val - grouped.sum())
+                    if rest > 0:
+                        rows.append(_others_row(valid_group_fields, rest, total_val))
             elif metric in ["age", "年龄", "平均年龄"] and "age" in df.columns:
                 age_num = pd.to_numeric(df["age"], errors="coerce")
                 grouped = age_num.groupby([df[g] for g in valid_group_fields], observed=True).mean()
@@ -300,10 +349,7 @@ class RollupTool(BaseTool):
                      grouped = grouped.sort_index()
                 else:
                      if tool_name == "top_n":
-                         ascending = (order == "asc")
-                         grouped = grouped.sort_values(ascending=ascending)
-                         if n_limit:
-                             grouped = grouped.head(n_limit)
+                         grouped = _select_top_n(grouped, n_limit, order == "asc")
                      else:
                          grouped = grouped.sort_values(ascending=False)
 
@@ -325,10 +371,7 @@ class RollupTool(BaseTool):
                      grouped = grouped.sort_index()
                 else:
                      if tool_name == "top_n":
-                         ascending = (order == "asc")
-                         grouped = grouped.sort_values(ascending=ascending)
-                         if n_limit:
-                             grouped = grouped.head(n_limit)
+                         grouped = _select_top_n(grouped, n_limit, order == "asc")
                      else:
                          grouped = grouped.sort_values(ascending=False)
 
@@ -340,6 +383,10 @@ class RollupTool(BaseTool):
                     row["value"] = int(v)
                     row["percent"] = float(v / total_val) if total_val > 0 else 0.0
                     rows.append(row)
+                if tool_name == "top_n" and include_others and time_dim not in valid_group_fields:
+                    rest = int(total_val - grouped.sum())
+                    if rest > 0:
+                        rows.append(_others_row(valid_group_fields, rest, total_val))
         else:
             # Fallback
             if metric in ["开票金额", "invoice_amount"] and "invoice_amount" in df.columns:
@@ -367,3 +414,29 @@ class RollupTool(BaseTool):
             "rows": rows,
             "signals": [],
         }
+
+    def _top_n_from_cube(self, cube, dimension: str, bounds, n_limit, ascending: bool, include_others: bool):
+        start, end = bounds
+        totals = cube.member_totals(start, end)
+        total_val = cube.total(start, end)
+        # Members with no rows in the window never appear in a groupby result
+        present = np.flatnonzero(totals > 0)
+        values = totals[present]
+        if n_limit:
+            picked = present[top_n_indices(values, int(n_limit), ascending=ascending)]
+        else:
+            picked = present[np.argsort(values if ascending else -values, kind="stable")]
+
+        rows: List[Dict[str, Any]] = []
+        for i in picked:
+            v = int(totals[i])
+            rows.append({
+                dimension: str(cube.members[i]),
+                "value": v,
+                "percent": float(v / total_val) if total_val > 0 else 0.0,
+            })
+        if include_others:
+            rest = int(total_val - sum(r["value"] for r in rows))
+            if rest > 0:
+                rows.append(_others_row([dimension], rest, total_val))
+        return rows, total_val